@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def aabb_intersect(mesh_1, mesh_2, min_distance):
     """
     Checks if two Mesh object intersect.
@@ -50,4 +53,56 @@ def aabb_intersect_vertex(mesh, vertex, min_distance):
             if abs(mesh.aabb.pos[2] - vertex[2]) < (
                 (mesh.aabb.half_size[2]) + min_distance):
                 return True
-    return False
\ No newline at end of file
+    return False
+
+
+def aabb_intersect_vertices(pos, half_size, vertices, min_distance):
+    """
+    Checks which vertices intersect with one or many AABBs in 3D space. It is
+    the batch version of aabb_intersect_vertex and gives the same results.
+
+    Args:
+        pos(numpy.ndarray): [x,y,z] position of one AABB or (M, 3) positions
+            of M AABBs.
+        half_size(numpy.ndarray): [x,y,z] half size of one AABB or (M, 3)
+            half sizes of M AABBs.
+        vertices(numpy.ndarray): (N, 3) array of vertices.
+        min_distance(float): minimum distance (no units) that has to be
+            between the AABB and the vertex.
+
+    Returns:
+        (N,) bool mask for one AABB or (N, M) bool matrix for M AABBs. True
+            if the vertex intersects with the AABB.
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    half_size = np.asarray(half_size, dtype=np.float64)
+    vertices = np.asarray(vertices).reshape(-1, 3)
+    if pos.ndim == 1:
+        return np.all(
+            np.abs(pos - vertices) < (half_size + min_distance), axis=1)
+    return np.all(np.abs(pos[np.newaxis, :, :] - vertices[:, np.newaxis, :]) <
+                  (half_size + min_distance)[np.newaxis, :, :],
+                  axis=2)
+
+
+def aabb_intersect_matrix(pos, half_size, min_distance):
+    """
+    Checks all pairs of AABBs for intersection. It is the batch version of
+    aabb_intersect and gives the same results.
+
+    Args:
+        pos(numpy.ndarray): (M, 3) positions of the AABBs.
+        half_size(numpy.ndarray): (M, 3) half sizes of the AABBs.
+        min_distance(float): minimum distance (no units) that has to be
+            between the AABBs.
+
+    Returns:
+        (M, M) symmetric bool matrix. True if the AABBs intersect. The
+            diagonal is True.
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+    half_size = np.asarray(half_size, dtype=np.float64).reshape(-1, 3)
+    return np.all(np.abs(pos[:, np.newaxis, :] - pos[np.newaxis, :, :]) <
+                  (half_size[:, np.newaxis, :] + half_size[np.newaxis, :, :]) +
+                  min_distance,
+                  axis=2)
@@ -0,0 +1,120 @@
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+
+# Scenes with up to this many meshes are checked with one all-pairs matrix,
+# which is faster than sorting for small scenes.
+MATRIX_LIMIT = 256
+
+
+def aabb_arrays(meshes):
+    """
+    Collects positions and half sizes of AABBs of the meshes into arrays.
+
+    Args:
+        meshes(list): A list of Mesh objects.
+
+    Returns:
+        Tuple of (M, 3) positions and (M, 3) half sizes.
+    """
+    pos = np.array([mesh.aabb.pos for mesh in meshes],
+                   dtype=np.float64).reshape(-1, 3)
+    half_size = np.array([mesh.aabb.half_size for mesh in meshes],
+                         dtype=np.float64).reshape(-1, 3)
+    return pos, half_size
+
+
+def sweep_and_prune(pos, half_size, min_distance):
+    """
+    Finds all pairs of intersecting AABBs with sort and sweep. The AABBs are
+    inflated by min_distance and sorted along the axis with the largest
+    spread. Only AABBs whose intervals overlap on that axis are candidates
+    and the candidates are then checked on all three axes with the same test
+    as aabb_collision.aabb_intersect.
+
+    Args:
+        pos(numpy.ndarray): (M, 3) positions of the AABBs.
+        half_size(numpy.ndarray): (M, 3) half sizes of the AABBs.
+        min_distance(float): minimum distance (no units) that has to be
+            between the AABBs.
+
+    Returns:
+        (P, 2) int array of index pairs (i, j) with i < j. Each intersecting
+            pair is listed once, sorted by i and then by j.
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+    half_size = np.asarray(half_size, dtype=np.float64).reshape(-1, 3)
+    if len(pos) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # sweep along the axis where the AABBs are spread the most
+    axis = int(np.argmax(pos.var(axis=0)))
+    lower = pos[:, axis] - half_size[:, axis] - min_distance / 2
+    upper = pos[:, axis] + half_size[:, axis] + min_distance / 2
+    order = np.argsort(lower, kind='stable')
+    sorted_lower = lower[order]
+    # a small slack, so rounding of the inflated intervals never drops
+    # a pair that the exact test accepts
+    slack = 1e-9 * max(1.0, float(np.abs(sorted_lower).max()))
+    # AABBs after the i-th one in the sorted order that start before the
+    # i-th one ends
+    ends = np.searchsorted(sorted_lower, upper[order] + slack, side='left')
+    starts = np.arange(1, len(order) + 1)
+    counts = np.maximum(ends - starts, 0)
+    first = np.repeat(order, counts)
+    # indices into the sorted order for all candidate partners
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    second = order[np.arange(counts.sum()) + offsets]
+
+    # exact test on all three axes
+    hit = np.all(np.abs(pos[first] - pos[second]) <
+                 (half_size[first] + half_size[second]) + min_distance,
+                 axis=1)
+    pairs = np.stack([first[hit], second[hit]], axis=1)
+    pairs.sort(axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def find_pairs(pos, half_size, min_distance):
+    """
+    Finds all pairs of intersecting AABBs. Small scenes are checked with
+    aabb_collision.aabb_intersect_matrix, bigger ones with sweep_and_prune.
+
+    Args:
+        pos(numpy.ndarray): (M, 3) positions of the AABBs.
+        half_size(numpy.ndarray): (M, 3) half sizes of the AABBs.
+        min_distance(float): minimum distance (no units) that has to be
+            between the AABBs.
+
+    Returns:
+        (P, 2) int array of index pairs (i, j) with i < j, sorted by i and
+            then by j.
+    """
+    if len(pos) > MATRIX_LIMIT:
+        return sweep_and_prune(pos, half_size, min_distance)
+    matrix = aabb_col.aabb_intersect_matrix(pos, half_size, min_distance)
+    return np.argwhere(np.triu(matrix, k=1))
+
+
+def find_neighbours(meshes, min_distance):
+    """
+    Finds neighbours of each mesh, that is meshes which AABBs intersect with
+    AABB of the mesh inflated by min_distance.
+
+    Args:
+        meshes(list): A list of Mesh objects.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+
+    Returns:
+        A list where the i-th item is a sorted list of indices of neighbours
+            of the i-th mesh.
+    """
+    pos, half_size = aabb_arrays(meshes)
+    neighbours = [[] for _ in meshes]
+    for i, j in find_pairs(pos, half_size, min_distance).tolist():
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    for mesh_neighbours in neighbours:
+        mesh_neighbours.sort()
+    return neighbours
@@ -0,0 +1,164 @@
+import numpy as np
+
+# Number of triangles in one leaf of the BVH.
+LEAF_SIZE = 8
+# Number of bits per axis of the Morton codes.
+MORTON_BITS = 10
+
+
+class BVH:
+    """
+    BVH is a bounding volume hierarchy of AABBs over the triangles of one
+    mesh. Triangles are sorted along a Morton curve, consecutive runs of
+    LEAF_SIZE triangles form the leaves and each level above merges pairs of
+    nodes of the level below, so the tree is a set of flat arrays and pairs of
+    trees are traversed level by level with NumPy.
+
+    Attributes:
+        triangles(numpy.ndarray): (N, 3, 3) triangles in the order of the
+            leaves.
+        order(numpy.ndarray): (N,) index of each triangle in the mesh.
+        tri_lower(numpy.ndarray): (N, 3) lowest corners of the triangles.
+        tri_upper(numpy.ndarray): (N, 3) highest corners of the triangles.
+        levels(list): A list of (lower, upper) pairs of (K, 3) arrays. The
+            first item are the leaves and the last one is the root.
+        leaf_size(int): Number of triangles in one leaf.
+    """
+
+    def __init__(self, triangles, leaf_size=LEAF_SIZE):
+        """
+        Init BVH
+
+        Args:
+            triangles(numpy.ndarray): (N, 3, 3) array of triangles.
+            leaf_size(int): Optional. Number of triangles in one leaf.
+                Default 8.
+        """
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        self.leaf_size = max(1, int(leaf_size))
+        self.order = morton_order(triangles.mean(axis=1))
+        self.triangles = triangles[self.order]
+        self.tri_lower = self.triangles.min(axis=1)
+        self.tri_upper = self.triangles.max(axis=1)
+        self.levels = []
+        if len(self.triangles) == 0:
+            return
+        starts = np.arange(0, len(self.triangles), self.leaf_size)
+        lower = np.minimum.reduceat(self.tri_lower, starts)
+        upper = np.maximum.reduceat(self.tri_upper, starts)
+        self.levels.append((lower, upper))
+        while len(lower) > 1:
+            starts = np.arange(0, len(lower), 2)
+            lower = np.minimum.reduceat(lower, starts)
+            upper = np.maximum.reduceat(upper, starts)
+            self.levels.append((lower, upper))
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def leaf_triangles(self, leaves):
+        """
+        Returns the range of triangles of each leaf.
+
+        Args:
+            leaves(numpy.ndarray): Indices of leaves.
+
+        Returns:
+            Tuple of start and stop arrays of indices into triangles.
+        """
+        starts = leaves * self.leaf_size
+        return starts, np.minimum(starts + self.leaf_size, len(self))
+
+
+def morton_order(points):
+    """
+    Returns the order of the points along a Morton (Z-order) curve, so points
+    close in the order are close in space.
+
+    Args:
+        points(numpy.ndarray): (N, 3) array of points.
+
+    Returns:
+        (N,) array of indices into points.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64)
+    lower = points.min(axis=0)
+    extent = points.max(axis=0) - lower
+    extent[extent == 0] = 1.0
+    cells = ((points - lower) / extent * ((1 << MORTON_BITS) - 1)).astype(
+        np.int64)
+    codes = np.zeros(len(points), dtype=np.int64)
+    for bit in range(MORTON_BITS):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return np.argsort(codes, kind='stable')
+
+
+def _overlap(lower_a, upper_a, lower_b, upper_b):
+    return np.all((lower_a <= upper_b) & (lower_b <= upper_a), axis=1)
+
+
+def candidate_pairs(bvh_a, bvh_b):
+    """
+    Traverses two BVHs together and returns pairs of triangles which AABBs
+    overlap. Touching AABBs overlap, so triangles in contact are not lost.
+
+    Args:
+        bvh_a(BVH): BVH of the first mesh.
+        bvh_b(BVH): BVH of the second mesh.
+
+    Returns:
+        (P, 2) array of index pairs into bvh_a.triangles and
+            bvh_b.triangles.
+    """
+    if len(bvh_a) == 0 or len(bvh_b) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    level_a = len(bvh_a.levels) - 1
+    level_b = len(bvh_b.levels) - 1
+    nodes_a = np.zeros(1, dtype=np.int64)
+    nodes_b = np.zeros(1, dtype=np.int64)
+    while True:
+        lower_a, upper_a = bvh_a.levels[level_a]
+        lower_b, upper_b = bvh_b.levels[level_b]
+        keep = _overlap(lower_a[nodes_a], upper_a[nodes_a], lower_b[nodes_b],
+                        upper_b[nodes_b])
+        nodes_a = nodes_a[keep]
+        nodes_b = nodes_b[keep]
+        if len(nodes_a) == 0 or (level_a == 0 and level_b == 0):
+            break
+        # descend the tree that is deeper, both if they are at the same level
+        descend_a = level_a >= level_b and level_a > 0
+        descend_b = level_b >= level_a and level_b > 0
+        if descend_a:
+            level_a -= 1
+            nodes_a, nodes_b = _children(nodes_a, nodes_b,
+                                         len(bvh_a.levels[level_a][0]))
+        if descend_b:
+            level_b -= 1
+            nodes_b, nodes_a = _children(nodes_b, nodes_a,
+                                         len(bvh_b.levels[level_b][0]))
+
+    # all pairs of triangles of the overlapping leaves
+    starts_a, stops_a = bvh_a.leaf_triangles(nodes_a)
+    starts_b, stops_b = bvh_b.leaf_triangles(nodes_b)
+    counts_b = stops_b - starts_b
+    counts = (stops_a - starts_a) * counts_b
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    within = np.arange(counts.sum()) - offsets
+    repeated_b = np.repeat(counts_b, counts)
+    tris_a = np.repeat(starts_a, counts) + within // repeated_b
+    tris_b = np.repeat(starts_b, counts) + within % repeated_b
+    keep = _overlap(bvh_a.tri_lower[tris_a], bvh_a.tri_upper[tris_a],
+                    bvh_b.tri_lower[tris_b], bvh_b.tri_upper[tris_b])
+    return np.stack([tris_a[keep], tris_b[keep]], axis=1)
+
+
+def _children(nodes, others, n_children):
+    # each node has children 2 * i and 2 * i + 1, the last node of a level
+    # may have only one
+    children = np.stack([nodes * 2, nodes * 2 + 1], axis=1).reshape(-1)
+    others = np.repeat(others, 2)
+    valid = children < n_children
+    return children[valid], others[valid]
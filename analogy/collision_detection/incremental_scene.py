@@ -0,0 +1,254 @@
+import copy
+
+import numpy as np
+
+from analogy.collision_detection import broad_phase
+from analogy.collision_detection import scene_collision
+from analogy.collision_detection.spatial_hash import AABBHash
+from analogy.collision_detection.spatial_hash import default_cell_size
+
+
+class IncrementalScene:
+    """
+    IncrementalScene keeps the collision analysis of a scene up to date while
+    meshes are moved, added or removed one at a time. Contacts are stored for
+    each pair of meshes, so a change only recomputes the pairs of the changed
+    mesh and refreshes surfaces and collided sides of the meshes in those
+    pairs. AABBs of the meshes are kept in an AABBHash, so the neighbours of
+    the changed mesh are found without looking at all meshes. Results of all
+    other meshes are not touched.
+
+    Attributes:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object. It is a copy of the given scene.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        contact_mode(str): 'centroid' or 'exact', see
+            scene_collision.analyse_scene.
+        contacts(dict): Dict where the key is a (name, other name) tuple and
+            value is an array of indices of surfaces of the first mesh that
+            collide with the other mesh. Only pairs with contact are stored.
+    """
+
+    def __init__(self, scene, min_distance, contact_mode='centroid'):
+        """
+        Init IncrementalScene and analyses the whole scene. The scene is
+        copied first, so scenes shared with other code (for example the
+        scenes memoized by ScenePipeline.analyse) are not changed.
+
+        Args:
+            scene(dict): A dict of Mesh objects.
+            min_distance(float): minimum distance (no units) that has to be
+                between the meshes.
+            contact_mode(str): Optional. 'centroid' (default) or 'exact'.
+        """
+        if contact_mode not in scene_collision.CONTACT_MODES:
+            raise ValueError('contact_mode has to be one of ' +
+                             ', '.join(scene_collision.CONTACT_MODES) + '.')
+        self.scene = copy.deepcopy(scene)
+        self.min_distance = min_distance
+        self.contact_mode = contact_mode
+        self.contacts = {}
+        self._partners = {name: set() for name in self.scene}
+        self._flagged = {name: set() for name in self.scene}
+        self._bvhs = {}
+        _, half_sizes = broad_phase.aabb_arrays(self.scene.values())
+        self._aabbs = AABBHash(default_cell_size(half_sizes, min_distance))
+        for mesh in self.scene.values():
+            self._aabbs.insert(mesh.name, *aabb_bounds(mesh))
+
+        for mesh in self.scene.values():
+            scene_collision.clear_collisions(mesh)
+        self._add_contacts(
+            scene_collision.find_contacts(self.scene,
+                                          min_distance,
+                                          contact_mode,
+                                          bvhs=self._bvhs))
+        for mesh in self.scene.values():
+            self._refresh(mesh.name)
+        scene_collision.classify_collided_sides(self.scene)
+
+    def move_mesh(self, name, offset):
+        """
+        Moves the mesh and updates the analysis of the meshes it collided
+        with before or collides with now.
+
+        Args:
+            name(str): Name of the mesh.
+            offset(list): [x,y,z] translation of the mesh.
+
+        Returns:
+            A set of names of the meshes which analysis was updated.
+        """
+        mesh = self.scene[name]
+        offset = np.asarray(offset, dtype=np.float64).reshape(3)
+        translate_mesh(mesh, offset)
+        self._aabbs.insert(name, *aabb_bounds(mesh))
+        self._bvhs.pop(name, None)
+        return self._update(name)
+
+    def add_mesh(self, mesh):
+        """
+        Adds the mesh to the scene and updates the analysis of the meshes it
+        collides with. The mesh needs its AABB, colliders and closest
+        surfaces, as made by file_parsers.
+
+        Args:
+            mesh(Mesh): The new Mesh object.
+
+        Returns:
+            A set of names of the meshes which analysis was updated.
+        """
+        if mesh.name in self.scene:
+            raise ValueError('Mesh ' + mesh.name + ' is already in the scene.')
+        scene_collision.clear_collisions(mesh)
+        self.scene[mesh.name] = mesh
+        self._aabbs.insert(mesh.name, *aabb_bounds(mesh))
+        self._partners[mesh.name] = set()
+        self._flagged[mesh.name] = set()
+        return self._update(mesh.name)
+
+    def remove_mesh(self, name):
+        """
+        Removes the mesh from the scene and updates the analysis of the
+        meshes it collided with.
+
+        Args:
+            name(str): Name of the mesh.
+
+        Returns:
+            The removed Mesh object and a set of names of the meshes which
+                analysis was updated.
+        """
+        mesh = self.scene.pop(name)
+        self._aabbs.remove(name)
+        self._bvhs.pop(name, None)
+        updated = self._update(name)
+        del self._partners[name]
+        del self._flagged[name]
+        return mesh, updated
+
+    def neighbours(self, name):
+        """
+        Returns names of meshes which AABBs intersect AABB of the mesh
+        inflated by min_distance.
+
+        Args:
+            name(str): Name of the mesh.
+
+        Returns:
+            A sorted list of names of the neighbours.
+        """
+        mesh = self.scene[name]
+        pos = np.asarray(mesh.aabb.pos, dtype=np.float64)
+        half_size = np.asarray(mesh.aabb.half_size, dtype=np.float64)
+        reach = half_size + self.min_distance
+        # a small slack, so rounding never drops a neighbour that the exact
+        # test accepts
+        reach += 1e-9 * max(1.0, float(np.abs(pos).max() + reach.max()))
+        candidates = sorted(
+            self._aabbs.query(pos - reach, pos + reach) - {name})
+        if not candidates:
+            return []
+        other_pos, other_half_size = broad_phase.aabb_arrays(
+            [self.scene[other] for other in candidates])
+        # the same test as the broad phase
+        intersect = np.all(np.abs(other_pos - pos) <
+                           (other_half_size + half_size) + self.min_distance,
+                           axis=1)
+        return [
+            candidates[k] for k in np.flatnonzero(intersect).tolist()
+        ]
+
+    def _update(self, name):
+        # forget old contacts of the mesh and find the new ones
+        updated = {name} | self._partners[name]
+        for other in list(self._partners[name]):
+            self.contacts.pop((name, other), None)
+            self.contacts.pop((other, name), None)
+            self._partners[other].discard(name)
+        self._partners[name] = set()
+        if name in self.scene:
+            names = [name] + self.neighbours(name)
+            self._add_contacts(
+                scene_collision.find_contacts(
+                    {other: self.scene[other] for other in names},
+                    self.min_distance, self.contact_mode,
+                    [(0, k) for k in range(1, len(names))], self._bvhs))
+        updated |= self._partners[name]
+        updated = {other for other in updated if other in self.scene}
+        for other in updated:
+            self._refresh(other)
+        scene_collision.classify_collided_sides(
+            {other: self.scene[other] for other in updated})
+        return updated
+
+    def _add_contacts(self, contacts):
+        for (name, other), hits in contacts.items():
+            self.contacts[(name, other)] = hits
+            self._partners[name].add(other)
+            self._partners[other].add(name)
+
+    def _refresh(self, name):
+        # sets collision of the mesh and its surfaces from stored contacts
+        mesh = self.scene[name]
+        for k in self._flagged[name]:
+            surface = mesh.surfaces[k]
+            surface.collision = False
+            surface.collided_objects = {}
+        flagged = set()
+        mesh.collision = False
+        mesh.collided_objects = {}
+        for other in sorted(self._partners[name]):
+            hits = self.contacts.get((name, other))
+            if hits is None:
+                continue
+            mesh.collision = True
+            mesh.collided_objects[other] = True
+            for k in hits.tolist():
+                surface = mesh.surfaces[k]
+                surface.collided_objects[other] = True
+                surface.collision = True
+                flagged.add(k)
+        self._flagged[name] = flagged
+
+
+def translate_mesh(mesh, offset):
+    """
+    Moves vertices, colliders and AABB of the mesh.
+
+    Args:
+        mesh(Mesh): Mesh object.
+        offset(numpy.ndarray): [x,y,z] translation of the mesh.
+    """
+    if mesh.scene_arrays is not None:
+        scene_arrays = mesh.scene_arrays
+        scene_arrays.vertices[scene_arrays.vertex_range(mesh.index)] += offset
+        scene_arrays.colliders[scene_arrays.face_range(mesh.index)] += offset
+    else:
+        moved = set()
+        for surface in mesh.surfaces:
+            for vertex in surface.vertices:
+                # vertices can be shared by the surfaces
+                if id(vertex) not in moved:
+                    moved.add(id(vertex))
+                    vertex.pos = [p + o for p, o in zip(vertex.pos, offset)]
+            surface.collider = [
+                p + o for p, o in zip(surface.collider, offset)
+            ]
+    mesh.aabb.pos = [p + o for p, o in zip(mesh.aabb.pos, offset.tolist())]
+
+
+def aabb_bounds(mesh):
+    """
+    Returns the lowest and highest corner of AABB of the mesh.
+
+    Args:
+        mesh(Mesh): Mesh object.
+
+    Returns:
+        Tuple of (3,) lowest and (3,) highest corner.
+    """
+    pos = np.asarray(mesh.aabb.pos, dtype=np.float64)
+    half_size = np.asarray(mesh.aabb.half_size, dtype=np.float64)
+    return pos - half_size, pos + half_size
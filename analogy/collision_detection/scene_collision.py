@@ -0,0 +1,550 @@
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+from analogy.collision_detection import broad_phase
+from analogy.collision_detection.bvh import BVH
+from analogy.collision_detection.bvh import candidate_pairs
+from analogy.collision_detection.spatial_hash import SpatialHash
+from analogy.collision_detection.spatial_hash import default_cell_size
+
+# 'centroid' marks surfaces which colliders are close to AABB of another
+# mesh, 'exact' marks surfaces which triangles intersect triangles of another
+# mesh.
+CONTACT_MODES = ('centroid', 'exact')
+
+
+def detect_collisions(scene, min_distance):
+    """
+    Collision detection for each mesh in the scene. Surfaces which colliders
+    are closer than min_distance to AABB of another mesh are marked as
+    collided, together with their meshes, see collision_contacts.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+
+    Returns:
+        Dict where the key is a (name, other name) tuple and value is an
+            array of indices of surfaces of the first mesh that collide with
+            the other mesh.
+    """
+    contacts = collision_contacts(scene, min_distance)
+    mark_contacts(scene, contacts)
+    return contacts
+
+
+def collision_contacts(scene, min_distance, pairs=None):
+    """
+    Finds surfaces which colliders are closer than min_distance to AABB of
+    another mesh. Pairs of meshes to check are found by the broad phase
+    (sweep and prune), so each intersecting pair of AABBs is found once
+    instead of testing all pairs. Colliders of the meshes in the pairs are
+    put in a spatial hash once and each neighbour AABB only looks at the
+    colliders in the cells it overlaps. The scene is not changed.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        pairs(numpy.ndarray): Optional. (P, 2) pairs of indices of the
+            meshes in the scene to check. Default all pairs found by
+            broad_phase.find_pairs.
+
+    Returns:
+        Dict where the key is a (name, other name) tuple and value is a
+            sorted array of indices of surfaces of the first mesh that
+            collide with the other mesh. Only pairs with contact are listed.
+    """
+    meshes = list(scene.values())
+    pos, half_sizes = broad_phase.aabb_arrays(meshes)
+    if pairs is None:
+        pairs = broad_phase.find_pairs(pos, half_sizes, min_distance)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    contacts = {}
+    if len(pairs) == 0:
+        return contacts
+
+    neighbours = {}
+    for i, j in pairs.tolist():
+        if meshes[i].name == meshes[j].name:
+            continue
+        neighbours.setdefault(i, []).append(j)
+        neighbours.setdefault(j, []).append(i)
+    # colliders of all meshes in the pairs, one block per mesh
+    members = np.array(sorted(neighbours), dtype=np.int64)
+    colliders = [mesh_colliders(meshes[k]) for k in members.tolist()]
+    offsets = np.cumsum([0] + [len(block) for block in colliders])
+    colliders_hash = SpatialHash(
+        np.concatenate(colliders) if colliders else np.zeros((0, 3)),
+        default_cell_size(half_sizes[members], min_distance))
+    # position of each mesh of the scene in members
+    slots = np.full(len(meshes), -1)
+    slots[members] = np.arange(len(members))
+    for j, others in sorted(neighbours.items()):
+        reach = half_sizes[j] + min_distance
+        candidates = colliders_hash.query(pos[j] - reach, pos[j] + reach)
+        owners = np.searchsorted(offsets, candidates, side='right') - 1
+        # only colliders of meshes that are neighbours in the broad phase
+        is_neighbour = np.zeros(len(members), dtype=bool)
+        is_neighbour[slots[others]] = True
+        allowed = is_neighbour[owners]
+        candidates = candidates[allowed]
+        owners = owners[allowed]
+        intersect = aabb_col.aabb_intersect_vertices(
+            pos[j], half_sizes[j], colliders_hash.points[candidates],
+            min_distance)
+        for slot in np.unique(owners[intersect]).tolist():
+            hits = candidates[intersect & (owners == slot)] - offsets[slot]
+            contacts[(meshes[members[slot]].name, meshes[j].name)] = hits
+    return contacts
+
+
+def detect_contacts(scene, min_distance, threads=None):
+    """
+    Exact collision detection for each mesh in the scene. Surfaces which
+    triangles intersect a triangle of another mesh are marked as collided,
+    together with their meshes, see triangle_contacts.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) between meshes used
+            by the broad phase. Triangles are tested without it.
+        threads(int): Optional. Number of threads for the triangle tests.
+            Default triangle_col_detect.THREADS.
+
+    Returns:
+        Dict where the key is a (name, other name) tuple and value is an
+            array of indices of surfaces of the first mesh that collide with
+            the other mesh.
+    """
+    contacts = triangle_contacts(scene, min_distance, threads)
+    mark_contacts(scene, contacts)
+    return contacts
+
+
+def triangle_contacts(scene, min_distance, threads=None, pairs=None,
+                      bvhs=None):
+    """
+    Finds surfaces which triangles intersect a triangle of another mesh.
+    Pairs of meshes are found by the broad phase, pairs of triangles by the
+    traversal of the BVHs of both meshes, and only triangles with
+    overlapping AABBs are tested by the devillers algorithm. Triangle pairs
+    of all meshes are tested in one call, so the threads share the work of
+    the whole scene. The scene is not changed.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) between meshes used
+            by the broad phase. Triangles are tested without it.
+        threads(int): Optional. Number of threads for the triangle tests.
+            Default triangle_col_detect.THREADS.
+        pairs(numpy.ndarray): Optional. (P, 2) pairs of indices of the
+            meshes in the scene to check. Default all pairs found by
+            broad_phase.find_pairs.
+        bvhs(dict): Optional. Dict of BVHs by mesh name. BVHs are taken from
+            it and new ones are added to it.
+
+    Returns:
+        Dict where the key is a (name, other name) tuple and value is a
+            sorted array of indices of surfaces of the first mesh that
+            collide with the other mesh. Only pairs with contact are listed.
+    """
+    meshes = list(scene.values())
+    mesh_pairs, triangles, tri_offsets, mesh_bvhs, tri_pairs, groups = (
+        _contact_pairs(meshes, min_distance, pairs, bvhs))
+    contacts = {}
+    if len(mesh_pairs) == 0:
+        return contacts
+    # the C libraries are loaded on import, so only the exact mode needs them
+    from analogy.collision_detection import triangle_col_detect
+    intersect = triangle_col_detect.devillers_alg_batch(
+        triangles, triangles, tri_pairs, threads)
+    hits = tri_pairs[intersect]
+    hit_groups = groups[intersect]
+    for g in np.unique(hit_groups).tolist():
+        i, j = mesh_pairs[g]
+        in_group = hits[hit_groups == g]
+        for k, other, column in ((i, j, 0), (j, i, 1)):
+            local = np.unique(in_group[:, column] - tri_offsets[k])
+            contacts[(meshes[k].name, meshes[other].name)] = np.unique(
+                mesh_bvhs[k].order[local])
+    return contacts
+
+
+def find_contacts(scene, min_distance, contact_mode='centroid', pairs=None,
+                  bvhs=None):
+    """
+    Finds surfaces that collide with other meshes with collision_contacts
+    or triangle_contacts. The scene is not changed.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        contact_mode(str): Optional. 'centroid' (default) or 'exact'.
+        pairs(numpy.ndarray): Optional. (P, 2) pairs of indices of the
+            meshes in the scene to check. Default all pairs found by
+            broad_phase.find_pairs.
+        bvhs(dict): Optional. Dict of BVHs by mesh name used by the 'exact'
+            mode, see triangle_contacts.
+
+    Returns:
+        Dict where the key is a (name, other name) tuple and value is a
+            sorted array of indices of surfaces of the first mesh that
+            collide with the other mesh. Only pairs with contact are listed.
+    """
+    if contact_mode == 'centroid':
+        return collision_contacts(scene, min_distance, pairs)
+    if contact_mode == 'exact':
+        return triangle_contacts(scene, min_distance, pairs=pairs, bvhs=bvhs)
+    raise ValueError('contact_mode has to be one of ' +
+                     ', '.join(CONTACT_MODES) + '.')
+
+
+def find_touching_meshes(scene, min_distance, threads=None):
+    """
+    Finds pairs of meshes which triangles intersect. The triangle tests of a
+    pair of meshes stop at the first intersection.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) between meshes used
+            by the broad phase.
+        threads(int): Optional. Number of threads for the triangle tests.
+            Default triangle_col_detect.THREADS.
+
+    Returns:
+        A sorted list of (name, name) tuples.
+    """
+    meshes = list(scene.values())
+    mesh_pairs, triangles, _, _, pairs, groups = _contact_pairs(
+        meshes, min_distance)
+    if len(mesh_pairs) == 0:
+        return []
+    from analogy.collision_detection import triangle_col_detect
+    intersect = triangle_col_detect.devillers_alg_batch(triangles,
+                                                        triangles,
+                                                        pairs,
+                                                        threads,
+                                                        groups=groups,
+                                                        early_exit=True)
+    return sorted(
+        tuple(sorted((meshes[mesh_pairs[g][0]].name,
+                      meshes[mesh_pairs[g][1]].name)))
+        for g in np.unique(groups[intersect]).tolist())
+
+
+def _contact_pairs(meshes, min_distance, pairs=None, bvhs=None):
+    """
+    Collects candidate triangle pairs of all pairs of meshes found by the
+    broad phase, or of the given pairs. Triangles of all meshes in the pairs
+    are stacked into one array in the order of their BVHs.
+
+    Returns:
+        Tuple of a list of (i, j) mesh pairs, (T, 3, 3) triangles, a dict of
+            offsets of the meshes in triangles, a dict of BVHs of the meshes,
+            (P, 2) triangle pairs and (P,) indices into the list of mesh
+            pairs.
+    """
+    if pairs is None:
+        pos, half_size = broad_phase.aabb_arrays(meshes)
+        pairs = broad_phase.find_pairs(pos, half_size, min_distance)
+    if bvhs is None:
+        bvhs = {}
+    mesh_bvhs = {}
+    tri_offsets = {}
+    n_triangles = 0
+    mesh_pairs = []
+    tri_pairs = []
+    for i, j in np.asarray(pairs, dtype=np.int64).reshape(-1, 2).tolist():
+        if meshes[i].name == meshes[j].name:
+            continue
+        for k in (i, j):
+            if k not in mesh_bvhs:
+                name = meshes[k].name
+                if name not in bvhs:
+                    bvhs[name] = BVH(mesh_triangles(meshes[k]))
+                mesh_bvhs[k] = bvhs[name]
+                tri_offsets[k] = n_triangles
+                n_triangles += len(mesh_bvhs[k])
+        candidates = candidate_pairs(mesh_bvhs[i], mesh_bvhs[j])
+        if len(candidates) == 0:
+            continue
+        mesh_pairs.append((i, j))
+        tri_pairs.append(candidates + [tri_offsets[i], tri_offsets[j]])
+    if not mesh_pairs:
+        return [], None, tri_offsets, mesh_bvhs, None, None
+    triangles = np.concatenate([mesh_bvhs[k].triangles for k in mesh_bvhs])
+    groups = np.repeat(np.arange(len(tri_pairs)),
+                       [len(p) for p in tri_pairs])
+    return (mesh_pairs, triangles, tri_offsets, mesh_bvhs,
+            np.concatenate(tri_pairs), groups)
+
+
+def apply_contacts(scene, contacts):
+    """
+    Sets collision of all meshes in the scene and their surfaces from
+    contacts of pairs of meshes. Previous collisions are cleared.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        contacts(dict): Dict where the key is a (name, other name) tuple and
+            value is an array of indices of surfaces of the first mesh that
+            collide with the other mesh.
+    """
+    for mesh in scene.values():
+        clear_collisions(mesh)
+    mark_contacts(scene, contacts)
+
+
+def mark_contacts(scene, contacts):
+    """
+    Marks the surfaces in contacts and their meshes as collided. Other
+    collisions are kept.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        contacts(dict): Dict where the key is a (name, other name) tuple and
+            value is an array of indices of surfaces of the first mesh that
+            collide with the other mesh.
+    """
+    for (name, other), hits in contacts.items():
+        if len(hits) == 0:
+            continue
+        mesh = scene[name]
+        mesh.collision = True
+        mesh.collided_objects[other] = True
+        for k in np.asarray(hits).tolist():
+            surface = mesh.surfaces[k]
+            surface.collided_objects[other] = True
+            surface.collision = True
+
+
+def clear_collisions(mesh):
+    """
+    Clears collision of the mesh and all its surfaces.
+
+    Args:
+        mesh(Mesh): Mesh object.
+    """
+    mesh.collision = False
+    mesh.collided_objects = {}
+    if mesh.scene_arrays is not None:
+        face_range = mesh.scene_arrays.face_range(mesh.index)
+        mesh.scene_arrays.collision[face_range] = False
+        for k in range(face_range.start, face_range.stop):
+            mesh.scene_arrays.collided_objects.pop(k, None)
+    else:
+        for surface in mesh.surfaces:
+            surface.collision = False
+            surface.collided_objects = {}
+
+
+def mesh_colliders(mesh):
+    """
+    Returns colliders of the surfaces of the mesh.
+
+    Args:
+        mesh(Mesh): Mesh object.
+
+    Returns:
+        (F, 3) array of colliders in the order of the surfaces.
+    """
+    if mesh.scene_arrays is not None:
+        return mesh.colliders
+    return np.array([surface.collider for surface in mesh.surfaces],
+                    dtype=np.float64).reshape(-1, 3)
+
+
+def mesh_triangles(mesh):
+    """
+    Returns triangles of the mesh.
+
+    Args:
+        mesh(Mesh): Mesh object.
+
+    Returns:
+        (F, 3, 3) array of triangles in the order of the surfaces.
+    """
+    if mesh.scene_arrays is not None:
+        return np.asarray(mesh.scene_arrays.vertices[mesh.faces],
+                          dtype=np.float64)
+    return np.array([[vertex.pos for vertex in surface.vertices]
+                     for surface in mesh.surfaces],
+                    dtype=np.float64).reshape(-1, 3, 3)
+
+
+def classify_collided_sides(scene):
+    """
+    Sets collided sides of AABB of each mesh in the scene based on collision
+    of the closest surfaces of the side. No collision = 0, partial = 1 and
+    full = 2.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+    """
+    for mesh in scene.values():
+        for side, surfaces in mesh.aabb.closest_surfaces.items():
+            counter = 0
+            for surface in surfaces:
+                if surface.collision:
+                    counter += 1
+            if counter > 0 and counter == len(surfaces):
+                mesh.aabb.collided_sides[side] = 2
+            elif counter > 0 and counter < len(surfaces):
+                mesh.aabb.collided_sides[side] = 1
+            else:
+                mesh.aabb.collided_sides[side] = 0
+
+
+def sweep_collided_sides(scene, min_distances, contact_mode='centroid'):
+    """
+    Classifies collided sides of all meshes in the scene for many values of
+    min_distance in one pass. Pairs of meshes and candidate surfaces are
+    found once for the largest min_distance. For each value only the
+    candidates are tested again, with the same comparisons as
+    detect_collisions, so the results equal separate runs of analyse_scene.
+    The scene is not changed.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distances(list): A list of minimum distances (no units).
+        contact_mode(str): Optional. 'centroid' (default) or 'exact'.
+
+    Returns:
+        Dict where the key is min_distance and value is a dict where the key
+            is the name of the mesh and value is a dict of collided sides.
+    """
+    min_distances = sorted(set(min_distances))
+    if not min_distances:
+        return {}
+    meshes = list(scene.values())
+    pos, half_size = broad_phase.aabb_arrays(meshes)
+    max_distance = min_distances[-1]
+    pairs = broad_phase.find_pairs(pos, half_size, max_distance)
+
+    # candidate surfaces of each pair at the largest min_distance, one row
+    # per surface and the other mesh
+    surface_offsets = np.cumsum([0] + [len(mesh.surfaces) for mesh in meshes])
+    positions = {mesh.name: k for k, mesh in enumerate(meshes)}
+    owners = []
+    others = []
+    surfaces = []
+    colliders = []
+    contacts = find_contacts(scene, max_distance, contact_mode, pairs)
+    for (name, other), hits in contacts.items():
+        k = positions[name]
+        owners.append(np.full(len(hits), k))
+        others.append(np.full(len(hits), positions[other]))
+        surfaces.append(surface_offsets[k] + hits)
+        colliders.append(mesh_colliders(meshes[k])[hits])
+    if surfaces:
+        owners = np.concatenate(owners)
+        others = np.concatenate(others)
+        surfaces = np.concatenate(surfaces)
+        colliders = np.concatenate(colliders)
+    else:
+        owners = others = surfaces = np.zeros(0, dtype=np.int64)
+        colliders = np.zeros((0, 3))
+
+    # closest surfaces of all sides of all meshes, grouped by mesh and side
+    sides = []
+    closest = []
+    groups = []
+    for k, mesh in enumerate(meshes):
+        for side, indices in closest_surface_indices(mesh).items():
+            groups.append(np.full(len(indices), len(sides)))
+            closest.append(surface_offsets[k] + np.asarray(indices, dtype=int))
+            sides.append((mesh.name, side))
+    closest = np.concatenate(closest) if closest else np.zeros(0, dtype=int)
+    groups = np.concatenate(groups) if groups else np.zeros(0, dtype=int)
+    group_sizes = np.bincount(groups, minlength=len(sides))
+
+    pair_distance = np.abs(pos[owners] - pos[others])
+    pair_size = half_size[owners] + half_size[others]
+    collider_distance = np.abs(pos[others] - colliders)
+    results = {}
+    for min_distance in min_distances:
+        # the same comparisons as the broad phase and detect_collisions
+        hit = np.all(pair_distance < pair_size + min_distance, axis=1)
+        if contact_mode == 'centroid':
+            hit &= np.all(collider_distance <
+                          (half_size[others] + min_distance),
+                          axis=1)
+        collided = np.zeros(surface_offsets[-1], dtype=bool)
+        collided[surfaces[hit]] = True
+        counters = np.bincount(groups,
+                               weights=collided[closest],
+                               minlength=len(sides))
+        classes = np.where((counters > 0) & (counters == group_sizes), 2,
+                           np.where(counters > 0, 1, 0)).tolist()
+        collided_sides = {
+            mesh.name: {side: 0 for side in mesh.aabb.collided_sides}
+            for mesh in meshes
+        }
+        for (name, side), value in zip(sides, classes):
+            collided_sides[name][side] = value
+        results[min_distance] = collided_sides
+    return results
+
+
+def closest_surface_indices(mesh):
+    """
+    Returns indices of the closest surfaces of each side of AABB of the mesh.
+
+    Args:
+        mesh(Mesh): Mesh object.
+
+    Returns:
+        Dict where the key is the side name and value is a list of indices
+            into mesh.surfaces.
+    """
+    if mesh.scene_arrays is not None:
+        start = mesh.scene_arrays.face_range(mesh.index).start
+        return {
+            side: [surface.index - start for surface in surfaces]
+            for side, surfaces in mesh.aabb.closest_surfaces.items()
+        }
+    positions = {id(surface): k for k, surface in enumerate(mesh.surfaces)}
+    return {
+        side: [positions[id(surface)] for surface in surfaces]
+        for side, surfaces in mesh.aabb.closest_surfaces.items()
+    }
+
+
+def analyse_scene(scene, min_distance, contact_mode='centroid'):
+    """
+    Runs the collision detection and classification of collided sides for
+    all meshes in the scene.
+
+    Args:
+        scene(dict): A dict of Mesh objects where the key is the name of the
+            mesh and value is Mesh object.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        contact_mode(str): Optional. 'centroid' (default) tests colliders of
+            surfaces against AABBs, 'exact' tests triangles of the meshes.
+
+    Returns:
+        The same scene dict.
+    """
+    if contact_mode == 'centroid':
+        detect_collisions(scene, min_distance)
+    elif contact_mode == 'exact':
+        detect_contacts(scene, min_distance)
+    else:
+        raise ValueError('contact_mode has to be one of ' +
+                         ', '.join(CONTACT_MODES) + '.')
+    classify_collided_sides(scene)
+    return scene
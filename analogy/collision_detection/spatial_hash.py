@@ -0,0 +1,246 @@
+import itertools
+
+import numpy as np
+
+
+class SpatialHash:
+    """
+    SpatialHash is a uniform grid over points in 3D space. Points are sorted
+    by the cell they fall into, so all points of a cell are one contiguous
+    range and a box query only visits the cells it overlaps.
+
+    Attributes:
+        points(numpy.ndarray): (N, 3) array of the points.
+        cell_size(float): Size of the cubic cell.
+        origin(numpy.ndarray): (3,) lowest corner of the grid.
+        shape(numpy.ndarray): (3,) number of cells along x, y and z axis.
+        order(numpy.ndarray): (N,) indices of points sorted by their cell.
+        cell_keys(numpy.ndarray): Sorted keys of all occupied cells.
+        cell_starts(numpy.ndarray): Start of each occupied cell in order.
+        cell_ends(numpy.ndarray): End of each occupied cell in order.
+    """
+
+    def __init__(self, points, cell_size):
+        """
+        Init SpatialHash
+
+        Args:
+            points(numpy.ndarray): (N, 3) array of the points.
+            cell_size(float): Size of the cubic cell. It has to be positive.
+        """
+        if not cell_size > 0:
+            raise ValueError('cell_size has to be positive.')
+        self.points = np.asarray(points).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+        if len(self.points):
+            self.origin = self.points.min(axis=0).astype(np.float64)
+            cells = self._cells(self.points)
+            self.shape = cells.max(axis=0) + 1
+        else:
+            self.origin = np.zeros(3)
+            cells = np.zeros((0, 3), dtype=np.int64)
+            self.shape = np.ones(3, dtype=np.int64)
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_keys, self.cell_starts, counts = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+        self.cell_ends = self.cell_starts + counts
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(
+            np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + (
+            cells[:, 2])
+
+    def query(self, lower, upper):
+        """
+        Returns points in all cells that overlap the box. The result is a
+        superset of the points inside the box.
+
+        Args:
+            lower(list): [x,y,z] lowest corner of the box.
+            upper(list): [x,y,z] highest corner of the box.
+
+        Returns:
+            Sorted array of indices into points.
+        """
+        if len(self.points) == 0:
+            return np.zeros(0, dtype=np.int64)
+        cell_min = np.maximum(self._cells(np.asarray(lower).reshape(1, 3))[0],
+                              0)
+        cell_max = np.minimum(self._cells(np.asarray(upper).reshape(1, 3))[0],
+                              self.shape - 1)
+        if np.any(cell_max < cell_min):
+            return np.zeros(0, dtype=np.int64)
+
+        n_box_cells = int(np.prod(cell_max - cell_min + 1))
+        if n_box_cells <= len(self.cell_keys):
+            # look up each cell of the box
+            grid = np.stack(
+                np.meshgrid(*[
+                    np.arange(cell_min[axis], cell_max[axis] + 1)
+                    for axis in range(3)
+                ],
+                            indexing='ij'),
+                axis=-1).reshape(-1, 3)
+            keys = self._keys(grid)
+            found = np.searchsorted(self.cell_keys, keys)
+            valid = found < len(self.cell_keys)
+            found = found[valid]
+            found = found[self.cell_keys[found] == keys[valid]]
+        else:
+            # the box is bigger than the occupied part of the grid, so
+            # filter the occupied cells instead
+            occupied = np.stack([
+                self.cell_keys // (self.shape[1] * self.shape[2]),
+                self.cell_keys // self.shape[2] % self.shape[1],
+                self.cell_keys % self.shape[2],
+            ],
+                                axis=1)
+            found = np.flatnonzero(
+                np.all((occupied >= cell_min) & (occupied <= cell_max),
+                       axis=1))
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts = self.cell_starts[found]
+        counts = self.cell_ends[found] - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return np.sort(self.order[np.arange(counts.sum()) + offsets])
+
+
+def default_cell_size(half_sizes, min_distance):
+    """
+    Returns a cell size for a scene. It is a quarter of the median of the
+    largest AABB size of the meshes inflated by min_distance, so a typical
+    neighbour query overlaps only a few dozen cells.
+
+    Args:
+        half_sizes(numpy.ndarray): (M, 3) half sizes of the AABBs.
+        min_distance(float): minimum distance (no units) between meshes.
+
+    Returns:
+        Cell size as float.
+    """
+    half_sizes = np.asarray(half_sizes, dtype=np.float64).reshape(-1, 3)
+    if len(half_sizes) == 0:
+        return 1.0
+    size = float(np.median(half_sizes.max(axis=1) * 2 + min_distance)) / 4
+    return size if size > 0 else 1.0
+
+
+class AABBHash:
+    """
+    AABBHash is a uniform grid over AABBs that are inserted, moved and
+    removed one at a time. Each AABB is listed in all cells it overlaps, so
+    a box query only visits the cells of the box. AABBs that overlap more
+    than max_cells cells (floors, walls, shelves) are kept in one list that
+    every query returns, so they do not fill the grid.
+
+    Attributes:
+        cell_size(float): Size of the cubic cell.
+        max_cells(int): Largest number of cells of an AABB in the grid.
+        cells(dict): Dict where the key is a (x, y, z) cell and value is a
+            set of keys of the AABBs in the cell.
+        large(set): Keys of the AABBs that are not in the grid.
+        boxes(dict): Dict where the key is the key of the AABB and value is
+            a tuple of its lowest and highest cell.
+    """
+
+    def __init__(self, cell_size, max_cells=64):
+        """
+        Init AABBHash
+
+        Args:
+            cell_size(float): Size of the cubic cell. It has to be positive.
+            max_cells(int): Optional. Largest number of cells of an AABB in
+                the grid. Default 64.
+        """
+        if not cell_size > 0:
+            raise ValueError('cell_size has to be positive.')
+        self.cell_size = float(cell_size)
+        self.max_cells = max_cells
+        self.cells = {}
+        self.large = set()
+        self.boxes = {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def _cell_range(self, lower, upper):
+        cell_min = np.floor(np.asarray(lower, dtype=np.float64) /
+                            self.cell_size).astype(np.int64)
+        cell_max = np.floor(np.asarray(upper, dtype=np.float64) /
+                            self.cell_size).astype(np.int64)
+        return cell_min, cell_max
+
+    def _cells(self, cell_min, cell_max):
+        return itertools.product(*[
+            range(cell_min[axis], cell_max[axis] + 1) for axis in range(3)
+        ])
+
+    def insert(self, key, lower, upper):
+        """
+        Adds the box to the grid. A box with the same key is replaced.
+
+        Args:
+            key(object): Hashable key of the box.
+            lower(list): [x,y,z] lowest corner of the box.
+            upper(list): [x,y,z] highest corner of the box.
+        """
+        if key in self.boxes:
+            self.remove(key)
+        cell_min, cell_max = self._cell_range(lower, upper)
+        self.boxes[key] = (cell_min, cell_max)
+        if np.prod(cell_max - cell_min + 1) > self.max_cells:
+            self.large.add(key)
+            return
+        for cell in self._cells(cell_min, cell_max):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        """
+        Removes the box from the grid.
+
+        Args:
+            key(object): Key of the box.
+        """
+        cell_min, cell_max = self.boxes.pop(key)
+        if key in self.large:
+            self.large.discard(key)
+            return
+        for cell in self._cells(cell_min, cell_max):
+            in_cell = self.cells[cell]
+            in_cell.discard(key)
+            if not in_cell:
+                del self.cells[cell]
+
+    def query(self, lower, upper):
+        """
+        Returns keys of the boxes in all cells that overlap the box and of
+        the large boxes. The result is a superset of the boxes that overlap
+        the box.
+
+        Args:
+            lower(list): [x,y,z] lowest corner of the box.
+            upper(list): [x,y,z] highest corner of the box.
+
+        Returns:
+            A set of keys.
+        """
+        cell_min, cell_max = self._cell_range(lower, upper)
+        if np.prod(cell_max - cell_min + 1) > len(self.cells):
+            # the box covers more cells than are occupied, so look at the
+            # boxes instead
+            return {
+                key for key, (box_min, box_max) in self.boxes.items()
+                if np.all(box_min <= cell_max) and np.all(box_max >= cell_min)
+            }
+        found = set(self.large)
+        for cell in self._cells(cell_min, cell_max):
+            found.update(self.cells.get(cell, ()))
+        return found
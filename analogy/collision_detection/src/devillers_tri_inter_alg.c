@@ -36,6 +36,8 @@
 *                                                                           
 */
 
+#include "parallel_batch.h"
+
 
 /* function prototype */
 
@@ -43,6 +45,11 @@
 int tri_tri_overlap_test_3d(double p1[3], double q1[3], double r1[3], 
           double p2[3], double q2[3], double r2[3]);
 
+// Three-dimensional Triangle-Triangle Overlap Test of many pairs in threads
+int tri_tri_overlap_test_3d_parallel(double *tris1, double *tris2,
+          int *pairs, int *groups, int n_groups, int n_pairs,
+          int early_exit, int n_threads, unsigned char *result);
+
 
 // Three-dimensional Triangle-Triangle Overlap Test
 // additionaly computes the segment of intersection of the two triangles if it exists. 
@@ -572,3 +579,36 @@ int tri_tri_overlap_test_2d(double p1[2], double q1[2], double r1[2],
 
 };
 
+
+
+static int tri_tri_overlap_test_3d_pair(const void *tris1, const void *tris2,
+          int i1, int i2) {
+  double *t1 = (double *)tris1 + 9 * (long)i1;
+  double *t2 = (double *)tris2 + 9 * (long)i2;
+  return tri_tri_overlap_test_3d(t1, t1 + 3, t1 + 6, t2, t2 + 3, t2 + 6);
+}
+
+
+/*
+*  Version of tri_tri_overlap_test_3d that tests many pairs of triangles in
+*  one call on a pool of threads, see parallel_batch.c.
+*
+*  tris1 and tris2 are arrays of triangles, 9 doubles per triangle (p, q, r).
+*  If pairs is NULL, the i-th triangle of tris1 is tested with the i-th
+*  triangle of tris2, otherwise pairs holds n_pairs pairs of indices
+*  (index into tris1, index into tris2). result[i] is set to 1 if the i-th
+*  pair overlaps, otherwise 0.
+*
+*  groups is NULL or holds n_pairs group indices in [0, n_groups). If
+*  early_exit is not 0, the rest of a group is skipped after its first
+*  overlapping pair. The pairs are tested by n_threads threads. Returns the
+*  number of overlapping pairs or -1 on error.
+*/
+
+int tri_tri_overlap_test_3d_parallel(double *tris1, double *tris2,
+          int *pairs, int *groups, int n_groups, int n_pairs,
+          int early_exit, int n_threads, unsigned char *result) {
+  return parallel_batch(tri_tri_overlap_test_3d_pair, tris1, tris2, pairs,
+                        groups, n_groups, n_pairs, early_exit, n_threads,
+                        result);
+}
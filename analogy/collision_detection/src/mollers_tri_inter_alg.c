@@ -16,6 +16,8 @@
  */
 
 #include <math.h>
+
+#include "parallel_batch.h"
 #define FABS(x) ((float)(fabs(x)))        /* implement as is fastest on your machine */
 
 /* if USE_EPSILON_TEST is true then we do a check:
@@ -306,3 +308,44 @@ int NoDivTriTriIsect(float V0[3],float V1[3],float V2[3],
   if(isect1[1]<isect2[0] || isect2[1]<isect1[0]) return 0;
   return 1;
 }
+
+
+static int NoDivTriTriIsectPair(const void *tris1, const void *tris2,
+                                int i1, int i2)
+{
+  float *t1 = (float *)tris1 + 9 * (long)i1;
+  float *t2 = (float *)tris2 + 9 * (long)i2;
+  return NoDivTriTriIsect(t1, t1 + 3, t1 + 6, t2, t2 + 3, t2 + 6);
+}
+
+
+/* Version of NoDivTriTriIsect that tests many pairs of triangles in one
+ * call on a pool of threads, see parallel_batch.c. With one thread the
+ * pairs are tested on the calling thread.
+ *
+ * int NoDivTriTriIsectParallel(float *tris1, float *tris2, int *pairs,
+ *                              int *groups, int n_groups, int n_pairs,
+ *                              int early_exit, int n_threads,
+ *                              unsigned char *result)
+ *
+ * parameters: tris1, tris2: arrays of triangles, 9 floats per triangle
+ *                           (V0, V1, V2)
+ *             pairs: NULL to test the i-th triangle of tris1 with the i-th
+ *                    triangle of tris2, otherwise n_pairs pairs of indices
+ *                    (index into tris1, index into tris2)
+ *             n_pairs: number of pairs to test
+ *             result: n_pairs bytes, 1 if the pair intersects, otherwise 0
+ *             groups: NULL or n_pairs group indices in [0, n_groups)
+ *             early_exit: skip the rest of a group after its first
+ *                         intersection
+ *             n_threads: number of threads
+ * result    : returns the number of intersecting pairs, -1 on error
+ */
+int NoDivTriTriIsectParallel(float *tris1, float *tris2, int *pairs,
+                             int *groups, int n_groups, int n_pairs,
+                             int early_exit, int n_threads,
+                             unsigned char *result)
+{
+  return parallel_batch(NoDivTriTriIsectPair, tris1, tris2, pairs, groups,
+                        n_groups, n_pairs, early_exit, n_threads, result);
+}
@@ -0,0 +1,131 @@
+/* Parallel execution of a triangle/triangle test over many pairs of
+ * triangles with a pool of POSIX threads.
+ *
+ * The pairs are not split between the threads in advance. All threads take
+ * chunks of PARALLEL_BATCH_CHUNK pairs from one shared atomic counter, so a
+ * thread that finishes its chunk early takes the next one and the work stays
+ * balanced even if some pairs are much cheaper than others.
+ *
+ * Pairs can be grouped, for example by the pair of meshes they belong to.
+ * With early exit, the rest of a group is skipped once one of its pairs
+ * intersects.
+ */
+
+#include <pthread.h>
+#include <stdlib.h>
+
+#include "parallel_batch.h"
+
+struct batch_job {
+  pair_test_fn test;
+  const void *tris1;
+  const void *tris2;
+  const int *pairs;
+  const int *groups;
+  int n_pairs;
+  int early_exit;
+  unsigned char *result;
+  volatile unsigned char *group_done;
+  int next;
+  int n_hits;
+};
+
+static void *batch_worker(void *arg)
+{
+  struct batch_job *job = (struct batch_job *)arg;
+  int start, stop, i, i1, i2, group, n_hits = 0;
+  for(;;)
+  {
+    start = __sync_fetch_and_add(&job->next, PARALLEL_BATCH_CHUNK);
+    if(start >= job->n_pairs) break;
+    stop = start + PARALLEL_BATCH_CHUNK;
+    if(stop > job->n_pairs) stop = job->n_pairs;
+    for(i = start; i < stop; i++)
+    {
+      group = job->group_done ? job->groups[i] : -1;
+      if(group >= 0 && job->group_done[group])
+      {
+        job->result[i] = 0;
+        continue;
+      }
+      i1 = job->pairs ? job->pairs[2 * i] : i;
+      i2 = job->pairs ? job->pairs[2 * i + 1] : i;
+      job->result[i] = (unsigned char)job->test(job->tris1, job->tris2,
+                                                i1, i2);
+      if(job->result[i])
+      {
+        n_hits++;
+        if(group >= 0) job->group_done[group] = 1;
+      }
+    }
+  }
+  __sync_fetch_and_add(&job->n_hits, n_hits);
+  return NULL;
+}
+
+/* int parallel_batch(pair_test_fn test, const void *tris1,
+ *                    const void *tris2, const int *pairs, const int *groups,
+ *                    int n_groups, int n_pairs, int early_exit,
+ *                    int n_threads, unsigned char *result)
+ *
+ * parameters: test: test of one pair of triangles
+ *             tris1, tris2: arrays of triangles passed to test
+ *             pairs: NULL to test the i-th triangle of tris1 with the i-th
+ *                    triangle of tris2, otherwise n_pairs pairs of indices
+ *             groups: NULL or n_pairs group indices in [0, n_groups)
+ *             early_exit: if not 0 and groups are given, pairs of a group
+ *                         are skipped once one pair of the group intersects
+ *             n_threads: number of threads, the calling thread is one of them
+ *             result: n_pairs bytes, 1 if the pair intersects, otherwise 0.
+ *                     Skipped pairs are 0.
+ * result    : returns the number of intersecting pairs or -1 if memory for
+ *             the groups can not be allocated
+ */
+int parallel_batch(pair_test_fn test, const void *tris1, const void *tris2,
+                   const int *pairs, const int *groups, int n_groups,
+                   int n_pairs, int early_exit, int n_threads,
+                   unsigned char *result)
+{
+  struct batch_job job;
+  pthread_t *threads = NULL;
+  int i, n_started = 0;
+
+  job.test = test;
+  job.tris1 = tris1;
+  job.tris2 = tris2;
+  job.pairs = pairs;
+  job.groups = groups;
+  job.n_pairs = n_pairs;
+  job.early_exit = early_exit;
+  job.result = result;
+  job.group_done = NULL;
+  job.next = 0;
+  job.n_hits = 0;
+  if(early_exit && groups && n_groups > 0)
+  {
+    job.group_done = (volatile unsigned char *)calloc(n_groups, 1);
+    if(!job.group_done) return -1;
+  }
+
+  if(n_threads > n_pairs / PARALLEL_BATCH_CHUNK)
+    n_threads = n_pairs / PARALLEL_BATCH_CHUNK;
+  if(n_threads > 1)
+    threads = (pthread_t *)malloc((n_threads - 1) * sizeof(pthread_t));
+  if(threads)
+  {
+    for(i = 0; i < n_threads - 1; i++)
+    {
+      if(pthread_create(&threads[n_started], NULL, batch_worker, &job) == 0)
+        n_started++;
+    }
+  }
+  /* the calling thread works too and finishes the pairs alone if no
+     thread could be started */
+  batch_worker(&job);
+  for(i = 0; i < n_started; i++)
+    pthread_join(threads[i], NULL);
+
+  free(threads);
+  free((void *)job.group_done);
+  return job.n_hits;
+}
@@ -0,0 +1,22 @@
+/* Parallel execution of a triangle/triangle test over many pairs of
+ * triangles with a pool of POSIX threads.
+ */
+
+#ifndef PARALLEL_BATCH_H
+#define PARALLEL_BATCH_H
+
+/* Number of pairs that a thread takes from the shared counter at once. */
+#define PARALLEL_BATCH_CHUNK 256
+
+/* Test of one pair of triangles, i1-th triangle of tris1 with i2-th triangle
+ * of tris2. Returns 1 if the triangles intersect, otherwise 0.
+ */
+typedef int (*pair_test_fn)(const void *tris1, const void *tris2,
+                            int i1, int i2);
+
+int parallel_batch(pair_test_fn test, const void *tris1, const void *tris2,
+                   const int *pairs, const int *groups, int n_groups,
+                   int n_pairs, int early_exit, int n_threads,
+                   unsigned char *result);
+
+#endif
@@ -2,10 +2,36 @@
 import ctypes
 import os
 
+import numpy as np
+
 CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
 C_MOLLERS = ctypes.CDLL(os.path.join(CURRENT_PATH, 'build/mollers_tri_tri.so'))
 C_DEVILLERS = ctypes.CDLL(
     os.path.join(CURRENT_PATH, 'build/devillers_tri_tri.so'))
+# The batch functions get raw pointers to numpy arrays. ctypes releases the
+# GIL for the duration of the call and the pairs are shared by a pool of
+# POSIX threads inside the C library.
+PARALLEL_ARGTYPES = [
+    ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+    ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_void_p
+]
+C_MOLLERS.NoDivTriTriIsectParallel.argtypes = PARALLEL_ARGTYPES
+C_MOLLERS.NoDivTriTriIsectParallel.restype = ctypes.c_int
+C_DEVILLERS.tri_tri_overlap_test_3d_parallel.argtypes = PARALLEL_ARGTYPES
+C_DEVILLERS.tri_tri_overlap_test_3d_parallel.restype = ctypes.c_int
+# Default number of threads of the batch functions.
+THREADS = 1
+
+
+def set_threads(threads):
+    """
+    Sets the default number of threads of the batch functions.
+
+    Args:
+        threads(int): Number of threads. None means the number of CPUs.
+    """
+    global THREADS
+    THREADS = max(1, threads or os.cpu_count() or 1)
 
 
 def mollers_alg(tri_1, tri_2):
@@ -57,4 +83,101 @@ def devillers_alg(tri_1, tri_2):
     c_r2 = three_doubles_arr(tri_2[2][0], tri_2[2][1], tri_2[2][2])
     collision = C_DEVILLERS.tri_tri_overlap_test_3d(c_p1, c_q1, c_r1, c_p2,
                                                     c_q2, c_r2)
-    return collision
\ No newline at end of file
+    return collision
+
+
+def mollers_alg_batch(tris_1,
+                      tris_2,
+                      pairs=None,
+                      threads=None,
+                      groups=None,
+                      early_exit=False):
+    """
+    Batch wrapper for the mollers algorithm. All pairs are tested inside the
+    C library in one call.
+
+    Args:
+        tris_1(numpy.ndarray): (N, 3, 3) array of triangles.
+        tris_2(numpy.ndarray): (N, 3, 3) or (K, 3, 3) array of triangles.
+        pairs(numpy.ndarray): Optional. (P, 2) array of index pairs into
+            tris_1 and tris_2. By default the i-th triangle of tris_1 is
+            tested with the i-th triangle of tris_2.
+        threads(int): Optional. Number of threads that share the pairs.
+            Default THREADS.
+        groups(numpy.ndarray): Optional. (P,) array of group indices of the
+            pairs, for example the pair of meshes the triangles belong to.
+        early_exit(bool): Optional. If True, the rest of a group is skipped
+            after the first collision in the group. Default False.
+
+    Returns:
+        (P,) bool array, True where the two triangles collide. Skipped pairs
+            are False.
+    """
+    return _batch(C_MOLLERS.NoDivTriTriIsectParallel, np.float32, tris_1,
+                  tris_2, pairs, threads, groups, early_exit)
+
+
+def devillers_alg_batch(tris_1,
+                        tris_2,
+                        pairs=None,
+                        threads=None,
+                        groups=None,
+                        early_exit=False):
+    """
+    Batch wrapper for the devillers algorithm. All pairs are tested inside
+    the C library in one call.
+
+    Args:
+        tris_1(numpy.ndarray): (N, 3, 3) array of triangles.
+        tris_2(numpy.ndarray): (N, 3, 3) or (K, 3, 3) array of triangles.
+        pairs(numpy.ndarray): Optional. (P, 2) array of index pairs into
+            tris_1 and tris_2. By default the i-th triangle of tris_1 is
+            tested with the i-th triangle of tris_2.
+        threads(int): Optional. Number of threads that share the pairs.
+            Default THREADS.
+        groups(numpy.ndarray): Optional. (P,) array of group indices of the
+            pairs, for example the pair of meshes the triangles belong to.
+        early_exit(bool): Optional. If True, the rest of a group is skipped
+            after the first collision in the group. Default False.
+
+    Returns:
+        (P,) bool array, True where the two triangles collide. Skipped pairs
+            are False.
+    """
+    return _batch(C_DEVILLERS.tri_tri_overlap_test_3d_parallel, np.float64,
+                  tris_1, tris_2, pairs, threads, groups, early_exit)
+
+
+def _batch(c_function, dtype, tris_1, tris_2, pairs, threads, groups,
+           early_exit):
+    tris_1 = np.ascontiguousarray(tris_1, dtype=dtype).reshape(-1, 9)
+    tris_2 = np.ascontiguousarray(tris_2, dtype=dtype).reshape(-1, 9)
+    if pairs is None:
+        if len(tris_1) != len(tris_2):
+            raise ValueError('tris_1 and tris_2 have different lengths.')
+        n_pairs = len(tris_1)
+    else:
+        pairs = np.ascontiguousarray(pairs, dtype=np.int32).reshape(-1, 2)
+        n_pairs = len(pairs)
+        if n_pairs and (pairs.min() < 0 or pairs[:, 0].max() >= len(tris_1)
+                        or pairs[:, 1].max() >= len(tris_2)):
+            raise IndexError('pairs are out of range of the triangles.')
+    n_groups = 0
+    if groups is not None:
+        groups = np.ascontiguousarray(groups, dtype=np.int32).reshape(-1)
+        if len(groups) != n_pairs:
+            raise ValueError('groups and pairs have different lengths.')
+        if n_pairs and groups.min() < 0:
+            raise IndexError('groups have to be non-negative.')
+        n_groups = int(groups.max()) + 1 if n_pairs else 0
+    if threads is None:
+        threads = THREADS
+    result = np.zeros(n_pairs, dtype=np.uint8)
+    n_hits = c_function(tris_1.ctypes.data, tris_2.ctypes.data,
+                        None if pairs is None else pairs.ctypes.data,
+                        None if groups is None else groups.ctypes.data,
+                        n_groups, n_pairs, int(bool(early_exit)),
+                        max(1, int(threads)), result.ctypes.data)
+    if n_hits < 0:
+        raise MemoryError('Can not allocate memory for the groups.')
+    return result.view(bool)
@@ -1,202 +1,244 @@
+import array
 import os
 from analogy.mesh import Mesh
+from analogy.mesh import SceneArrays
 from analogy.mesh import Surface
-from analogy.mesh import Vertex
 import statistics as stat
 
+import numpy as np
 
-def read_obj_file(obj_file_path):
+# Size of the read buffer used while streaming .obj files (1 MiB).
+READ_BUFFER_SIZE = 1 << 20
+
+# Default max distance of a surface collider from the side of the AABB for
+# the surface to be still considered as the closest one to the side. Only
+# colliders exactly at the side are used by default, as in the knowledge
+# bases built so far. A positive tolerance changes the collided sides of
+# some meshes, so the knowledge base has to be rebuilt with the same value.
+SIDE_TOLERANCE = 0.0
+
+# AABB side name and (axis, direction) of the side.
+AABB_SIDES = {
+    'top': (1, 1),
+    'bottom': (1, -1),
+    'front': (2, 1),
+    'back': (2, -1),
+    'right': (0, 1),
+    'left': (0, -1),
+}
+
+
+def read_mtl_file(mtl_file_path):
     """
-    Reads OBJ file, creates Mesh object for each mesh in the file. Also, while
-    parsing the file it calculates and creates AABB.
+    Reads MTL file and returns diffuse colors of all materials in the file.
 
     Args:
-        obj_file_path(str): File path to the .obj file.
+        mtl_file_path(str): File path to the .mtl file.
 
     Returns:
-        A dict of Mest objects where the key is the name of the mesh and value
-            is Mesh object.
+        A dict where the key is the name of the material and value is a tuple
+            of RGB values. Empty dict if the file does not exist.
     """
-    # read obj file
-    with open(obj_file_path, 'r') as f:
-        obj_lines = f.read().split('\n')
-
-    # try to read mtl file if exists
-    mtl_file_name = obj_file_path.replace('.obj', '.mtl')
     mtl_colors = {}
-    if os.path.isfile(mtl_file_name):
-        with open(mtl_file_name, 'r') as f:
-            mtl_lines = f.read().split('\n')
-
-        i = 0
-        while i < len(mtl_lines):
-            if mtl_lines[i].startswith('newmtl'):
-                new_mtl_name = mtl_lines[i][7:]
-                i += 1
-                c = mtl_lines[i].split(' ')
+    if not os.path.isfile(mtl_file_path):
+        return mtl_colors
+
+    new_mtl_name = None
+    with open(mtl_file_path, 'r', buffering=READ_BUFFER_SIZE) as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.startswith('newmtl'):
+                new_mtl_name = line[7:]
+            elif new_mtl_name is not None and line != '':
+                # the color is on the line right after the material name
+                c = line.split(' ')
                 mtl_colors[new_mtl_name] = (float(c[1]), float(c[2]),
                                             float(c[3]))
-            i += 1
+                new_mtl_name = None
+    return mtl_colors
 
-    i = 0
-    objects = {}
-    all_vertices = []
-    while i < len(obj_lines):
-        new_obj_line = obj_lines[i]
-        if new_obj_line != '' and not new_obj_line.startswith('#'):
-            if new_obj_line.startswith('o '):
-                new_mesh = Mesh()
-                new_mesh.name = new_obj_line[2:]
-                # we have a new object
-                i += 1
-                min_max_x_vertices = [float('+Infinity'), float('-Infinity')]
-                min_max_y_vertices = [float('+Infinity'), float('-Infinity')]
-                min_max_z_vertices = [float('+Infinity'), float('-Infinity')]
-                while obj_lines[i].startswith('v '):
-                    # while reading all vertices, find Axis Aligned bounding box for the object.
-                    v = obj_lines[i][2:].split()
-                    x = float(v[0])
-                    min_max_x_vertices[0] = min(min_max_x_vertices[0], x)
-                    min_max_x_vertices[1] = max(min_max_x_vertices[1], x)
-                    y = float(v[1])
-                    min_max_y_vertices[0] = min(min_max_y_vertices[0], y)
-                    min_max_y_vertices[1] = max(min_max_y_vertices[1], y)
-                    z = float(v[2])
-                    min_max_z_vertices[0] = min(min_max_z_vertices[0], z)
-                    min_max_z_vertices[1] = max(min_max_z_vertices[1], z)
-                    all_vertices.append(Vertex([x, y, z]))
-                    i += 1
-                # print('min_max x y z:', min_max_x_vertices, min_max_y_vertices,
-                #       min_max_z_vertices)
-                new_aabb_size_x = abs(min_max_x_vertices[0] -
-                                      min_max_x_vertices[1]) / 2
-                new_aabb_size_y = abs(min_max_y_vertices[0] -
-                                      min_max_y_vertices[1]) / 2
-                new_aabb_size_z = abs(min_max_z_vertices[0] -
-                                      min_max_z_vertices[1]) / 2
-                new_mesh.aabb.half_size = [
-                    new_aabb_size_x, new_aabb_size_y, new_aabb_size_z
-                ]
-                new_aabb_pos_x = stat.mean(min_max_x_vertices)
-                new_aabb_pos_y = stat.mean(min_max_y_vertices)
-                new_aabb_pos_z = stat.mean(min_max_z_vertices)
-                new_mesh.aabb.pos = [
-                    new_aabb_pos_x, new_aabb_pos_y, new_aabb_pos_z
-                ]
-                while obj_lines[i] == '' or obj_lines[i].startswith('#'):
-                    i += 1
-                if obj_lines[i].startswith('usemtl'):
-                    if not mtl_colors:
-                        raise ValueError(
-                            "mtl color specified but mtl file does not exist.")
-                    c = mtl_colors[obj_lines[i][7:]]
-                    new_mesh.color = [float(c[0]), float(c[1]), float(c[2])]
-                    new_mesh.aabb.color = [
-                        float(c[0]), float(c[1]),
-                        float(c[2])
-                    ]
-                    i += 1
+
+def iter_obj_meshes(obj_file_path,
+                    mtl_colors=None,
+                    dtype=np.float64,
+                    side_tolerance=SIDE_TOLERANCE):
+    """
+    Streams OBJ file and yields one Mesh object at a time. The file is read in
+    buffered chunks and only vertices of the mesh that is currently parsed are
+    kept in memory, so the peak memory is proportional to the largest mesh in
+    the file rather than to the whole file. AABB and closest surfaces are
+    calculated as soon as the mesh is complete.
+
+    Faces have to reference vertices of their own object, which is how
+    3D Builder and Meshlab export the scenes.
+
+    Args:
+        obj_file_path(str): File path to the .obj file.
+        mtl_colors(dict): Optional. Material colors as returned by
+            read_mtl_file. By default the .mtl file next to the .obj file is
+            read if it exists.
+        dtype(numpy.dtype): Optional. float32 or float64 (default) type of
+            vertex coordinates.
+        side_tolerance(float): Optional. Tolerance used to find the closest
+            surfaces to the AABB sides. See find_closest_surfaces.
+
+    Yields:
+        Mesh objects in the order they are defined in the file. Each mesh is
+            bound to its own SceneArrays.
+    """
+    if mtl_colors is None:
+        mtl_colors = read_mtl_file(obj_file_path.replace('.obj', '.mtl'))
+
+    new_mesh = None
+    # coordinates and faces of the current mesh only. Faces are indexed
+    # from the first vertex of the mesh.
+    coords = array.array('d')
+    faces = array.array('i')
+    vertex_offset = 0  # number of vertices in all previous meshes
+    with open(obj_file_path, 'r', buffering=READ_BUFFER_SIZE) as f:
+        for line in f:
+            if line.startswith('v '):
+                v = line[2:].split()
+                coords.append(float(v[0]))
+                coords.append(float(v[1]))
+                coords.append(float(v[2]))
+            elif line.startswith('f '):
+                if new_mesh is None:
+                    continue
                 # we have a surface
-                faces = []  # triangles
-                while obj_lines[i].startswith('f '):
-                    t = obj_lines[i][2:].split()
-                    new_mesh.surfaces.append(
-                        Surface([
-                            all_vertices[int(t[0]) - 1],
-                            all_vertices[int(t[1]) - 1],
-                            all_vertices[int(t[2]) - 1]
-                        ]))
-                    surface_vertices = [
-                        all_vertices[int(t[0]) - 1],
-                        all_vertices[int(t[1]) - 1], all_vertices[int(t[2]) - 1]
-                    ]
-                    centroid = [.0, .0, .0]
-                    for vertex in surface_vertices:
-                        centroid[0] += vertex.pos[0]
-                        centroid[1] += vertex.pos[1]
-                        centroid[2] += vertex.pos[2]
-                    for l in range(3):
-                        centroid[l] /= len(surface_vertices)
-                    new_mesh.surfaces[-1].collider = centroid
-                    i += 1
-
-                # find colliders associated with aabb sides
-                aabb_surfaces = {}
-                aabb_surfaces['top'] = [Surface([])]
-                aabb_surfaces['top'][0].collider = [.0, float('-Infinity'), .0]
-                aabb_surfaces['bottom'] = [Surface([])]
-                aabb_surfaces['bottom'][0].collider = [
-                    .0, float('+Infinity'), .0
-                ]
-                aabb_surfaces['front'] = [Surface([])]
-                aabb_surfaces['front'][0].collider = [
-                    .0, .0, float('-Infinity')
-                ]
-                aabb_surfaces['back'] = [Surface([])]
-                aabb_surfaces['back'][0].collider = [.0, .0, float('+Infinity')]
-                aabb_surfaces['right'] = [Surface([])]
-                aabb_surfaces['right'][0].collider = [
-                    float('-Infinity'),
-                    .0,
-                    .0,
-                ]
-                aabb_surfaces['left'] = [Surface([])]
-                aabb_surfaces['left'][0].collider = [
-                    float('+Infinity'),
-                    .0,
-                    .0,
-                ]
-                for surface in new_mesh.surfaces:
-                    # check right collider (x coordinates)
-                    if surface.collider[0] == aabb_surfaces['right'][
-                            0].collider[0]:
-                        aabb_surfaces['right'].append(surface)
-                    elif surface.collider[0] > aabb_surfaces['right'][
-                            0].collider[0]:
-                        aabb_surfaces['right'] = [surface]
-
-                    # check left collider (x coordinates)
-                    if surface.collider[0] == aabb_surfaces['left'][0].collider[
-                            0]:
-                        aabb_surfaces['left'].append(surface)
-                    elif surface.collider[0] < aabb_surfaces['left'][
-                            0].collider[0]:
-                        aabb_surfaces['left'] = [surface]
-
-                    # check top collider (y coordinates)
-                    if surface.collider[1] == aabb_surfaces['top'][0].collider[
-                            1]:
-                        aabb_surfaces['top'].append(surface)
-                    elif surface.collider[1] > aabb_surfaces['top'][0].collider[
-                            1]:
-                        aabb_surfaces['top'] = [surface]
-
-                    # check bottom collider (y coordinates)
-                    if surface.collider[1] == aabb_surfaces['bottom'][
-                            0].collider[1]:
-                        aabb_surfaces['bottom'].append(surface)
-                    elif surface.collider[1] < aabb_surfaces['bottom'][
-                            0].collider[1]:
-                        aabb_surfaces['bottom'] = [surface]
-
-                    # check front collider (z coordinates)
-                    if surface.collider[2] == aabb_surfaces['front'][
-                            0].collider[2]:
-                        aabb_surfaces['front'].append(surface)
-                    elif surface.collider[2] > aabb_surfaces['front'][
-                            0].collider[2]:
-                        aabb_surfaces['front'] = [surface]
-
-                    # check back collider (z coordinates)
-                    if surface.collider[2] == aabb_surfaces['back'][0].collider[
-                            2]:
-                        aabb_surfaces['back'].append(surface)
-                    elif surface.collider[2] < aabb_surfaces['back'][
-                            0].collider[2]:
-                        aabb_surfaces['back'] = [surface]
-                new_mesh.aabb.closest_surfaces = aabb_surfaces
-                objects[new_mesh.name] = new_mesh
-        if i < len(obj_lines):
-            i += 1
+                n_vertices = len(coords) // 3
+                for t in line[2:].split()[:3]:
+                    index = int(t.split('/')[0])
+                    if index < 0:
+                        # negative index is relative to the last vertex
+                        index += vertex_offset + n_vertices + 1
+                    index -= vertex_offset + 1
+                    if index < 0 or index >= n_vertices:
+                        raise ValueError(
+                            "face of mesh '" + new_mesh.name +
+                            "' references a vertex of another mesh.")
+                    faces.append(index)
+            elif line.startswith('o '):
+                # we have a new object
+                if new_mesh is not None:
+                    _finish_mesh(new_mesh, coords, faces, dtype,
+                                 side_tolerance)
+                    yield new_mesh
+                vertex_offset += len(coords) // 3
+                coords = array.array('d')
+                faces = array.array('i')
+                new_mesh = Mesh()
+                new_mesh.name = line[2:].rstrip('\r\n')
+            elif line.startswith('usemtl') and new_mesh is not None:
+                if not mtl_colors:
+                    raise ValueError(
+                        "mtl color specified but mtl file does not exist.")
+                c = mtl_colors[line[7:].rstrip('\r\n')]
+                new_mesh.color = [float(c[0]), float(c[1]), float(c[2])]
+                new_mesh.aabb.color = [float(c[0]), float(c[1]), float(c[2])]
+
+    if new_mesh is not None:
+        _finish_mesh(new_mesh, coords, faces, dtype, side_tolerance)
+        yield new_mesh
+
 
+def read_obj_file(obj_file_path,
+                  dtype=np.float64,
+                  side_tolerance=SIDE_TOLERANCE):
+    """
+    Reads OBJ file, creates Mesh object for each mesh in the file. Also, while
+    parsing the file it calculates and creates AABB. Geometry of all meshes
+    is stored in one SceneArrays instance and the meshes are views into it.
+
+    Args:
+        obj_file_path(str): File path to the .obj file.
+        dtype(numpy.dtype): Optional. float32 or float64 (default) type of
+            vertex coordinates.
+        side_tolerance(float): Optional. Tolerance used to find the closest
+            surfaces to the AABB sides. See find_closest_surfaces.
+
+    Returns:
+        A dict of Mest objects where the key is the name of the mesh and value
+            is Mesh object.
+    """
+    objects = {}
+    for new_mesh in iter_obj_meshes(
+            obj_file_path, dtype=dtype, side_tolerance=side_tolerance):
+        objects[new_mesh.name] = new_mesh
+    SceneArrays.concatenate(objects.values())
     return objects
+
+
+def find_closest_surfaces(colliders, tolerance=SIDE_TOLERANCE):
+    """
+    Finds surfaces that are the closest to each side of the AABB. A surface
+    belongs to a side if its collider is within the tolerance from the most
+    extreme collider in the direction of the side.
+
+    Args:
+        colliders(numpy.ndarray): (F, 3) array of surface colliders.
+        tolerance(float): Optional. Max distance (no units) of a collider from
+            the most extreme collider along the side axis.
+
+    Returns:
+        A dict where the key is the side name and value is an array of indices
+            into colliders.
+    """
+    closest_surfaces = {}
+    for side, (axis, direction) in AABB_SIDES.items():
+        if len(colliders) == 0:
+            closest_surfaces[side] = np.zeros(0, dtype=np.int64)
+            continue
+        # distance of the colliders from the most extreme one along the axis
+        coords = colliders[:, axis] * direction
+        extreme = coords[np.argmax(coords)]
+        closest_surfaces[side] = np.flatnonzero(coords >= extreme - tolerance)
+    return closest_surfaces
+
+
+def _finish_mesh(new_mesh, coords, faces, dtype, side_tolerance):
+    """
+    Binds a parsed mesh to its own SceneArrays and calculates AABB, surface
+    colliders and closest surfaces.
+
+    Args:
+        new_mesh(Mesh): The parsed mesh.
+        coords(array.array): Flat x,y,z coordinates of the mesh vertices.
+        faces(array.array): Flat vertex indices of the mesh triangles.
+        dtype(numpy.dtype): Type of vertex coordinates.
+        side_tolerance(float): Tolerance for find_closest_surfaces.
+    """
+    vertices = np.array(coords, dtype=dtype).reshape(-1, 3)
+    scene_arrays = SceneArrays(vertices, np.array(faces, dtype=np.int32),
+                               [new_mesh.name], [0, len(vertices)],
+                               [0, len(faces) // 3])
+    new_mesh.bind(scene_arrays, 0)
+
+    # find Axis Aligned bounding box for the object.
+    if len(vertices):
+        min_vertices = vertices.min(axis=0).tolist()
+        max_vertices = vertices.max(axis=0).tolist()
+    else:
+        min_vertices = [float('+Infinity')] * 3
+        max_vertices = [float('-Infinity')] * 3
+    new_mesh.aabb.half_size = [
+        abs(min_vertices[i] - max_vertices[i]) / 2 for i in range(3)
+    ]
+    new_mesh.aabb.pos = [
+        stat.mean([min_vertices[i], max_vertices[i]]) for i in range(3)
+    ]
+
+    # surface collider is the centroid of the surface
+    faces = scene_arrays.faces
+    scene_arrays.colliders[:] = (vertices[faces[:, 0]] + vertices[faces[:, 1]]
+                                 + vertices[faces[:, 2]]) / 3
+
+    # find colliders associated with aabb sides
+    aabb_surfaces = {}
+    for side, indices in find_closest_surfaces(scene_arrays.colliders,
+                                               side_tolerance).items():
+        aabb_surfaces[side] = [
+            Surface([], scene_arrays=scene_arrays, index=int(index))
+            for index in indices
+        ]
+    new_mesh.aabb.closest_surfaces = aabb_surfaces
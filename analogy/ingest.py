@@ -0,0 +1,171 @@
+import concurrent.futures
+import os
+import time
+
+import analogy.file_parsers as file_parsers
+from analogy import scene_analysis
+from analogy.collision_detection import scene_collision
+from analogy.storage import scene_cache
+
+
+class IngestResult:
+    """
+    IngestResult holds the outcome of the ingestion of one scene file.
+
+    Attributes:
+        obj_file_path(str): File path to the .obj file.
+        scene(dict): A dict of analysed Mesh objects. None if the ingestion
+            failed.
+        entry_path(str): Path of the scene cache entry or None if the cache
+            is not used.
+        cached(bool): True if the scene was already in the cache.
+        parse_time(float): Time in seconds spent parsing the file.
+        analysis_time(float): Time in seconds spent in collision analysis.
+        total_time(float): Time in seconds spent on the file in the worker.
+        n_meshes(int): Number of meshes in the scene.
+        n_surfaces(int): Number of surfaces in the scene.
+        error(str): Error message if the ingestion failed, otherwise None.
+    """
+
+    def __init__(self, obj_file_path):
+        """
+        Init IngestResult
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+        """
+        self.obj_file_path = obj_file_path
+        self.scene = None
+        self.entry_path = None
+        self.cached = False
+        self.parse_time = .0
+        self.analysis_time = .0
+        self.total_time = .0
+        self.n_meshes = 0
+        self.n_surfaces = 0
+        self.error = None
+
+
+def find_scene_files(paths):
+    """
+    Expands directories to the .obj files they contain.
+
+    Args:
+        paths(list): A list of .obj files and directories.
+
+    Returns:
+        A sorted list of .obj file paths.
+    """
+    obj_file_paths = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in os.listdir(path):
+                if file_name.endswith('.obj'):
+                    obj_file_paths.add(os.path.join(path, file_name))
+        elif path.endswith('.obj'):
+            obj_file_paths.add(path)
+        else:
+            raise TypeError('Supports only .obj files and directories.')
+    return sorted(obj_file_paths)
+
+
+def ingest_scene(obj_file_path,
+                 min_distance,
+                 cache_dir=None,
+                 contact_mode='centroid'):
+    """
+    Parses and analyses one scene file. If the cache is used, the analysed
+    scene is stored there and only the entry path is returned, so the result
+    is cheap to send between processes.
+
+    Args:
+        obj_file_path(str): File path to the .obj file.
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        cache_dir(str): Optional. Directory of the scene cache. The cache is
+            not used by default.
+        contact_mode(str): Optional. Contact mode of the collision detection,
+            'centroid' (default) or 'exact'.
+
+    Returns:
+        IngestResult of the scene.
+    """
+    result = IngestResult(obj_file_path)
+    start = time.perf_counter()
+    try:
+        cache = None
+        scene = None
+        if cache_dir is not None:
+            cache = scene_cache.SceneCache(cache_dir)
+            scene = cache.load(obj_file_path, min_distance, contact_mode)
+            result.cached = scene is not None
+        if scene is None:
+            scene = file_parsers.read_obj_file(obj_file_path)
+            result.parse_time = time.perf_counter() - start
+            scene_collision.analyse_scene(scene, min_distance, contact_mode)
+            result.analysis_time = (time.perf_counter() - start -
+                                    result.parse_time)
+        if cache is not None:
+            result.entry_path = cache.store(obj_file_path, min_distance, scene,
+                                            contact_mode)
+        else:
+            result.scene = scene
+        result.n_meshes = len(scene)
+        result.n_surfaces = sum(len(mesh.surfaces) for mesh in scene.values())
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        result.error = type(e).__name__ + ': ' + str(e)
+    result.total_time = time.perf_counter() - start
+    return result
+
+
+def ingest_scenes(paths,
+                  min_distance=scene_analysis.MIN_DISTANCE,
+                  workers=None,
+                  cache_dir=scene_cache.DEFAULT_CACHE_DIR,
+                  contact_mode='centroid'):
+    """
+    Parses and analyses many scene files in parallel in a pool of processes.
+    The biggest files are submitted first, so the work is well balanced
+    between the workers.
+
+    Args:
+        paths(list): A list of .obj files and directories with .obj files.
+        min_distance(float): Optional. minimum distance (no units) that has
+            to be between the meshes. Default scene_analysis.MIN_DISTANCE.
+        workers(int): Optional. Number of worker processes. Default is the
+            number of CPUs.
+        cache_dir(str): Optional. Directory of the scene cache. Workers store
+            the scenes there and the results map them from the cache without
+            copying. If None, scenes are sent back pickled.
+        contact_mode(str): Optional. Contact mode of the collision detection,
+            'centroid' (default) or 'exact'.
+
+    Returns:
+        A list of IngestResult in the order of the sorted file paths.
+    """
+    obj_file_paths = find_scene_files(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(obj_file_paths)))
+
+    results = {}
+    if workers == 1:
+        for obj_file_path in obj_file_paths:
+            results[obj_file_path] = ingest_scene(obj_file_path, min_distance,
+                                                  cache_dir, contact_mode)
+    else:
+        by_size = sorted(obj_file_paths, key=os.path.getsize, reverse=True)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(ingest_scene, obj_file_path, min_distance,
+                                cache_dir, contact_mode)
+                for obj_file_path in by_size
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                results[result.obj_file_path] = result
+
+    for result in results.values():
+        if result.entry_path is not None:
+            result.scene = scene_cache.read_entry(result.entry_path)
+    return [results[obj_file_path] for obj_file_path in obj_file_paths]
@@ -1,10 +1,55 @@
 import heapq
 import operator
 
-import vpython
+import numpy as np
 
 from analogy.mesh import AABB
 
+# Order of the sides in the permutation tables and collided sides arrays.
+SIDES = ('top', 'bottom', 'front', 'back', 'right', 'left')
+# collision match weights
+EXACT_COLLISION_WEIGHT = 0.99  #0.9
+PARTIAL_COLLISION_WEIGHT = 0.5  #0.4
+NO_COLLISION_MATCH_WEIGHT = .0  #-0.1
+# surface match weights in the order of SIDES
+SURFACE_MATCH_WEIGHTS = (
+    .02,  # top 0.1
+    .02,  # bottom 0.1
+    .01,  # front 0.01
+    .01,  # back 0.01
+    .01,  # right 0.01
+    .01,  # left 0.01
+)
+NO_SURF_MATCH_WEIGHT = .0  #-0.01
+# surface ratio difference penalties
+XY_RATIO_WEIGHT = 0.1
+ZY_RATIO_WEIGHT = 0.1
+XZ_RATIO_WEIGHT = 0.1
+# Names of the items of a weights vector. The default weights vector is
+# made from the weights above.
+WEIGHT_NAMES = (
+    ('exact_collision', 'partial_collision', 'no_collision_match') +
+    tuple('surface_match_' + side for side in SIDES) +
+    ('no_surface_match', 'xy_ratio', 'zy_ratio', 'xz_ratio'))
+DEFAULT_WEIGHTS = ((EXACT_COLLISION_WEIGHT, PARTIAL_COLLISION_WEIGHT,
+                    NO_COLLISION_MATCH_WEIGHT) + SURFACE_MATCH_WEIGHTS +
+                   (NO_SURF_MATCH_WEIGHT, XY_RATIO_WEIGHT, ZY_RATIO_WEIGHT,
+                    XZ_RATIO_WEIGHT))
+# Parts of a weights vector.
+COLLISION_WEIGHTS = slice(0, 3)
+SURFACE_WEIGHTS = slice(3, 3 + len(SIDES))
+NO_SURFACE_WEIGHT = 3 + len(SIDES)
+RATIO_WEIGHTS = slice(4 + len(SIDES), 7 + len(SIDES))
+# Number of all combinations of collided sides (0, 1 or 2 for each side).
+N_SIGNATURES = 3**len(SIDES)
+# Number of knowledge base entries scored at once by the batch methods.
+SCORE_CHUNK_SIZE = 4096
+# rotations by -90 degrees along X and Y axis as integer matrices
+ROTATION_MATRICES = {
+    'x': np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]]),
+    'y': np.array([[0, 0, -1], [0, 1, 0], [1, 0, 0]]),
+}
+
 
 class Mapping:
     """
@@ -17,10 +62,32 @@ class Mapping:
         permutations_tuple(tuple): Permutation sequences for a cube.
         all_permutations(dict): Dict of all permutation sequences where key is
             the sequence and vlue is dict of surface mappings.
+        side_permutations(numpy.ndarray): (24, 6) int array. Row k holds
+            indices into SIDES of the surfaces that the surfaces of the k-th
+            sequence are mapped to.
+        axis_permutations(numpy.ndarray): (24, 3) int array. Row k holds the
+            axis that becomes x, y and z after the k-th sequence is applied
+            backwards (rotations by -90 degrees in reversed order).
+        axis_signs(numpy.ndarray): (24, 3) array of 1 and -1 signs of the
+            axes in axis_permutations.
+        weights(numpy.ndarray): Weights of the score in the order of
+            WEIGHT_NAMES.
     """
 
-    def __init__(self):
-        """Init Mapping with all permutations of cuboid surfaces."""
+    def __init__(self, weights=None):
+        """
+        Init Mapping with all permutations of cuboid surfaces.
+
+        Args:
+            weights(list): Optional. Weights of the score in the order of
+                WEIGHT_NAMES. Default DEFAULT_WEIGHTS.
+        """
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+        self.weights = np.array(weights, dtype=np.float64).reshape(-1)
+        if len(self.weights) != len(WEIGHT_NAMES):
+            raise ValueError('weights has to have ' + str(len(WEIGHT_NAMES)) +
+                             ' items.')
         # clockwise rotation
         self.mapping_sides = {
             'x': ['top', 'back', 'bottom', 'front'],
@@ -39,6 +106,12 @@ class Mapping:
                             ('x', 'y', 'y', 'y', 'x'))
         # yapf: enable
         self.all_permutations = self.create_permutations()
+        self.side_permutations, self.axis_permutations, self.axis_signs = (
+            self.create_permutation_tables())
+        # scores for surface match of each sequence and surface
+        self.surface_match_scores = np.where(
+            self.side_permutations == np.arange(len(SIDES)),
+            self.weights[SURFACE_WEIGHTS], self.weights[NO_SURFACE_WEIGHT])
 
     def create_permutations(self):
         """
@@ -78,6 +151,35 @@ class Mapping:
             permutations[permutation] = sides
         return permutations
 
+    def create_permutation_tables(self):
+        """
+        Creates integer tables of all permutation sequences. All of them are
+        rotations of a cube, so they only permute the sides and the axes.
+
+        Returns:
+            Tuple of side_permutations, axis_permutations and axis_signs
+            arrays in the order of permutations_tuple.
+        """
+        side_permutations = np.array(
+            [[
+                SIDES.index(self.all_permutations[permutation][side])
+                for side in SIDES
+            ]
+             for permutation in self.permutations_tuple],
+            dtype=np.intp)
+        axis_permutations = []
+        axis_signs = []
+        for permutation in self.permutations_tuple:
+            matrix = np.eye(3, dtype=int)
+            for rotation in reversed(permutation):
+                if rotation in ROTATION_MATRICES:
+                    matrix = ROTATION_MATRICES[rotation] @ matrix
+            axis_permutations.append(np.abs(matrix).argmax(axis=1))
+            axis_signs.append(matrix.sum(axis=1))
+        return (side_permutations, np.array(axis_permutations,
+                                            dtype=np.intp),
+                np.array(axis_signs, dtype=int))
+
     def get_mappings_score(self, target_aabb, source_aabb):
         """
         Returns analogy scores for all mappings of two AABB objects.
@@ -91,99 +193,307 @@ class Mapping:
             objects based on collided sides simmilarity, ratio of AABBs, 
             matching surfaces.
         """
-        # collision match weights
-        exact_collision_weight = 0.99  #0.9
-        partial_collision_weight = 0.5  #0.4
-        no_collision_match_weight = .0  #-0.1
-        # surface match weights
-        top_match_weight = .02  #0.1
-        bottom_match_weight = .02  #0.1
-        front_match_weight = .01  #0.01
-        back_match_weight = .01  #0.01
-        right_match_weight = .01  #0.01
-        left_match_weight = .01  #0.01
-        no_surf_match_weight = .0  #-0.01
-        # surface ratio difference penalties
-        xy_ratio_weight = 0.1
-        zy_ratio_weight = 0.1
-        xz_ratio_weight = 0.1
-
-        mappings_score = []
-        for perm_sequence in self.all_permutations.keys():
-            score = 1.0  # default score
-            for surface in self.all_permutations[perm_sequence].keys():
-                # scores for exact collision/partial/no-collision match
-                if target_aabb.collided_sides[
-                        surface] == source_aabb.collided_sides[
-                            self.all_permutations[perm_sequence][surface]]:
-                    score += 1.0 * exact_collision_weight
-                # match partially collided sides and fully collided sides
-                elif target_aabb.collided_sides[
-                        surface] != 0 and source_aabb.collided_sides[
-                            self.all_permutations[perm_sequence][surface]] != 0:
-                    score += 1.0 * partial_collision_weight
-                else:  # there is no match
-                    score += 1.0 * no_collision_match_weight
-
-                # score for surface match
-                if (surface == 'top' and
-                        self.all_permutations[perm_sequence][surface] == 'top'):
-                    score += 1.0 * top_match_weight
-                elif (surface == 'bottom' and
-                      self.all_permutations[perm_sequence][surface] == 'bottom'
-                     ):
-                    score += 1.0 * bottom_match_weight
-                elif (surface == 'front' and
-                      self.all_permutations[perm_sequence][surface] == 'front'):
-                    score += 1.0 * front_match_weight
-                elif (surface == 'back' and
-                      self.all_permutations[perm_sequence][surface] == 'back'):
-                    score += 1.0 * back_match_weight
-                elif (surface == 'right' and
-                      self.all_permutations[perm_sequence][surface] == 'right'):
-                    score += 1.0 * right_match_weight
-                elif (surface == 'left' and
-                      self.all_permutations[perm_sequence][surface] == 'left'):
-                    score += 1.0 * left_match_weight
-                else:
-                    score += 1.0 * no_surf_match_weight
-            # create vpython vec for xyz half size of the target object
-            vpython_vec_xyz = vpython.vec(target_aabb.half_size[0],
-                                          target_aabb.half_size[1],
-                                          target_aabb.half_size[2])
-            # rotate it based on rotation sequence
-            for rotation in reversed(perm_sequence):
-                if rotation == 'x':
-                    vpython_vec_xyz = vpython.rotate(
-                        vpython_vec_xyz,
-                        angle=vpython.radians(-90),
-                        axis=vpython.vec(1, 0, 0))
-                elif rotation == 'y':
-                    vpython_vec_xyz = vpython.rotate(
-                        vpython_vec_xyz,
-                        angle=vpython.radians(-90),
-                        axis=vpython.vec(0, 1, 0))
-            # compare xy, zy, xz ratios of target and source aabbs after rotation
-            # and penalise for difference
-            xy_ratio_diff = abs(
-                (abs(vpython_vec_xyz.x) / abs(vpython_vec_xyz.y)) -
-                (source_aabb.half_size[0] / source_aabb.half_size[1]))
-            xy_ratio_diff *= xy_ratio_weight
-            zy_ratio_diff = abs(
-                (abs(vpython_vec_xyz.z) / abs(vpython_vec_xyz.y)) -
-                (source_aabb.half_size[2] / source_aabb.half_size[1]))
-            zy_ratio_diff *= zy_ratio_weight
-            xz_ratio_diff = abs(
-                (abs(vpython_vec_xyz.x) / abs(vpython_vec_xyz.z)) -
-                (source_aabb.half_size[0] / source_aabb.half_size[2]))
-            xz_ratio_diff *= xz_ratio_weight
-            sum_ratio_diff = xy_ratio_diff + zy_ratio_diff + xz_ratio_diff
-
-            # penalise for ratio difference
-            score -= sum_ratio_diff
-
-            mappings_score.append((score, perm_sequence))
-        return mappings_score
+        scores = self.get_scores_array(target_aabb, source_aabb)
+        return list(zip(scores.tolist(), self.permutations_tuple))
+
+    def get_scores_array(self, target_aabb, source_aabb):
+        """
+        Returns analogy scores for all mappings of two AABB objects as an
+        array. All 24 sequences are scored at once with the permutation
+        tables.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+            source_aabb(AABB): The source AABB that from source scene.
+
+        Returns:
+            (24,) array of scores in the order of permutations_tuple.
+        """
+        target_sides = np.array(
+            [target_aabb.collided_sides[side] for side in SIDES])
+        source_sides = np.array(
+            [source_aabb.collided_sides[side] for side in SIDES])
+        # collided sides of the source surface each target surface maps to
+        mapped_sides = source_sides[self.side_permutations]
+        # scores for exact collision/partial/no-collision match
+        exact_weight, partial_weight, no_match_weight = (
+            self.weights[COLLISION_WEIGHTS].tolist())
+        collision_scores = np.where(
+            target_sides == mapped_sides, exact_weight,
+            np.where((target_sides != 0) & (mapped_sides != 0),
+                     partial_weight, no_match_weight))
+
+        # default score 1.0 and the scores surface by surface. cumsum adds
+        # them one by one, so the sums are the same as in a loop.
+        terms = np.empty((len(self.permutations_tuple), 1 + 2 * len(SIDES)))
+        terms[:, 0] = 1.0
+        terms[:, 1::2] = collision_scores
+        terms[:, 2::2] = self.surface_match_scores
+        scores = np.cumsum(terms, axis=1)[:, -1]
+
+        # half size of the target after rotation
+        half_size = np.abs(
+            np.asarray(target_aabb.half_size,
+                       dtype=np.float64))[self.axis_permutations]
+        source_half_size = source_aabb.half_size
+        xy_weight, zy_weight, xz_weight = self.weights[RATIO_WEIGHTS].tolist()
+        # compare xy, zy, xz ratios of target and source aabbs after rotation
+        # and penalise for difference
+        xy_ratio_diff = np.abs(half_size[:, 0] / half_size[:, 1] -
+                               (source_half_size[0] / source_half_size[1]))
+        xy_ratio_diff *= xy_weight
+        zy_ratio_diff = np.abs(half_size[:, 2] / half_size[:, 1] -
+                               (source_half_size[2] / source_half_size[1]))
+        zy_ratio_diff *= zy_weight
+        xz_ratio_diff = np.abs(half_size[:, 0] / half_size[:, 2] -
+                               (source_half_size[0] / source_half_size[2]))
+        xz_ratio_diff *= xz_weight
+        sum_ratio_diff = xy_ratio_diff + zy_ratio_diff + xz_ratio_diff
+
+        # penalise for ratio difference
+        scores -= sum_ratio_diff
+        return scores
+
+    def get_scores_matrix(self,
+                          target_aabb,
+                          source_sides,
+                          source_half_sizes,
+                          chunk_size=SCORE_CHUNK_SIZE):
+        """
+        Returns analogy scores of the target AABB against many source AABBs
+        for all mappings. The scores are the same as from get_scores_array.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+            source_sides(numpy.ndarray): (N, 6) collided sides of the source
+                AABBs in the order of SIDES.
+            source_half_sizes(numpy.ndarray): (N, 3) half sizes of the
+                source AABBs.
+            chunk_size(int): Optional. Number of source AABBs scored at once.
+
+        Returns:
+            (N, 24) array of scores. Columns are in the order of
+            permutations_tuple.
+        """
+        source_sides = np.asarray(source_sides).reshape(-1, len(SIDES))
+        scores = np.empty((len(source_sides), len(self.permutations_tuple)))
+        for start, stop, chunk_scores in self._score_chunks(
+                target_aabb, source_sides, source_half_sizes, chunk_size):
+            scores[start:stop] = chunk_scores
+        return scores
+
+    def get_top_mappings(self,
+                         target_aabb,
+                         source_sides,
+                         source_half_sizes,
+                         k,
+                         chunk_size=SCORE_CHUNK_SIZE):
+        """
+        Returns the k best (source AABB, mapping) pairs. Only the best k pairs
+        of the chunks scored so far are kept, so the memory does not grow
+        with the number of source AABBs.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+            source_sides(numpy.ndarray): (N, 6) collided sides of the source
+                AABBs in the order of SIDES.
+            source_half_sizes(numpy.ndarray): (N, 3) half sizes of the
+                source AABBs.
+            k(int): Number of pairs to return.
+            chunk_size(int): Optional. Number of source AABBs scored at once.
+
+        Returns:
+            A list of (score, index of the source AABB, sequence) tuples
+            sorted by the highest score. Equal scores are sorted by the index
+            and the order of permutations_tuple.
+        """
+        if k <= 0:
+            return []
+        n_perms = len(self.permutations_tuple)
+        best_scores = np.zeros(0)
+        best_pairs = np.zeros(0, dtype=np.int64)
+        for start, _, chunk_scores in self._score_chunks(
+                target_aabb, source_sides, source_half_sizes, chunk_size):
+            chunk_scores = chunk_scores.reshape(-1)
+            chunk_pairs = np.arange(len(chunk_scores)) + start * n_perms
+            if len(chunk_scores) > k:
+                keep = np.argpartition(-chunk_scores, k - 1)[:k]
+                chunk_scores = chunk_scores[keep]
+                chunk_pairs = chunk_pairs[keep]
+            best_scores = np.concatenate([best_scores, chunk_scores])
+            best_pairs = np.concatenate([best_pairs, chunk_pairs])
+            order = np.lexsort((best_pairs, -best_scores))[:k]
+            best_scores = best_scores[order]
+            best_pairs = best_pairs[order]
+        return [(score, pair // n_perms,
+                 self.permutations_tuple[pair % n_perms])
+                for score, pair in zip(best_scores.tolist(),
+                                       best_pairs.tolist())]
+
+    def get_match_scores(self, target_aabb):
+        """
+        Returns the collision and surface match part of the scores. It only
+        depends on the mapping and the collided sides of the source that the
+        target sides map to, so it is computed once for each of the 3^6
+        combinations. The additions are done in the same order as in
+        get_scores_array.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+
+        Returns:
+            (24, 729) array. Item [k, code] is the score of the k-th sequence
+            before the ratio penalty, where code is sides_codes of the
+            mapped collided sides of the source.
+        """
+        target_sides = np.array(
+            [target_aabb.collided_sides[side] for side in SIDES])
+        combinations = sides_from_codes(np.arange(N_SIGNATURES))
+        exact_weight, partial_weight, no_match_weight = (
+            self.weights[COLLISION_WEIGHTS].tolist())
+        collision_scores = np.where(
+            target_sides == combinations, exact_weight,
+            np.where((target_sides != 0) & (combinations != 0),
+                     partial_weight, no_match_weight))
+        terms = np.empty(
+            (len(self.permutations_tuple), N_SIGNATURES, 1 + 2 * len(SIDES)))
+        terms[:, :, 0] = 1.0
+        terms[:, :, 1::2] = collision_scores[np.newaxis]
+        terms[:, :, 2::2] = self.surface_match_scores[:, np.newaxis]
+        return np.cumsum(terms, axis=2)[:, :, -1]
+
+    def get_target_ratios(self, target_aabb):
+        """
+        Returns xy, zy and xz ratios of the target AABB after each mapping.
+        The ratio penalty of a mapping is the weighted L1 distance between
+        these ratios and the ratios of the source, see half_size_ratios.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+
+        Returns:
+            (24, 3) array in the order of permutations_tuple.
+        """
+        half_size = np.abs(
+            np.asarray(target_aabb.half_size,
+                       dtype=np.float64))[self.axis_permutations]
+        return half_size_ratios(half_size)
+
+    def get_canonical_signatures(self, sides):
+        """
+        Returns rotation canonical signatures of collided sides. All collided
+        sides that are rotations of each other have the same signature, that
+        is the smallest code of all their rotations.
+
+        Args:
+            sides(numpy.ndarray): (N, 6) collided sides in the order of SIDES.
+
+        Returns:
+            Tuple of (N,) signatures and (N,) indices into permutations_tuple
+            of the sequence that maps the collided sides to the signature.
+        """
+        sides = np.asarray(sides, dtype=np.intp).reshape(-1, len(SIDES))
+        codes = sides_codes(sides[:, self.side_permutations])
+        rotations = codes.argmin(axis=1)
+        return codes[np.arange(len(codes)), rotations], rotations
+
+    def get_signature_bounds(self, target_aabb, signatures):
+        """
+        Returns upper bounds of the scores of the target against any source
+        AABB with the signature. The ratio penalty is not negative for
+        non-negative ratio weights, so no score of a source with the
+        signature is higher than its bound.
+
+        Args:
+            target_aabb(AABB): The target AABB that we want to map to source AABB.
+            signatures(list): Canonical signatures.
+
+        Returns:
+            Array of upper bounds of the scores in the order of signatures.
+        """
+        best_match = self.get_match_scores(target_aabb).max(axis=0)
+        sides = sides_from_codes(np.asarray(signatures, dtype=np.intp))
+        # all rotations of the signatures
+        orbits = sides_codes(sides[:, self.side_permutations])
+        return best_match[orbits].max(axis=1)
+
+    def _score_chunks(self, target_aabb, source_sides, source_half_sizes,
+                      chunk_size):
+        """
+        Yields (start, stop, scores) for chunks of the source AABBs.
+        """
+        source_sides = np.asarray(source_sides,
+                                  dtype=np.intp).reshape(-1, len(SIDES))
+        source_half_sizes = np.asarray(source_half_sizes,
+                                       dtype=np.float64).reshape(-1, 3)
+        n_perms = len(self.permutations_tuple)
+        match_scores = self.get_match_scores(target_aabb)
+        target_ratios = self.get_target_ratios(target_aabb)
+        xy_weight, zy_weight, xz_weight = self.weights[RATIO_WEIGHTS].tolist()
+        chunk_size = max(1, int(chunk_size))
+        for start in range(0, len(source_sides), chunk_size):
+            stop = min(start + chunk_size, len(source_sides))
+            codes = sides_codes(
+                source_sides[start:stop][:, self.side_permutations])
+            scores = match_scores[np.arange(n_perms), codes]
+            half = source_half_sizes[start:stop]
+            xy_ratio_diff = np.abs(target_ratios[:, 0] -
+                                   (half[:, 0] / half[:, 1])[:, np.newaxis])
+            xy_ratio_diff *= xy_weight
+            zy_ratio_diff = np.abs(target_ratios[:, 1] -
+                                   (half[:, 2] / half[:, 1])[:, np.newaxis])
+            zy_ratio_diff *= zy_weight
+            xz_ratio_diff = np.abs(target_ratios[:, 2] -
+                                   (half[:, 0] / half[:, 2])[:, np.newaxis])
+            xz_ratio_diff *= xz_weight
+            scores -= xy_ratio_diff + zy_ratio_diff + xz_ratio_diff
+            yield start, stop, scores
+
+
+def half_size_ratios(half_sizes):
+    """
+    Returns xy, zy and xz ratios of half sizes.
+
+    Args:
+        half_sizes(numpy.ndarray): (N, 3) half sizes.
+
+    Returns:
+        (N, 3) array of ratios.
+    """
+    half_sizes = np.asarray(half_sizes, dtype=np.float64).reshape(-1, 3)
+    return np.stack([
+        half_sizes[:, 0] / half_sizes[:, 1],
+        half_sizes[:, 2] / half_sizes[:, 1],
+        half_sizes[:, 0] / half_sizes[:, 2],
+    ],
+                    axis=1)
+
+
+def sides_codes(sides):
+    """
+    Encodes collided sides as integers. Side i is the i-th base 3 digit.
+
+    Args:
+        sides(numpy.ndarray): (..., 6) collided sides in the order of SIDES.
+
+    Returns:
+        (...) array of codes from 0 to 728.
+    """
+    return np.asarray(sides, dtype=np.intp) @ (3**np.arange(len(SIDES)))
+
+
+def sides_from_codes(codes):
+    """
+    Decodes collided sides from codes of sides_codes.
+
+    Args:
+        codes(numpy.ndarray): (N,) codes.
+
+    Returns:
+        (N, 6) collided sides in the order of SIDES.
+    """
+    codes = np.asarray(codes, dtype=np.intp).reshape(-1, 1)
+    return codes // (3**np.arange(len(SIDES))) % 3
 
 
 if __name__ == '__main__':
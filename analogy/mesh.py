@@ -1,3 +1,180 @@
+import collections.abc
+
+import numpy as np
+
+
+class SceneArrays:
+    """
+    SceneArrays is a structure-of-arrays representation of the geometry of a
+    scene. All vertices and triangles of all meshes are stored in contiguous
+    NumPy arrays and Mesh, Surface and Vertex objects are lightweight views
+    into them.
+
+    Attributes:
+        vertices(numpy.ndarray): (V, 3) float32 or float64 array of vertex
+            coordinates.
+        faces(numpy.ndarray): (F, 3) int32 array of indices into vertices.
+            Each row is one triangle.
+        colliders(numpy.ndarray): (F, 3) array of surface colliders (centroids
+            of the triangles).
+        collision(numpy.ndarray): (F,) bool array of surface collision flags.
+        collided_objects(dict): Dict where the key is a face index and value
+            is a dict of all names of meshes that the surface collides with.
+        mesh_names(list): A list of mesh names in the order of the meshes.
+        vertex_offsets(numpy.ndarray): (M + 1,) array. Vertices of mesh i are
+            vertices[vertex_offsets[i]:vertex_offsets[i + 1]].
+        face_offsets(numpy.ndarray): (M + 1,) array. Faces of mesh i are
+            faces[face_offsets[i]:face_offsets[i + 1]].
+    """
+
+    def __init__(self,
+                 vertices,
+                 faces,
+                 mesh_names,
+                 vertex_offsets,
+                 face_offsets,
+                 colliders=None,
+                 collision=None):
+        """
+        Init SceneArrays
+
+        Args:
+            vertices(numpy.ndarray): (V, 3) array of vertex coordinates.
+            faces(numpy.ndarray): (F, 3) array of indices into vertices.
+            mesh_names(list): A list of mesh names.
+            vertex_offsets(list): M + 1 offsets of mesh vertices.
+            face_offsets(list): M + 1 offsets of mesh faces.
+            colliders(numpy.ndarray): Optional. (F, 3) array of surface
+                colliders. Zeros by default.
+            collision(numpy.ndarray): Optional. (F,) bool array of surface
+                collision flags. False by default.
+        """
+        self.vertices = vertices
+        self.faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+        if colliders is None:
+            colliders = np.zeros((len(self.faces), 3), dtype=vertices.dtype)
+        self.colliders = colliders
+        if collision is None:
+            collision = np.zeros(len(self.faces), dtype=bool)
+        self.collision = collision
+        self.collided_objects = {}
+        self.mesh_names = list(mesh_names)
+        self.vertex_offsets = np.asarray(vertex_offsets, dtype=np.int64)
+        self.face_offsets = np.asarray(face_offsets, dtype=np.int64)
+
+    @classmethod
+    def concatenate(cls, meshes):
+        """
+        Merges geometry of meshes into one SceneArrays instance and rebinds
+        the meshes to it.
+
+        Args:
+            meshes(list): A list of Mesh objects. Each of them has to be
+                bound to its own SceneArrays.
+
+        Returns:
+            The new SceneArrays instance.
+        """
+        meshes = list(meshes)
+        parts = [mesh.scene_arrays for mesh in meshes]
+        vertex_offsets = [0]
+        face_offsets = [0]
+        for part in parts:
+            vertex_offsets.append(vertex_offsets[-1] + len(part.vertices))
+            face_offsets.append(face_offsets[-1] + len(part.faces))
+        if parts:
+            vertices = np.concatenate([part.vertices for part in parts])
+            faces = np.concatenate([
+                part.faces + vertex_offsets[i] for i, part in enumerate(parts)
+            ])
+        else:
+            vertices = np.zeros((0, 3))
+            faces = np.zeros((0, 3), dtype=np.int32)
+        scene_arrays = cls(vertices, faces, [mesh.name for mesh in meshes],
+                           vertex_offsets, face_offsets)
+        for i, part in enumerate(parts):
+            face_range = slice(face_offsets[i], face_offsets[i + 1])
+            scene_arrays.colliders[face_range] = part.colliders
+            scene_arrays.collision[face_range] = part.collision
+            for face_index, names in part.collided_objects.items():
+                scene_arrays.collided_objects[face_offsets[i] +
+                                              face_index] = names
+            meshes[i].bind(scene_arrays, i)
+        return scene_arrays
+
+    @property
+    def nbytes(self):
+        """Number of bytes used by the arrays."""
+        return (self.vertices.nbytes + self.faces.nbytes +
+                self.colliders.nbytes + self.collision.nbytes)
+
+    def face_range(self, mesh_index):
+        """
+        Returns the slice of faces that belong to the mesh.
+
+        Args:
+            mesh_index(int): Index of the mesh.
+
+        Returns:
+            slice into faces, colliders and collision arrays.
+        """
+        return slice(int(self.face_offsets[mesh_index]),
+                     int(self.face_offsets[mesh_index + 1]))
+
+    def vertex_range(self, mesh_index):
+        """
+        Returns the slice of vertices that belong to the mesh.
+
+        Args:
+            mesh_index(int): Index of the mesh.
+
+        Returns:
+            slice into vertices array.
+        """
+        return slice(int(self.vertex_offsets[mesh_index]),
+                     int(self.vertex_offsets[mesh_index + 1]))
+
+
+class SurfaceList(collections.abc.Sequence):
+    """
+    SurfaceList is a read-only sequence of Surface views of one mesh. The
+    Surface objects are created on access, so the mesh does not hold a Python
+    object per triangle.
+
+    Attributes:
+        scene_arrays(SceneArrays): Arrays that hold the surfaces.
+        start(int): Index of the first face of the mesh.
+        stop(int): Index after the last face of the mesh.
+    """
+
+    def __init__(self, scene_arrays, start, stop):
+        """
+        Init SurfaceList
+
+        Args:
+            scene_arrays(SceneArrays): Arrays that hold the surfaces.
+            start(int): Index of the first face of the mesh.
+            stop(int): Index after the last face of the mesh.
+        """
+        self.scene_arrays = scene_arrays
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('surface index out of range')
+        return Surface([],
+                       scene_arrays=self.scene_arrays,
+                       index=self.start + i)
+
+
 class Mesh:
     """
     Mesh is a representation of a mesh in memory
@@ -5,12 +182,16 @@ class Mesh:
     Attributes:
         name(str): Name of the mesh
         surfaces(list): A list of Surfaces that belong to the mesh instance.
+            SurfaceList of views if the mesh is bound to SceneArrays.
         collision(bool): If the AABB has collision it is True.
         collided_objects(dict): Dict of all mesh names that the mesh collides
             with.
         aabb(AABB): Axis Aligned Bounding Box for the mesh
         color(list): A color of the mesh in RGB. Min value is 0.0 and max is 1.0.
             Default value is white that is [1.0, 1.0, 1.0].
+        scene_arrays(SceneArrays): Arrays that hold the geometry of the mesh.
+            None if the mesh holds its own list of surfaces.
+        index(int): Index of the mesh in scene_arrays.
     """
 
     def __init__(self):
@@ -21,6 +202,52 @@ class Mesh:
         self.collided_objects = {}
         self.aabb = AABB([], [])
         self.color = [1.0, 1.0, 1.0]
+        self.scene_arrays = None
+        self.index = None
+
+    def bind(self, scene_arrays, index):
+        """
+        Makes the mesh a view into scene arrays. Closest surfaces of the AABB
+        are moved to the new arrays as well.
+
+        Args:
+            scene_arrays(SceneArrays): Arrays that hold the geometry.
+            index(int): Index of the mesh in scene_arrays.
+        """
+        old_start = 0
+        if self.scene_arrays is not None:
+            old_start = self.scene_arrays.face_range(self.index).start
+        face_range = scene_arrays.face_range(index)
+        self.scene_arrays = scene_arrays
+        self.index = index
+        self.surfaces = SurfaceList(scene_arrays, face_range.start,
+                                    face_range.stop)
+        for side, surfaces in self.aabb.closest_surfaces.items():
+            self.aabb.closest_surfaces[side] = [
+                Surface([],
+                        scene_arrays=scene_arrays,
+                        index=surface.index - old_start + face_range.start)
+                if surface.scene_arrays is not None else surface
+                for surface in surfaces
+            ]
+
+    @property
+    def vertices(self):
+        """(V, 3) array view of the vertices of the mesh."""
+        return self.scene_arrays.vertices[self.scene_arrays.vertex_range(
+            self.index)]
+
+    @property
+    def faces(self):
+        """(F, 3) array view of the faces of the mesh (scene indices)."""
+        return self.scene_arrays.faces[self.scene_arrays.face_range(
+            self.index)]
+
+    @property
+    def colliders(self):
+        """(F, 3) array view of the surface colliders of the mesh."""
+        return self.scene_arrays.colliders[self.scene_arrays.face_range(
+            self.index)]
 
     @property
     def set_name(self, name):
@@ -49,7 +276,9 @@ class Mesh:
 
 class Surface:
     """
-    Surface is a representation of a surface in memory 
+    Surface is a representation of a surface in memory. If it is created with
+    scene_arrays, it is a view of one row of the arrays and all attributes are
+    read from and written to them.
 
     Attributes:
         vertices(list): A list of vertices that belong to the surface instance.
@@ -58,19 +287,81 @@ class Surface:
         collision(bool): If the surface has a collision it is True.
         collided_objects(dict): Dict of all names of meshes that the surface
             collides with.
+        scene_arrays(SceneArrays): Arrays that hold the surface or None.
+        index(int): Index of the face in scene_arrays.
     """
 
-    def __init__(self, vertices):
+    def __init__(self, vertices, scene_arrays=None, index=None):
         """
         Init Surface
         
         Args:
             vertices(list): A list of vertices that belong to the surface instance.
+                Ignored if scene_arrays is given.
+            scene_arrays(SceneArrays): Optional. Arrays that hold the surface.
+            index(int): Optional. Index of the face in scene_arrays.
         """
-        self.vertices = vertices
-        self.collider = []
-        self.collision = False
-        self.collided_objects = {}
+        self.scene_arrays = scene_arrays
+        self.index = index
+        if scene_arrays is None:
+            self._vertices = vertices
+            self._collider = []
+            self._collision = False
+            self._collided_objects = {}
+
+    @property
+    def vertices(self):
+        if self.scene_arrays is None:
+            return self._vertices
+        return [
+            Vertex(self.scene_arrays.vertices[i])
+            for i in self.scene_arrays.faces[self.index]
+        ]
+
+    @vertices.setter
+    def vertices(self, vertices):
+        if self.scene_arrays is not None:
+            raise AttributeError('vertices of a surface view are read-only')
+        self._vertices = vertices
+
+    @property
+    def collider(self):
+        if self.scene_arrays is None:
+            return self._collider
+        return self.scene_arrays.colliders[self.index]
+
+    @collider.setter
+    def collider(self, collider):
+        if self.scene_arrays is None:
+            self._collider = collider
+        else:
+            self.scene_arrays.colliders[self.index] = collider
+
+    @property
+    def collision(self):
+        if self.scene_arrays is None:
+            return self._collision
+        return bool(self.scene_arrays.collision[self.index])
+
+    @collision.setter
+    def collision(self, collision):
+        if self.scene_arrays is None:
+            self._collision = collision
+        else:
+            self.scene_arrays.collision[self.index] = collision
+
+    @property
+    def collided_objects(self):
+        if self.scene_arrays is None:
+            return self._collided_objects
+        return self.scene_arrays.collided_objects.setdefault(self.index, {})
+
+    @collided_objects.setter
+    def collided_objects(self, collided_objects):
+        if self.scene_arrays is None:
+            self._collided_objects = collided_objects
+        else:
+            self.scene_arrays.collided_objects[self.index] = collided_objects
 
     @property
     def set_vertices(self, vertices):
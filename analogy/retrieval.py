@@ -0,0 +1,299 @@
+import heapq
+
+import numpy as np
+
+from analogy.mapping import Mapping
+from analogy.mapping import RATIO_WEIGHTS
+from analogy.mapping import sides_codes
+from analogy.mapping import sides_from_codes
+
+# Number of the best AABBs from the knowledge base returned by the search.
+TOP_AABBS = 10
+# Number of the best sequences returned for each AABB.
+TOP_SEQUENCES = 3
+# Scores from the ratio index are rounded differently than the final scores,
+# candidates within this tolerance of the bound are kept.
+SCORE_TOLERANCE = 1e-9
+# Number of entries of a bucket scored at once by TopKSearch.
+BOUND_CHUNK_SIZE = 256
+
+
+class TopKSearch:
+    """
+    TopKSearch is a branch and bound search of the k AABBs with the highest
+    analogy scores. The collision and surface match part of a score is the
+    same for all AABBs with the same collided sides and the ratio penalty
+    only lowers it, so it is an upper bound of the score. Buckets of AABBs
+    are visited from the highest bound and AABBs in a bucket from the
+    highest bound of their own. A heap keeps the k best AABBs and buckets
+    and AABBs which bound is lower than the k-th best score are skipped
+    without scoring.
+
+    Attributes:
+        mapping(Mapping): Mapping object used for scoring.
+        target_aabb(AABB): The target AABB that we want to map to source AABB.
+        k(int): Number of AABBs to find.
+        n_sequences(int): Number of the best sequences of each AABB.
+        stats(dict): Counts of the search: 'buckets', 'pruned_buckets',
+            'rows', 'pruned_rows', 'scored_rows' and 'prune_rate', the part
+            of the rows that were not scored.
+    """
+
+    def __init__(self, mapping, target_aabb, k, n_sequences=TOP_SEQUENCES):
+        """
+        Init TopKSearch
+
+        Args:
+            mapping(Mapping): Mapping object used for scoring.
+            target_aabb(AABB): The target AABB that we want to map to source
+                AABB.
+            k(int): Number of AABBs to find.
+            n_sequences(int): Optional. Number of the best sequences of each
+                AABB. Default 3.
+        """
+        _ratio_weights(mapping)
+        self.mapping = mapping
+        self.target_aabb = target_aabb
+        self.k = k
+        self.n_sequences = n_sequences
+        self.stats = {
+            'buckets': 0,
+            'pruned_buckets': 0,
+            'rows': 0,
+            'pruned_rows': 0,
+            'scored_rows': 0,
+            'prune_rate': 0.0,
+        }
+        self._match_scores = mapping.get_match_scores(target_aabb)
+        # min heap of the k best AABBs as (score, -aabb id, best sequences)
+        self._heap = []
+
+    def threshold(self):
+        """
+        Returns the k-th best score found so far or -inf if less than k
+        AABBs were scored. AABBs with a lower bound are skipped.
+        """
+        if len(self._heap) < self.k:
+            return -np.inf
+        return self._heap[0][0]
+
+    def search(self, buckets):
+        """
+        Searches the buckets.
+
+        Args:
+            buckets(list): A list of (bound, size, load) tuples, where bound
+                is an upper bound of scores of the AABBs in the bucket, size
+                is their number and load is a function that returns a tuple
+                of ids, (N, 6) collided sides and (N, 3) half sizes of them.
+
+        Returns:
+            A list of (aabb id, top score, list of (score, sequence) tuples)
+                sorted by the highest top score. Equal scores are sorted by
+                aabb id.
+        """
+        if self.k > 0:
+            bounds = np.array([bucket[0] for bucket in buckets])
+            for i in np.argsort(-bounds, kind='stable').tolist():
+                bound, size, load = buckets[i]
+                self.stats['buckets'] += 1
+                self.stats['rows'] += size
+                if bound < self.threshold():
+                    self.stats['pruned_buckets'] += 1
+                    self.stats['pruned_rows'] += size
+                    continue
+                self._search_bucket(*load())
+        if self.stats['rows']:
+            self.stats['prune_rate'] = (self.stats['pruned_rows'] /
+                                        self.stats['rows'])
+        return self.best()
+
+    def best(self):
+        """
+        Returns the k best AABBs found so far, see search.
+        """
+        return [(-negative_id, score, top_scores)
+                for score, negative_id, top_scores in sorted(self._heap,
+                                                             reverse=True)]
+
+    def _search_bucket(self, ids, sides, half_sizes):
+        sides = np.asarray(sides, dtype=np.intp).reshape(-1, 6)
+        half_sizes = np.asarray(half_sizes, dtype=np.float64).reshape(-1, 3)
+        codes = sides_codes(sides[:, self.mapping.side_permutations])
+        bounds = self._match_scores[np.arange(codes.shape[1]),
+                                    codes].max(axis=1)
+        order = np.argsort(-bounds, kind='stable')
+        for start in range(0, len(order), BOUND_CHUNK_SIZE):
+            chunk = order[start:start + BOUND_CHUNK_SIZE]
+            # bounds are sorted, so the rest of the bucket is pruned too
+            keep = bounds[chunk] >= self.threshold()
+            self.stats['pruned_rows'] += len(chunk) - int(keep.sum())
+            chunk = chunk[keep]
+            if len(chunk) == 0:
+                self.stats['pruned_rows'] += len(order) - start - len(keep)
+                break
+            self.stats['scored_rows'] += len(chunk)
+            for aabb_id, score, top_scores in _top_sequences(
+                    self.mapping, self.target_aabb,
+                    [ids[i] for i in chunk.tolist()], sides[chunk],
+                    half_sizes[chunk], self.n_sequences):
+                item = (score, -aabb_id, top_scores)
+                if len(self._heap) < self.k:
+                    heapq.heappush(self._heap, item)
+                elif item[:2] > self._heap[0][:2]:
+                    heapq.heapreplace(self._heap, item)
+
+
+def find_best_aabbs(db,
+                    target_aabb,
+                    n_aabbs=TOP_AABBS,
+                    n_sequences=TOP_SEQUENCES,
+                    mapping=None,
+                    index=None):
+    """
+    Finds AABBs in the knowledge base with the highest analogy scores. Rows
+    of TargetAABB are grouped by the canonical signature of their collided
+    sides. Groups are visited from the highest upper bound of their scores
+    and the search stops when no AABB of the remaining groups can beat the
+    n-th best AABB found so far, so the ratio penalties of most rows are
+    never computed. The result is the same as from scoring all rows. See
+    TopKSearch.
+
+    With a ratio index, the AABBs are found by nearest neighbour queries
+    instead, see find_best_aabbs_indexed.
+
+    Args:
+        db(sqlitedb): The knowledge base database.
+        target_aabb(AABB): The target AABB that we want to map to source AABB.
+        n_aabbs(int): Optional. Number of AABBs to return. Default 10.
+        n_sequences(int): Optional. Number of the best sequences of each
+            AABB. Default 3.
+        mapping(Mapping): Optional. Mapping object used for scoring.
+        index(RatioIndex): Optional. Ratio index of the database.
+
+    Returns:
+        A list of (aabb id, top score, list of (score, sequence) tuples)
+            sorted by the highest top score, and a dict with the number of
+            'rows' and 'scored_rows', the 'prune_rate' and other counts of
+            the search.
+    """
+    if mapping is None:
+        mapping = Mapping()
+    if index is not None:
+        return find_best_aabbs_indexed(index, target_aabb, n_aabbs,
+                                       n_sequences, mapping)
+    search = TopKSearch(mapping, target_aabb, n_aabbs, n_sequences)
+    counts = db.select_signature_counts()
+    if n_aabbs <= 0 or not counts:
+        return [], search.stats
+    signatures = [signature for signature, _ in counts]
+    bounds = mapping.get_signature_bounds(target_aabb, signatures)
+    buckets = [(bound, count, _signature_loader(db, signature))
+               for bound, (signature, count) in zip(bounds.tolist(), counts)]
+    return search.search(buckets), search.stats
+
+
+def find_best_aabbs_indexed(index,
+                            target_aabb,
+                            n_aabbs=TOP_AABBS,
+                            n_sequences=TOP_SEQUENCES,
+                            mapping=None):
+    """
+    Finds AABBs with the highest analogy scores with the ratio index. The
+    score of an AABB for one mapping is the collision and surface match
+    score of its collided sides minus the weighted L1 distance of its ratios
+    from the rotated target ratios. Pairs of (collided sides, mapping) are
+    visited from the highest match score and the nearest AABBs of each pair
+    are found in its KD-tree. The search stops when the match score is lower
+    than the n-th best score, because the penalty only lowers it. Only the
+    found AABBs are scored.
+
+    Args:
+        index(RatioIndex): Ratio index of the database.
+        target_aabb(AABB): The target AABB that we want to map to source AABB.
+        n_aabbs(int): Optional. Number of AABBs to return. Default 10.
+        n_sequences(int): Optional. Number of the best sequences of each
+            AABB. Default 3.
+        mapping(Mapping): Optional. Mapping object used for scoring.
+
+    Returns:
+        A list of (aabb id, top score, list of (score, sequence) tuples)
+            sorted by the highest top score, and a dict with the number of
+            'rows', 'queries', 'scored_rows' and 'prune_rate'.
+    """
+    if mapping is None:
+        mapping = Mapping()
+    stats = {
+        'rows': len(index),
+        'queries': 0,
+        'scored_rows': 0,
+        'prune_rate': 0.0,
+    }
+    if n_aabbs <= 0 or len(index) == 0:
+        return [], stats
+    n_perms = len(mapping.permutations_tuple)
+    weights = _ratio_weights(mapping)
+    target_ratios = mapping.get_target_ratios(target_aabb)
+    codes = list(index.trees.keys())
+    # match score of each collided sides for each mapping
+    mapped = sides_codes(
+        sides_from_codes(codes)[:, mapping.side_permutations])
+    bounds = mapping.get_match_scores(target_aabb)[np.arange(n_perms),
+                                                   mapped]
+
+    # lower estimate of the score of each found AABB
+    found = {}
+    threshold = -np.inf
+    for pair in np.argsort(-bounds, axis=None, kind='stable').tolist():
+        group, k = divmod(pair, n_perms)
+        bound = float(bounds[group, k])
+        if bound < threshold - SCORE_TOLERANCE:
+            break
+        tree, rows = index.trees[codes[group]]
+        distances, points = tree.query(target_ratios[k], n_aabbs, weights,
+                                       bound - threshold + SCORE_TOLERANCE)
+        stats['queries'] += 1
+        for distance, row in zip(distances.tolist(), rows[points].tolist()):
+            found[row] = max(found.get(row, -np.inf), bound - distance)
+        if len(found) >= n_aabbs:
+            threshold = sorted(found.values(), reverse=True)[n_aabbs - 1]
+
+    rows = np.array(sorted(found), dtype=np.int64)
+    stats['scored_rows'] = len(rows)
+    stats['prune_rate'] = 1 - len(rows) / len(index)
+    best = _top_sequences(mapping, target_aabb, index.ids[rows].tolist(),
+                          index.sides(rows), index.half_sizes[rows],
+                          n_sequences)
+    return sorted(best, key=lambda item: (-item[1], item[0]))[:n_aabbs], stats
+
+
+def _ratio_weights(mapping):
+    # the bounds hold only if the ratio penalty does not raise the score
+    weights = mapping.weights[RATIO_WEIGHTS]
+    if np.any(weights < 0):
+        raise ValueError('Ratio weights have to be non-negative for bounds.')
+    return weights
+
+
+def _signature_loader(db, signature):
+    # loads rows of the signature from the database when called
+
+    def load():
+        rows = db.select_aabbs_signature(signature)
+        return ([row[0] for row in rows], [row[12:18] for row in rows],
+                [row[9:12] for row in rows])
+
+    return load
+
+
+def _top_sequences(mapping, target_aabb, ids, sides, half_sizes, n_sequences):
+    # (aabb id, top score, best sequences) of each AABB
+    scores = mapping.get_scores_matrix(target_aabb, sides, half_sizes)
+    top = np.argsort(-scores, axis=1, kind='stable')[:, :n_sequences]
+    best = []
+    for aabb_id, aabb_scores, aabb_top in zip(ids, scores.tolist(),
+                                              top.tolist()):
+        top_scores = [(aabb_scores[j], mapping.permutations_tuple[j])
+                      for j in aabb_top]
+        best.append((aabb_id, top_scores[0][0], top_scores))
+    return best
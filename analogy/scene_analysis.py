@@ -0,0 +1,248 @@
+import os
+
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import broad_phase
+from analogy.collision_detection import scene_collision
+from analogy.storage import scene_cache
+
+# Minimum distance (no units) between meshes used by add and solve.
+MIN_DISTANCE = 3
+
+
+class ScenePipeline:
+    """
+    ScenePipeline analyses scenes in explicit stages: parse, broad phase,
+    narrow phase and side classification. The result of each stage is kept
+    in memory under a key of its inputs, so asking for the same scene again
+    (for example to try several targets) skips all finished stages. A scene
+    file is a new input when its size or modification time changes.
+
+    The pipeline does not draw anything, so it can be used from library code
+    without vpython.
+
+    Attributes:
+        min_distance(float): minimum distance (no units) that has to be
+            between the meshes.
+        contact_mode(str): 'centroid' or 'exact', see
+            scene_collision.analyse_scene.
+        cache(SceneCache): On-disk cache of analysed scenes or None.
+    """
+
+    def __init__(self,
+                 min_distance=MIN_DISTANCE,
+                 contact_mode='centroid',
+                 cache_dir=None):
+        """
+        Init ScenePipeline
+
+        Args:
+            min_distance(float): Optional. minimum distance (no units) that
+                has to be between the meshes. Default 3.
+            contact_mode(str): Optional. 'centroid' (default) or 'exact'.
+            cache_dir(str): Optional. Directory of the on-disk scene cache.
+                Analysed scenes are loaded from it and stored in it. The
+                cache is not used by default.
+        """
+        if contact_mode not in scene_collision.CONTACT_MODES:
+            raise ValueError('contact_mode has to be one of ' +
+                             ', '.join(scene_collision.CONTACT_MODES) + '.')
+        self.min_distance = min_distance
+        self.contact_mode = contact_mode
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = scene_cache.SceneCache(cache_dir)
+        self._parsed = {}
+        self._pairs = {}
+        self._contacts = {}
+        self._sides = {}
+        self._scenes = {}
+        self._sweeps = {}
+        # key of the analysis that is applied to each parsed scene
+        self._applied = {}
+
+    def clear(self):
+        """Forgets the results of all stages."""
+        self._parsed.clear()
+        self._pairs.clear()
+        self._contacts.clear()
+        self._sides.clear()
+        self._scenes.clear()
+        self._sweeps.clear()
+        self._applied.clear()
+
+    def parse(self, obj_file_path):
+        """
+        Parse stage. Reads the scene from the .obj file.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+
+        Returns:
+            A dict of Mesh objects where the key is the name of the mesh and
+                value is Mesh object.
+        """
+        key = file_key(obj_file_path)
+        if key not in self._parsed:
+            self._parsed[key] = file_parsers.read_obj_file(obj_file_path)
+        return self._parsed[key]
+
+    def broad_phase(self, obj_file_path):
+        """
+        Broad phase stage. Finds pairs of meshes which AABBs are closer than
+        min_distance.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+
+        Returns:
+            A list of (name, name) tuples.
+        """
+        key = (file_key(obj_file_path), self.min_distance)
+        if key not in self._pairs:
+            scene = self.parse(obj_file_path)
+            names = list(scene.keys())
+            pos, half_size = broad_phase.aabb_arrays(scene.values())
+            self._pairs[key] = [
+                (names[i], names[j]) for i, j in broad_phase.find_pairs(
+                    pos, half_size, self.min_distance).tolist()
+            ]
+        return self._pairs[key]
+
+    def narrow_phase(self, obj_file_path):
+        """
+        Narrow phase stage. Finds surfaces that collide with other meshes for
+        each pair of the broad phase with scene_collision.find_contacts, so
+        the colliders go through the same spatial hash and the triangles
+        through the same threaded batch as in analyse_scene.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+
+        Returns:
+            Dict where the key is a (name, other name) tuple and value is an
+                array of indices of surfaces of the first mesh that collide
+                with the other mesh.
+        """
+        key = self._analysis_key(obj_file_path)
+        if key not in self._contacts:
+            scene = self.parse(obj_file_path)
+            positions = {name: i for i, name in enumerate(scene)}
+            pairs = [(positions[name_1], positions[name_2])
+                     for name_1, name_2 in self.broad_phase(obj_file_path)]
+            self._contacts[key] = scene_collision.find_contacts(
+                scene, self.min_distance, self.contact_mode, pairs)
+        return self._contacts[key]
+
+    def classify(self, obj_file_path):
+        """
+        Side classification stage. Sets collision of the parsed meshes and
+        their surfaces and classifies collided sides of their AABBs.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+
+        Returns:
+            Dict where the key is the name of the mesh and value is a dict of
+                collided sides.
+        """
+        key = self._analysis_key(obj_file_path)
+        if key not in self._sides:
+            contacts = self.narrow_phase(obj_file_path)
+            scene = self._apply(obj_file_path, key, contacts)
+            scene_collision.classify_collided_sides(scene)
+            self._sides[key] = {
+                name: dict(mesh.aabb.collided_sides)
+                for name, mesh in scene.items()
+            }
+        return self._sides[key]
+
+    def analyse(self, obj_file_path):
+        """
+        Runs all stages that are not finished yet and returns the analysed
+        scene. The same scene object is returned for the same inputs, so
+        changes of it (for example manipulation points of a target) are seen
+        by later calls.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+
+        Returns:
+            A dict of analysed Mesh objects where the key is the name of the
+                mesh and value is Mesh object.
+        """
+        key = self._analysis_key(obj_file_path)
+        if key in self._scenes:
+            return self._scenes[key]
+        if self.cache is not None:
+            scene = self.cache.load(obj_file_path, self.min_distance,
+                                    self.contact_mode)
+            if scene is not None:
+                self._scenes[key] = scene
+                return scene
+
+        sides = self.classify(obj_file_path)
+        scene = self._apply(obj_file_path, key,
+                            self.narrow_phase(obj_file_path))
+        for name, mesh in scene.items():
+            mesh.aabb.collided_sides.update(sides[name])
+        if self.cache is not None:
+            self.cache.store(obj_file_path, self.min_distance, scene,
+                             self.contact_mode)
+        self._scenes[key] = scene
+        return scene
+
+    def sweep(self, obj_file_path, min_distances):
+        """
+        Classifies collided sides of the scene for many values of
+        min_distance in one pass, see scene_collision.sweep_collided_sides.
+        Only the parse stage is shared with the other stages.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+            min_distances(list): A list of minimum distances (no units).
+
+        Returns:
+            Dict where the key is min_distance and value is a dict where the
+                key is the name of the mesh and value is a dict of collided
+                sides.
+        """
+        key = (file_key(obj_file_path), tuple(sorted(set(min_distances))),
+               self.contact_mode)
+        if key not in self._sweeps:
+            self._sweeps[key] = scene_collision.sweep_collided_sides(
+                self.parse(obj_file_path), min_distances, self.contact_mode)
+        return self._sweeps[key]
+
+    def _analysis_key(self, obj_file_path):
+        return (file_key(obj_file_path), self.min_distance, self.contact_mode)
+
+    def _apply(self, obj_file_path, key, contacts):
+        # the parsed scene holds the collisions of one analysis at a time
+        scene = self.parse(obj_file_path)
+        if self._applied.get(key[0]) != key:
+            scene_collision.apply_contacts(scene, contacts)
+            self._applied[key[0]] = key
+        return scene
+
+
+def file_key(obj_file_path):
+    """
+    Returns a key of the scene files. It changes when the OBJ or MTL file is
+    changed.
+
+    Args:
+        obj_file_path(str): File path to the .obj file.
+
+    Returns:
+        Tuple of the absolute path and sizes and modification times of the
+            files.
+    """
+    stats = []
+    mtl_file_path = obj_file_path.replace('.obj', '.mtl')
+    for file_path in (obj_file_path, mtl_file_path):
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            stats.append((stat.st_size, stat.st_mtime_ns))
+        else:
+            stats.append(None)
+    return (os.path.abspath(obj_file_path),) + tuple(stats)
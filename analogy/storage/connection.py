@@ -0,0 +1,198 @@
+import concurrent.futures
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import urllib.parse
+
+# Seconds a connection waits for a lock held by another connection.
+BUSY_TIMEOUT = 30.0
+# Bytes of the database file that are memory mapped (256 MiB).
+MMAP_SIZE = 256 << 20
+# Size of the page cache of each connection in KiB (64 MiB).
+CACHE_SIZE = 64 << 10
+# Number of read-only connections of a ReaderPool.
+READ_POOL_SIZE = 4
+
+
+def connect(name, read_only=False):
+    """
+    Opens a connection to the database file. The database is switched to
+    WAL journaling, so readers do not block the writer and the writer does
+    not block readers. Read-only connections can not write at all, even if
+    they are used by mistake for writing.
+
+    Args:
+        name(str): The database file name or ':memory:'.
+        read_only(bool): Optional. Open the file read-only. The file has to
+            exist. Default False.
+
+    Returns:
+        sqlite3.Connection that can be used from any thread, but only by
+            one thread at a time.
+    """
+    if name == ':memory:':
+        return sqlite3.connect(name,
+                               timeout=BUSY_TIMEOUT,
+                               check_same_thread=False)
+    if read_only:
+        uri = 'file:' + urllib.parse.quote(os.path.abspath(name)) + '?mode=ro'
+        conn = sqlite3.connect(uri,
+                               timeout=BUSY_TIMEOUT,
+                               check_same_thread=False,
+                               uri=True)
+        conn.execute('PRAGMA query_only = ON')
+    else:
+        conn = sqlite3.connect(name,
+                               timeout=BUSY_TIMEOUT,
+                               check_same_thread=False)
+        # WAL mode is stored in the file, so read-only connections use it too
+        conn.execute('PRAGMA journal_mode = WAL')
+        # in WAL mode the database is still consistent after a crash
+        conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA mmap_size = ' + str(MMAP_SIZE))
+    conn.execute('PRAGMA cache_size = ' + str(-CACHE_SIZE))
+    return conn
+
+
+class ReaderPool:
+    """
+    ReaderPool is a pool of read-only database handles for solvers running
+    in parallel threads. Each thread gets its own handle with its own
+    connection and cursor. Handles are opened when they are first needed.
+
+    Attributes:
+        factory(function): Function that opens a new handle. Handles must
+            have a close method.
+        size(int): Maximum number of open handles.
+    """
+
+    def __init__(self, factory, size=READ_POOL_SIZE):
+        """
+        Init ReaderPool
+
+        Args:
+            factory(function): Function that opens a new handle.
+            size(int): Optional. Maximum number of open handles. Default 4.
+        """
+        self.factory = factory
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @contextlib.contextmanager
+    def acquire(self, timeout=None):
+        """
+        Returns a context manager with a handle of the pool. The handle is
+        returned to the pool at the end of the with block. If all handles
+        are in use, waits for one of them.
+
+        Args:
+            timeout(float): Optional. Seconds to wait for a handle. Waits
+                forever by default.
+
+        Raises:
+            queue.Empty: No handle was returned to the pool in time.
+        """
+        handle = self._get(timeout)
+        try:
+            yield handle
+        finally:
+            self._put(handle)
+
+    def close(self):
+        """Closes the idle handles and the handles in use when returned."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _get(self, timeout):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('The pool is closed.')
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            open_new = self._opened < self.size
+            if open_new:
+                self._opened += 1
+        if not open_new:
+            return self._idle.get(timeout=timeout)
+        try:
+            return self.factory()
+        except BaseException:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _put(self, handle):
+        with self._lock:
+            if not self._closed:
+                self._idle.put(handle)
+                return
+        handle.close()
+
+
+class Writer:
+    """
+    Writer runs all writes to the database on one thread with one handle,
+    so writes are done one after another and callers do not wait for them.
+    Readers of a WAL database are never blocked by the writer.
+
+    Attributes:
+        factory(function): Function that opens the handle. It is called on
+            the writer thread before the first write.
+    """
+
+    def __init__(self, factory):
+        """
+        Init Writer
+
+        Args:
+            factory(function): Function that opens the handle.
+        """
+        self.factory = factory
+        self._handle = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedules function(handle, *args, **kwargs) on the writer thread.
+
+        Args:
+            function(function): Function that writes with the handle, for
+                example sqlitedb.save_scenes.
+
+        Returns:
+            concurrent.futures.Future with the result of the function.
+        """
+        return self._executor.submit(self._run, function, args, kwargs)
+
+    def close(self, wait=True):
+        """
+        Closes the handle after the scheduled writes.
+
+        Args:
+            wait(bool): Optional. Wait for the scheduled writes. Default
+                True.
+        """
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, function, args, kwargs):
+        if self._handle is None:
+            self._handle = self.factory()
+        return function(self._handle, *args, **kwargs)
+
+    def _close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
@@ -0,0 +1,356 @@
+import heapq
+import os
+import tempfile
+
+import numpy as np
+
+from analogy.mapping import half_size_ratios
+from analogy.mapping import sides_codes
+from analogy.mapping import sides_from_codes
+
+# Version of the index file format. Files of other versions are rebuilt.
+INDEX_VERSION = 2
+# Number of points in one leaf of the KD-tree.
+KD_LEAF_SIZE = 16
+# Suffix of the index file that is stored next to the database file.
+INDEX_SUFFIX = '.ratios.npz'
+# Arrays of KDTree saved in the index file.
+TREE_ARRAYS = ('points', 'order', 'starts', 'stops', 'children', 'lower',
+               'upper')
+
+
+class KDTree:
+    """
+    KDTree is a KD-tree over points in 3D space for nearest neighbour queries
+    with weighted L1 distance. Each node splits its points at the median of
+    the axis with the largest extent. Nodes are flat arrays, so the tree can
+    be saved and loaded without rebuilding.
+
+    Attributes:
+        points(numpy.ndarray): (N, 3) points in the order of the leaves.
+        order(numpy.ndarray): (N,) index of each point in the input points.
+        starts(numpy.ndarray): Start of the points of each node.
+        stops(numpy.ndarray): Stop of the points of each node.
+        children(numpy.ndarray): (K, 2) children of each node, -1 for leaves.
+        lower(numpy.ndarray): (K, 3) lowest corner of each node.
+        upper(numpy.ndarray): (K, 3) highest corner of each node.
+    """
+
+    def __init__(self, points, leaf_size=KD_LEAF_SIZE):
+        """
+        Init KDTree
+
+        Args:
+            points(numpy.ndarray): (N, 3) array of points.
+            leaf_size(int): Optional. Maximum number of points in one leaf.
+                Default 16.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        leaf_size = max(1, int(leaf_size))
+        order = np.arange(len(points))
+        starts, stops, children, lower, upper = [], [], [], [], []
+        stack = [(0, len(points), -1, 0)]
+        while stack:
+            start, stop, parent, side = stack.pop()
+            node = len(starts)
+            if parent >= 0:
+                children[parent][side] = node
+            node_points = points[order[start:stop]]
+            starts.append(start)
+            stops.append(stop)
+            children.append([-1, -1])
+            if len(node_points):
+                lower.append(node_points.min(axis=0))
+                upper.append(node_points.max(axis=0))
+            else:
+                lower.append(np.zeros(3))
+                upper.append(np.zeros(3))
+            if stop - start <= leaf_size:
+                continue
+            axis = int(np.argmax(upper[-1] - lower[-1]))
+            mid = (start + stop) // 2
+            node_order = order[start:stop]
+            order[start:stop] = node_order[np.argpartition(
+                node_points[:, axis], mid - start)]
+            stack.append((mid, stop, node, 1))
+            stack.append((start, mid, node, 0))
+        self.points = points[order]
+        self.order = order
+        self.starts = np.array(starts, dtype=np.int64)
+        self.stops = np.array(stops, dtype=np.int64)
+        self.children = np.array(children, dtype=np.int64).reshape(-1, 2)
+        self.lower = np.array(lower).reshape(-1, 3)
+        self.upper = np.array(upper).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, point, k, weights=(1.0, 1.0, 1.0), max_distance=np.inf):
+        """
+        Returns the k nearest points by weighted L1 distance. Points with
+        equal distance are sorted by their index.
+
+        Args:
+            point(list): [x,y,z] query point.
+            k(int): Maximum number of points to return.
+            weights(list): Optional. Weight of each axis.
+            max_distance(float): Optional. Points farther than this are not
+                returned.
+
+        Returns:
+            Tuple of sorted distances and indices into the input points.
+        """
+        point = np.asarray(point, dtype=np.float64).reshape(3)
+        weights = np.asarray(weights, dtype=np.float64).reshape(3)
+        # max heap of the best points as (-distance, -index)
+        best = []
+        if k <= 0 or len(self) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        nodes = [(self._box_distance(0, point, weights), 0)]
+        while nodes:
+            distance, node = heapq.heappop(nodes)
+            if distance > max_distance or (len(best) == k and
+                                           distance > -best[0][0]):
+                break
+            left, right = self.children[node]
+            if left >= 0:
+                for child in (left, right):
+                    heapq.heappush(
+                        nodes,
+                        (self._box_distance(child, point, weights), child))
+                continue
+            start, stop = self.starts[node], self.stops[node]
+            distances = (np.abs(self.points[start:stop] - point) *
+                         weights).sum(axis=1)
+            for distance, index in zip(distances.tolist(),
+                                       self.order[start:stop].tolist()):
+                if distance > max_distance:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, -index))
+                elif (distance, index) < (-best[0][0], -best[0][1]):
+                    heapq.heapreplace(best, (-distance, -index))
+        best = sorted((-distance, -index) for distance, index in best)
+        return (np.array([distance for distance, _ in best]),
+                np.array([index for _, index in best], dtype=np.int64))
+
+    def _box_distance(self, node, point, weights):
+        # weighted L1 distance from the point to the box of the node
+        gap = np.maximum(
+            np.maximum(self.lower[node] - point, point - self.upper[node]), 0)
+        return float((gap * weights).sum())
+
+
+class RatioIndex:
+    """
+    RatioIndex is an index of the AABBs of the knowledge base for fast
+    retrieval of the best analogies. The ratio penalty of a mapping is a
+    weighted L1 distance between xy, zy, xz ratios of the rotated target and
+    the ratios of the source, so AABBs with the same collided sides are put
+    in one KD-tree over their ratios. Each rotation of the target is one
+    nearest neighbour query.
+
+    Attributes:
+        ids(numpy.ndarray): (N,) IDs of the AABBs sorted by ID.
+        half_sizes(numpy.ndarray): (N, 3) half sizes of the AABBs.
+        codes(numpy.ndarray): (N,) sides_codes of collided sides.
+        version(tuple): (select_aabbs_version,) of the database the index
+            was built from.
+        trees(dict): Dict where the key is a code of collided sides and
+            value is a tuple of KDTree and indices of its AABBs in ids.
+    """
+
+    def __init__(self, ids, half_sizes, sides, version):
+        """
+        Init RatioIndex and builds the trees.
+
+        Args:
+            ids(list): IDs of the AABBs.
+            half_sizes(numpy.ndarray): (N, 3) half sizes of the AABBs.
+            sides(numpy.ndarray): (N, 6) collided sides in the order of
+                SIDES.
+            version(tuple): (select_aabbs_version,) of the database.
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.half_sizes = np.asarray(half_sizes,
+                                     dtype=np.float64).reshape(-1, 3)[order]
+        self.codes = sides_codes(np.asarray(sides).reshape(-1, 6)[order])
+        self.version = tuple(version)
+        ratios = half_size_ratios(self.half_sizes)
+        self.trees = {}
+        for code in np.unique(self.codes).tolist():
+            rows = np.flatnonzero(self.codes == code)
+            self.trees[code] = (KDTree(ratios[rows]), rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sides(self, rows):
+        """
+        Returns collided sides of the AABBs.
+
+        Args:
+            rows(numpy.ndarray): Indices into ids.
+
+        Returns:
+            (N, 6) collided sides in the order of SIDES.
+        """
+        return sides_from_codes(self.codes[rows])
+
+    def save(self, index_path):
+        """
+        Saves the index to the file. The file is replaced at once, so readers
+        never see a partly written index.
+
+        Args:
+            index_path(str): Path to the index file.
+        """
+        arrays = {
+            'format': np.array([INDEX_VERSION]),
+            'version': np.array(self.version, dtype=np.int64),
+            'ids': self.ids,
+            'half_sizes': self.half_sizes,
+            'codes': self.codes,
+        }
+        # trees are saved as a few concatenated arrays, one slice per tree
+        tree_codes = sorted(self.trees)
+        arrays['tree_codes'] = np.array(tree_codes, dtype=np.int64)
+        arrays['tree_sizes'] = np.array(
+            [[len(self.trees[code][0]),
+              len(self.trees[code][0].starts)] for code in tree_codes],
+            dtype=np.int64).reshape(-1, 2)
+        arrays['tree_rows'] = _concatenate(
+            [self.trees[code][1] for code in tree_codes], np.int64)
+        for name in TREE_ARRAYS:
+            arrays['tree_' + name] = _concatenate(
+                [getattr(self.trees[code][0], name) for code in tree_codes],
+                None)
+        directory = os.path.dirname(os.path.abspath(index_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, index_path)
+
+
+def index_path(db_name):
+    """
+    Returns path of the index file of the database file.
+
+    Args:
+        db_name(str): The knowledge base database file name.
+
+    Returns:
+        Path of the index file or None for an in-memory database.
+    """
+    if db_name == ':memory:':
+        return None
+    return db_name + INDEX_SUFFIX
+
+
+def build_index(db):
+    """
+    Builds RatioIndex of all AABBs in the database.
+
+    Args:
+        db(sqlitedb): The knowledge base database.
+
+    Returns:
+        RatioIndex object.
+    """
+    version = _db_version(db)
+    if version is None:
+        raise ValueError('The database has to be migrated by a writer, see '
+                         'sqlitedb.migrate.')
+    shapes = np.array(db.select_aabb_shapes(),
+                      dtype=np.float64).reshape(-1, 10)
+    return RatioIndex(shapes[:, 0], shapes[:, 1:4],
+                      shapes[:, 4:10].astype(np.intp), version)
+
+
+def load_index(db):
+    """
+    Returns RatioIndex of the database from the file next to the database
+    file. Nothing is written, so it can be used with a read-only database.
+
+    Args:
+        db(sqlitedb): The knowledge base database.
+
+    Returns:
+        RatioIndex object or None if the file does not exist or AABBs were
+            added, changed or removed since the index was built. The search
+            falls back to TopKSearch then, see retrieval.find_best_aabbs.
+    """
+    path = index_path(db.name)
+    if path is None or not os.path.isfile(path):
+        return None
+    version = _db_version(db)
+    if version is None:
+        return None
+    index = _read_index(path)
+    if index is None or index.version != version:
+        return None
+    return index
+
+
+def update_index(db):
+    """
+    Returns RatioIndex of the database. The index is loaded from the file
+    next to the database file. It is rebuilt and saved if the file does not
+    exist or AABBs were added, changed or removed since it was built. Called
+    by writers of the database after they add AABBs.
+
+    Args:
+        db(sqlitedb): The knowledge base database.
+
+    Returns:
+        RatioIndex object.
+    """
+    index = load_index(db)
+    if index is None:
+        index = build_index(db)
+        path = index_path(db.name)
+        if path is not None:
+            index.save(path)
+    return index
+
+
+def _db_version(db):
+    version = db.select_aabbs_version()
+    return None if version is None else (version,)
+
+
+def _read_index(path):
+    with np.load(path) as data:
+        if int(data['format'][0]) != INDEX_VERSION:
+            return None
+        index = RatioIndex.__new__(RatioIndex)
+        index.ids = data['ids']
+        index.half_sizes = data['half_sizes']
+        index.codes = data['codes']
+        index.version = tuple(data['version'].tolist())
+        index.trees = {}
+        tree_arrays = {name: data['tree_' + name] for name in TREE_ARRAYS}
+        tree_rows = data['tree_rows']
+        point_start = node_start = 0
+        for code, (n_points, n_nodes) in zip(data['tree_codes'].tolist(),
+                                             data['tree_sizes'].tolist()):
+            tree = KDTree.__new__(KDTree)
+            for name in TREE_ARRAYS:
+                if name in ('points', 'order'):
+                    start, stop = point_start, point_start + n_points
+                else:
+                    start, stop = node_start, node_start + n_nodes
+                setattr(tree, name, tree_arrays[name][start:stop])
+            index.trees[code] = (tree,
+                                 tree_rows[point_start:point_start + n_points])
+            point_start += n_points
+            node_start += n_nodes
+    return index
+
+
+def _concatenate(arrays, dtype):
+    if not arrays:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays)
@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import scene_collision
+from analogy.mesh import Mesh
+from analogy.mesh import SceneArrays
+from analogy.mesh import Surface
+
+# Version of the cache format. It is part of the key, so entries written in
+# an older format are never read.
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = './scenes/cache/'
+SIDES = ('top', 'bottom', 'front', 'back', 'right', 'left')
+# Files are hashed in blocks of this size (1 MiB).
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_scene_files(obj_file_path):
+    """
+    Calculates SHA-256 of the OBJ file and MTL file (if exists) content.
+
+    Args:
+        obj_file_path(str): File path to the .obj file.
+
+    Returns:
+        Hex digest of the content of both files.
+    """
+    sha = hashlib.sha256()
+    mtl_file_path = obj_file_path.replace('.obj', '.mtl')
+    for file_path in (obj_file_path, mtl_file_path):
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            block = f.read(HASH_BLOCK_SIZE)
+            while block:
+                sha.update(block)
+                block = f.read(HASH_BLOCK_SIZE)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+class SceneCache:
+    """
+    SceneCache is an on-disk cache of parsed and analysed scenes. Each entry
+    is a directory of .npy files that are memory mapped when the scene is
+    loaded, so loading does not parse or copy the geometry.
+
+    The key of an entry is the hash of OBJ and MTL file content together with
+    min_distance and the contact mode. Content hashes are remembered for the
+    file size and modification time, so an unchanged file is not read again
+    and a changed file gets a new key. Old entries of a changed file are
+    removed.
+
+    Each scene file has its own record file and each entry names its scene
+    file in meta.json, so processes ingesting in parallel never rewrite a
+    shared file and can not lose each other's updates.
+
+    Attributes:
+        cache_dir(str): Directory with the cache entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Inits SceneCache.
+
+        Args:
+            cache_dir(str): Optional. Directory with the cache entries.
+                Default './scenes/cache/'.
+        """
+        self.cache_dir = cache_dir
+
+    def get(self, obj_file_path, min_distance, contact_mode='centroid'):
+        """
+        Returns the analysed scene from the cache. The scene is parsed,
+        analysed and stored if it is not in the cache.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+            min_distance(float): minimum distance (no units) that has to be
+                between the meshes.
+            contact_mode(str): Optional. Contact mode of the collision
+                detection. Default 'centroid'.
+
+        Returns:
+            A dict of Mesh objects where the key is the name of the mesh and
+                value is Mesh object.
+        """
+        scene = self.load(obj_file_path, min_distance, contact_mode)
+        if scene is None:
+            scene = file_parsers.read_obj_file(obj_file_path)
+            scene_collision.analyse_scene(scene, min_distance, contact_mode)
+            self.store(obj_file_path, min_distance, scene, contact_mode)
+        return scene
+
+    def key(self, obj_file_path, min_distance, contact_mode='centroid'):
+        """
+        Returns the cache key of the scene.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+            min_distance(float): minimum distance (no units) that has to be
+                between the meshes.
+            contact_mode(str): Optional. Contact mode of the collision
+                detection. Default 'centroid'.
+
+        Returns:
+            Hex string key of the cache entry.
+        """
+        digest = self._content_hash(obj_file_path)
+        sha = hashlib.sha256()
+        sha.update(
+            repr((CACHE_VERSION, digest, float(min_distance),
+                  file_parsers.SIDE_TOLERANCE, contact_mode)).encode())
+        return sha.hexdigest()
+
+    def load(self, obj_file_path, min_distance, contact_mode='centroid'):
+        """
+        Loads the analysed scene from the cache.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+            min_distance(float): minimum distance (no units) that has to be
+                between the meshes.
+            contact_mode(str): Optional. Contact mode of the collision
+                detection. Default 'centroid'.
+
+        Returns:
+            A dict of Mesh objects or None if the scene is not in the cache.
+        """
+        entry_path = os.path.join(
+            self.cache_dir,
+            self.key(obj_file_path, min_distance, contact_mode))
+        if not os.path.isfile(os.path.join(entry_path, 'meta.json')):
+            return None
+        return read_entry(entry_path)
+
+    def store(self, obj_file_path, min_distance, scene,
+              contact_mode='centroid'):
+        """
+        Stores the analysed scene in the cache.
+
+        Args:
+            obj_file_path(str): File path to the .obj file.
+            min_distance(float): minimum distance (no units) that has to be
+                between the meshes.
+            scene(dict): A dict of Mesh objects.
+            contact_mode(str): Optional. Contact mode of the collision
+                detection. Default 'centroid'.
+
+        Returns:
+            Path of the cache entry.
+        """
+        entry_path = os.path.join(
+            self.cache_dir,
+            self.key(obj_file_path, min_distance, contact_mode))
+        if not os.path.isdir(entry_path):
+            write_entry(entry_path, scene, {
+                'path': os.path.abspath(obj_file_path),
+                'digest': self._content_hash(obj_file_path),
+            })
+        return entry_path
+
+    def _record_path(self, obj_file_path):
+        # record of the scene file named by the hash of its absolute path
+        name = hashlib.sha256(
+            os.path.abspath(obj_file_path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, 'files', name + '.json')
+
+    def _read_record(self, obj_file_path):
+        try:
+            with open(self._record_path(obj_file_path), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_record(self, obj_file_path, record):
+        record_path = self._record_path(obj_file_path)
+        records_dir = os.path.dirname(record_path)
+        os.makedirs(records_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=records_dir, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
+
+    def _content_hash(self, obj_file_path):
+        """
+        Returns content hash of the scene files. The hash is reused while
+        the size and modification time of the files stay the same.
+        """
+        stats = []
+        mtl_file_path = obj_file_path.replace('.obj', '.mtl')
+        for file_path in (obj_file_path, mtl_file_path):
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                stats.append([stat.st_size, stat.st_mtime_ns])
+            else:
+                stats.append(None)
+        record = self._read_record(obj_file_path)
+        if record is not None and record['stats'] == stats:
+            return record['digest']
+
+        digest = hash_scene_files(obj_file_path)
+        if record is not None and record['digest'] != digest:
+            # the content has changed, its entries are no longer valid
+            self._remove_entries(obj_file_path, digest)
+        self._write_record(obj_file_path, {'stats': stats, 'digest': digest})
+        return digest
+
+    def _remove_entries(self, obj_file_path, digest):
+        """
+        Removes entries of the scene file with other content than the digest.
+        Entries left by a process that was still writing the old content are
+        removed the next time the file changes.
+        """
+        obj_file_path = os.path.abspath(obj_file_path)
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                with open(os.path.join(entry_path, 'meta.json'), 'r') as f:
+                    source = json.load(f).get('source')
+            except (OSError, ValueError):
+                continue
+            if (source is not None and source['path'] == obj_file_path and
+                    source['digest'] != digest):
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def write_entry(entry_path, scene, source=None):
+    """
+    Writes the analysed scene as a directory of .npy files and meta.json.
+    The directory is written under a temporary name and renamed at the end,
+    so readers never see a partial entry.
+
+    Args:
+        entry_path(str): Path of the entry directory.
+        scene(dict): A dict of Mesh objects.
+        source(dict): Optional. 'path' and 'digest' of the scene file, used
+            to remove the entry when the file changes.
+    """
+    meshes = list(scene.values())
+    scene_arrays = meshes[0].scene_arrays if meshes else None
+    if scene_arrays is None or scene_arrays.mesh_names != list(scene.keys()):
+        scene_arrays = SceneArrays.concatenate(meshes)
+    mesh_indices = {mesh.name: i for i, mesh in enumerate(meshes)}
+
+    closest_surfaces = []
+    closest_offsets = [0]
+    for mesh in meshes:
+        for side in SIDES:
+            indices = [
+                surface.index
+                for surface in mesh.aabb.closest_surfaces.get(side, [])
+            ]
+            closest_surfaces.extend(indices)
+            closest_offsets.append(closest_offsets[-1] + len(indices))
+    mesh_contacts = [(mesh_indices[mesh.name], mesh_indices[name])
+                     for mesh in meshes
+                     for name in mesh.collided_objects]
+    surface_contacts = [(face_index, mesh_indices[name])
+                        for face_index, names in sorted(
+                            scene_arrays.collided_objects.items())
+                        for name in names]
+    aabb_colors = [
+        mesh.aabb.color if mesh.aabb.color else [np.nan] * 3
+        for mesh in meshes
+    ]
+
+    arrays = {
+        'vertices': scene_arrays.vertices,
+        'faces': scene_arrays.faces,
+        'colliders': scene_arrays.colliders,
+        'collision': scene_arrays.collision,
+        'vertex_offsets': scene_arrays.vertex_offsets,
+        'face_offsets': scene_arrays.face_offsets,
+        'aabb_pos': np.array([mesh.aabb.pos for mesh in meshes],
+                             dtype=np.float64).reshape(-1, 3),
+        'aabb_half_size': np.array([mesh.aabb.half_size for mesh in meshes],
+                                   dtype=np.float64).reshape(-1, 3),
+        'colors': np.array([mesh.color for mesh in meshes],
+                           dtype=np.float64).reshape(-1, 3),
+        'aabb_colors': np.array(aabb_colors, dtype=np.float64).reshape(-1, 3),
+        'collided_sides': np.array(
+            [[mesh.aabb.collided_sides[side] for side in SIDES]
+             for mesh in meshes],
+            dtype=np.int8).reshape(-1, 6),
+        'mesh_collision': np.array([mesh.collision for mesh in meshes],
+                                   dtype=bool),
+        'closest_surfaces': np.array(closest_surfaces, dtype=np.int64),
+        'closest_offsets': np.array(closest_offsets, dtype=np.int64),
+        'mesh_contacts': np.array(mesh_contacts,
+                                  dtype=np.int32).reshape(-1, 2),
+        'surface_contacts': np.array(surface_contacts,
+                                     dtype=np.int32).reshape(-1, 2),
+    }
+
+    parent_dir = os.path.dirname(os.path.abspath(entry_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent_dir)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), np.asarray(values))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({
+            'version': CACHE_VERSION,
+            'mesh_names': list(scene.keys()),
+            'source': source,
+        }, f)
+    try:
+        os.rename(tmp_path, entry_path)
+    except OSError:
+        # another process has written the same entry in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_entry(entry_path):
+    """
+    Reads the analysed scene from the entry directory. The arrays are memory
+    mapped copy-on-write, so changes of the scene are not written back.
+
+    Args:
+        entry_path(str): Path of the entry directory.
+
+    Returns:
+        A dict of Mesh objects where the key is the name of the mesh and
+            value is Mesh object.
+    """
+    with open(os.path.join(entry_path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+
+    def load(name):
+        return np.load(os.path.join(entry_path, name + '.npy'), mmap_mode='c')
+
+    mesh_names = meta['mesh_names']
+    scene_arrays = SceneArrays(
+        load('vertices'),
+        load('faces'),
+        mesh_names,
+        load('vertex_offsets'),
+        load('face_offsets'),
+        colliders=load('colliders'),
+        collision=load('collision'))
+    for face_index, mesh_index in load('surface_contacts').tolist():
+        scene_arrays.collided_objects.setdefault(
+            face_index, {})[mesh_names[mesh_index]] = True
+
+    aabb_pos = load('aabb_pos').tolist()
+    aabb_half_size = load('aabb_half_size').tolist()
+    colors = load('colors').tolist()
+    aabb_colors = load('aabb_colors')
+    collided_sides = load('collided_sides').tolist()
+    mesh_collision = load('mesh_collision')
+    closest_surfaces = load('closest_surfaces')
+    closest_offsets = load('closest_offsets')
+
+    scene = {}
+    for i, name in enumerate(mesh_names):
+        mesh = Mesh()
+        mesh.name = name
+        mesh.bind(scene_arrays, i)
+        mesh.color = colors[i]
+        mesh.collision = bool(mesh_collision[i])
+        mesh.aabb.pos = aabb_pos[i]
+        mesh.aabb.half_size = aabb_half_size[i]
+        if not np.isnan(aabb_colors[i]).any():
+            mesh.aabb.color = aabb_colors[i].tolist()
+        for j, side in enumerate(SIDES):
+            mesh.aabb.collided_sides[side] = collided_sides[i][j]
+            k = i * len(SIDES) + j
+            mesh.aabb.closest_surfaces[side] = [
+                Surface([], scene_arrays=scene_arrays, index=index)
+                for index in closest_surfaces[closest_offsets[k]:
+                                              closest_offsets[k + 1]].tolist()
+            ]
+        scene[name] = mesh
+    for mesh_index, other_index in load('mesh_contacts').tolist():
+        scene[mesh_names[mesh_index]].collided_objects[
+            mesh_names[other_index]] = True
+    return scene
@@ -1,7 +1,45 @@
-import sqlite3
+import hashlib
 import os
 import pickle
 
+import numpy as np
+
+from analogy.mapping import Mapping
+from analogy.mapping import SIDES
+from analogy.mesh import AABB
+from analogy.storage import connection
+
+# Manipulation operations with a point and a vector table.
+OPERATIONS = ('push', 'pull', 'spatula')
+# Tables written by save_scenes with their columns, in the order of
+# writing.
+SAVE_TABLES = (
+    ('Position', ('X', 'Y', 'Z')),
+    ('PushPoint', ('PositionID',)),
+    ('PushVector', ('VectorX', 'VectorY', 'VectorZ')),
+    ('PullPoint', ('PositionID',)),
+    ('PullVector', ('VectorX', 'VectorY', 'VectorZ')),
+    ('SpatulaPoint', ('PositionID',)),
+    ('SpatulaVector', ('VectorX', 'VectorY', 'VectorZ')),
+    ('TargetAABB',
+     ('FileName', 'PositionID', 'PushPointID', 'PushVectorID', 'PullPointID',
+      'PullVectorID', 'SpatulaPointID', 'SpatulaVectorID', 'HalfSizeX',
+      'HalfSizeY', 'HalfSizeZ', 'CollidedTop', 'CollidedBottom',
+      'CollidedFront', 'CollidedBack', 'CollidedRight', 'CollidedLeft')),
+)
+TABLE_COLUMNS = dict(SAVE_TABLES)
+# Columns of TargetAABB that are computed from the others.
+TARGET_AABB_EXTRA = ('ContentHash', 'Signature', 'SignatureRotation')
+# Unique indexes of the tables. The indexes allow many rows with NULL values
+# (missing points and vectors), so these rows are looked up with IS.
+UNIQUE_INDEXES = tuple(
+    (table, columns) for table, columns in SAVE_TABLES
+    if table != 'TargetAABB') + (('TargetAABB', ('ContentHash',)),)
+# Version of the tables in PRAGMA user_version, see sqlitedb.migrate.
+SCHEMA_VERSION = 3
+# Number of IDs in one IN (...) list of a query.
+SELECT_IDS_CHUNK_SIZE = 500
+
 
 class sqlitedb:
     """
@@ -10,24 +48,36 @@ class sqlitedb:
 
     Attributes:
         name(str): name for the database file. Default ':memory:'.
+        read_only(bool): True if the database can not be written.
         conn(sqlite3.Connection): It represents the database.
         cursor(sqlite3.Cursor): It represents the cursor for the database.
     """
 
-    def __init__(self, name=':memory:'):
+    def __init__(self, name=':memory:', read_only=False):
         """
         Inits sqlitedb.
 
         Args:
             name(str): Optional. Name for the database file. Default ':memory:'.
+            read_only(bool): Optional. Open an existing database file
+                read-only, see connection.connect. Default False.
         """
         self.name = name
-        self.conn = sqlite3.connect(self.name)
+        self.read_only = read_only
+        self.conn = connection.connect(self.name, read_only)
         self.cursor = self.conn.cursor()
 
+    def close(self):
+        """Closes the connection to the database"""
+        self.conn.close()
+
     def drop_db(self):
         """Drops the whole database"""
         os.remove(self.name)
+        # WAL files of the database
+        for suffix in ('-wal', '-shm'):
+            if os.path.isfile(self.name + suffix):
+                os.remove(self.name + suffix)
 
     def create_db(self):
         """Creates the whole database for analogy system"""
@@ -114,16 +164,220 @@ class sqlitedb:
         )''')
 
         self.conn.commit()
+        self.migrate()
+
+    def migrate(self):
+        """
+        Updates tables created by older versions of the analogy system. The
+        version of the tables is kept in PRAGMA user_version and each step
+        runs once:
+
+        1. Adds the canonical signature of collided sides to TargetAABB and
+           TargetAABBView.
+        2. Merges duplicate rows, adds ContentHash to TargetAABB and unique
+           indexes for the lookups of save_scene.
+        3. Adds AABBsVersion, a counter that triggers increase on every
+           change of TargetAABB, see select_aabbs_version.
+        """
+        version = self.select_schema_version()
+        if version < 1:
+            self._migrate_signatures()
+        if version < 2:
+            self._migrate_unique()
+        if version < 3:
+            self._migrate_aabbs_version()
+        if version < SCHEMA_VERSION:
+            self.cursor.execute('PRAGMA user_version = ' +
+                                str(SCHEMA_VERSION))
+        self.conn.commit()
 
-    def _select_pos(self, pos):
+    def _migrate_signatures(self):
+        self._add_column('TargetAABB', 'Signature', 'INTEGER')
+        self._add_column('TargetAABB', 'SignatureRotation', 'INTEGER')
         self.cursor.execute(
-            '''SELECT ID FROM Position WHERE X=? AND Y=? AND Z=?''', pos)
-        return self.cursor.fetchone()
+            '''SELECT ID, CollidedTop, CollidedBottom, CollidedFront,
+            CollidedBack, CollidedRight, CollidedLeft FROM TargetAABB
+            WHERE Signature IS NULL''')
+        rows = self.cursor.fetchall()
+        if rows:
+            signatures, rotations = Mapping().get_canonical_signatures(
+                [row[1:] for row in rows])
+            self.cursor.executemany(
+                '''UPDATE TargetAABB SET Signature=?, SignatureRotation=?
+                WHERE ID=?''',
+                zip(signatures.tolist(), rotations.tolist(),
+                    [row[0] for row in rows]))
+        self.cursor.execute('''CREATE INDEX IF NOT EXISTS TargetAABBSignature
+            ON TargetAABB (Signature)''')
+        # TargetAABB joined with positions of the AABB, manipulation points
+        # and vectors, so the whole KB is loaded with one query
+        self.cursor.execute('''CREATE VIEW IF NOT EXISTS TargetAABBView AS
+            SELECT TargetAABB.ID AS ID, FileName,
+            Position.X AS X, Position.Y AS Y, Position.Z AS Z,
+            HalfSizeX, HalfSizeY, HalfSizeZ,
+            CollidedTop, CollidedBottom, CollidedFront, CollidedBack,
+            CollidedRight, CollidedLeft,
+            PushPosition.X AS PushX, PushPosition.Y AS PushY,
+            PushPosition.Z AS PushZ,
+            PushVector.VectorX AS PushVectorX,
+            PushVector.VectorY AS PushVectorY,
+            PushVector.VectorZ AS PushVectorZ,
+            PullPosition.X AS PullX, PullPosition.Y AS PullY,
+            PullPosition.Z AS PullZ,
+            PullVector.VectorX AS PullVectorX,
+            PullVector.VectorY AS PullVectorY,
+            PullVector.VectorZ AS PullVectorZ,
+            SpatulaPosition.X AS SpatulaX, SpatulaPosition.Y AS SpatulaY,
+            SpatulaPosition.Z AS SpatulaZ,
+            SpatulaVector.VectorX AS SpatulaVectorX,
+            SpatulaVector.VectorY AS SpatulaVectorY,
+            SpatulaVector.VectorZ AS SpatulaVectorZ,
+            Signature, SignatureRotation
+            FROM TargetAABB
+            LEFT JOIN Position ON Position.ID = TargetAABB.PositionID
+            LEFT JOIN PushPoint ON PushPoint.ID = TargetAABB.PushPointID
+            LEFT JOIN Position AS PushPosition
+                ON PushPosition.ID = PushPoint.PositionID
+            LEFT JOIN PushVector ON PushVector.ID = TargetAABB.PushVectorID
+            LEFT JOIN PullPoint ON PullPoint.ID = TargetAABB.PullPointID
+            LEFT JOIN Position AS PullPosition
+                ON PullPosition.ID = PullPoint.PositionID
+            LEFT JOIN PullVector ON PullVector.ID = TargetAABB.PullVectorID
+            LEFT JOIN SpatulaPoint
+                ON SpatulaPoint.ID = TargetAABB.SpatulaPointID
+            LEFT JOIN Position AS SpatulaPosition
+                ON SpatulaPosition.ID = SpatulaPoint.PositionID
+            LEFT JOIN SpatulaVector
+                ON SpatulaVector.ID = TargetAABB.SpatulaVectorID''')
+
+    def _migrate_unique(self):
+        self._add_column('TargetAABB', 'ContentHash', 'TEXT')
+        # rows that would break the unique indexes are merged into the row
+        # with the lowest ID. Merged positions can make duplicate points.
+        self._merge_duplicates(
+            'Position', TABLE_COLUMNS['Position'],
+            [('TargetAABB', 'PositionID')] +
+            [(operation.capitalize() + 'Point', 'PositionID')
+             for operation in OPERATIONS])
+        for operation in OPERATIONS:
+            for table in (operation.capitalize() + 'Point',
+                          operation.capitalize() + 'Vector'):
+                self._merge_duplicates(table, TABLE_COLUMNS[table],
+                                       [('TargetAABB', table + 'ID')])
+        self.cursor.execute('SELECT ID, ' +
+                            ', '.join(TABLE_COLUMNS['TargetAABB']) +
+                            ' FROM TargetAABB ORDER BY ID')
+        hashes = {}
+        duplicates = []
+        for row in self.cursor.fetchall():
+            row_hash = content_hash(row[1:])
+            if row_hash in hashes:
+                duplicates.append((row[0],))
+            else:
+                hashes[row_hash] = row[0]
+        self.cursor.executemany('DELETE FROM TargetAABB WHERE ID=?',
+                                duplicates)
+        self.cursor.executemany(
+            'UPDATE TargetAABB SET ContentHash=? WHERE ID=?',
+            hashes.items())
+        for table, columns in UNIQUE_INDEXES:
+            self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ' + table +
+                                'Unique ON ' + table + ' (' +
+                                ', '.join(columns) + ')')
+
+    def _migrate_aabbs_version(self):
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS AABBsVersion (
+            ID INTEGER PRIMARY KEY CHECK (ID = 0),
+            Version INTEGER NOT NULL
+        )''')
+        self.cursor.execute('''INSERT OR IGNORE INTO AABBsVersion (ID, Version)
+            VALUES (0, 0)''')
+        # the triggers run in the transaction of the change, so inserted,
+        # updated and deleted rows are all counted, whoever writes them
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            self.cursor.execute('CREATE TRIGGER IF NOT EXISTS TargetAABB' +
+                                event.capitalize() + ' AFTER ' + event +
+                                ''' ON TargetAABB BEGIN
+                UPDATE AABBsVersion SET Version = Version + 1 WHERE ID = 0;
+                END''')
+
+    def _merge_duplicates(self, table, columns, references):
+        """
+        Deletes rows with the same values as a row with lower ID and points
+        the references to them to that row. NULL values are equal here.
+
+        Args:
+            table(str): Name of the table.
+            columns(tuple): Names of the columns compared.
+            references(list): A list of (table, column) tuples of the columns
+                with IDs of the rows.
+        """
+        self.cursor.execute('SELECT ID, ' + ', '.join(columns) + ' FROM ' +
+                            table + ' ORDER BY ID')
+        first_ids = {}
+        merged = []
+        for row in self.cursor.fetchall():
+            if row[1:] in first_ids:
+                merged.append((first_ids[row[1:]], row[0]))
+            else:
+                first_ids[row[1:]] = row[0]
+        for ref_table, ref_column in references:
+            self.cursor.executemany(
+                'UPDATE ' + ref_table + ' SET ' + ref_column + '=? WHERE ' +
+                ref_column + '=?', merged)
+        self.cursor.executemany('DELETE FROM ' + table + ' WHERE ID=?',
+                                [(row_id,) for _, row_id in merged])
+
+    def _add_column(self, table, column, definition):
+        """
+        Adds the column to the table if the table does not have it.
+
+        Returns:
+            True if the column was added.
+        """
+        self.cursor.execute('PRAGMA table_info(' + table + ')')
+        if column in [row[1] for row in self.cursor.fetchall()]:
+            return False
+        self.cursor.execute('ALTER TABLE ' + table + ' ADD COLUMN ' + column +
+                            ' ' + definition)
+        return True
+
+    def _upsert(self, table, columns, values, key_columns=None):
+        """
+        Inserts the row unless a row with the same values of the unique
+        index exists. NULL values are equal here, so rows of missing points
+        and vectors are reused too.
+
+        Args:
+            table(str): Name of the table.
+            columns(tuple): Names of the columns.
+            values(list): Values of the columns.
+            key_columns(tuple): Optional. Columns of the unique index.
+                Default columns.
 
-    def _insert_pos(self, pos):
-        self.cursor.execute('''INSERT INTO Position(X, Y, Z) VALUES(?,?,?)''',
-                            pos)
-        return self.cursor.lastrowid
+        Returns:
+            ID of the new or the existing row.
+        """
+        values = list(values)
+        if key_columns is None:
+            key_columns = columns
+        key_values = [values[columns.index(column)] for column in key_columns]
+        select = ('SELECT ID FROM ' + table + ' WHERE ' +
+                  ' AND '.join(column + ' IS ?' for column in key_columns) +
+                  ' ORDER BY ID LIMIT 1')
+        if None in key_values:
+            # the unique index does not stop rows with NULL values
+            self.cursor.execute(select, key_values)
+            row = self.cursor.fetchone()
+            if row is not None:
+                return row[0]
+        self.cursor.execute(
+            'INSERT INTO ' + table + '(' + ', '.join(columns) + ') VALUES(' +
+            ','.join('?' * len(columns)) + ') ON CONFLICT DO NOTHING', values)
+        if self.cursor.rowcount:
+            return self.cursor.lastrowid
+        self.cursor.execute(select, key_values)
+        return self.cursor.fetchone()[0]
 
     def save_scene(self, scene, scene_name, target_object):
         """
@@ -139,163 +393,271 @@ class sqlitedb:
             ID of the new (may be existing entry) entry in TargetAABB table.
         """
         # save scene to the file
+        file_path = self._pickle_scene(scene, scene_name)
+        # save additional data to database
+        aabb = target_object.aabb
+        values = [
+            file_path,
+            self._upsert('Position', TABLE_COLUMNS['Position'], aabb.pos)
+        ]
+        for operation in OPERATIONS:
+            table = operation.capitalize()
+            position_id = self._upsert('Position', TABLE_COLUMNS['Position'],
+                                       aabb.manipulation_points[operation])
+            values.append(
+                self._upsert(table + 'Point', TABLE_COLUMNS[table + 'Point'],
+                             (position_id,)))
+            values.append(
+                self._upsert(table + 'Vector', TABLE_COLUMNS[table + 'Vector'],
+                             aabb.manipulation_vectors[operation]))
+        values.extend(aabb.half_size[:3])
+        values.extend(aabb.collided_sides[side] for side in SIDES)
+
+        # Save TargetAABB
+        signatures, rotations = Mapping().get_canonical_signatures(
+            [values[11:17]])
+        target_aabb_id = self._upsert(
+            'TargetAABB', TABLE_COLUMNS['TargetAABB'] + TARGET_AABB_EXTRA,
+            values + [
+                content_hash(values),
+                int(signatures[0]),
+                int(rotations[0])
+            ], ('ContentHash',))
+
+        self.conn.commit()
+        return target_aabb_id
+
+    def save_scenes(self, scenes):
+        """
+        Saves many scenes to the database in one transaction. Positions,
+        points, vectors and AABBs that are already in the database or in the
+        batch are reused as in save_scene. Each table is written with one
+        _upsert_many call, so the lookups go through its unique index.
+
+        Args:
+            scenes(list): A list of (scene, scene_name, target_object) tuples
+                as the arguments of save_scene.
+
+        Returns:
+            A list of IDs of the entries (new or existing) in TargetAABB
+                table in the order of scenes.
+        """
+        if not scenes:
+            return []
+        with self.conn:
+            # the write lock is taken before the lookups, so other writers
+            # can not add the same rows in the meantime
+            if not self.conn.in_transaction:
+                self.cursor.execute('BEGIN IMMEDIATE')
+            aabbs = [target_object.aabb for _, _, target_object in scenes]
+            # position of each AABB followed by its manipulation points
+            position_ids = self._upsert_many(
+                'Position', TABLE_COLUMNS['Position'],
+                [point for aabb in aabbs for point in [aabb.pos] +
+                 [aabb.manipulation_points[operation]
+                  for operation in OPERATIONS]])
+            step = len(OPERATIONS) + 1
+            columns = [[
+                self._pickle_scene(scene, scene_name)
+                for scene, scene_name, _ in scenes
+            ], position_ids[::step]]
+            for k, operation in enumerate(OPERATIONS):
+                table = operation.capitalize()
+                columns.append(
+                    self._upsert_many(
+                        table + 'Point', TABLE_COLUMNS[table + 'Point'],
+                        [(position_id,)
+                         for position_id in position_ids[k + 1::step]]))
+                columns.append(
+                    self._upsert_many(
+                        table + 'Vector', TABLE_COLUMNS[table + 'Vector'],
+                        [aabb.manipulation_vectors[operation]
+                         for aabb in aabbs]))
+            rows = [
+                list(values) + list(aabb.half_size[:3]) +
+                [aabb.collided_sides[side] for side in SIDES]
+                for values, aabb in zip(zip(*columns), aabbs)
+            ]
+            signatures, rotations = Mapping().get_canonical_signatures(
+                [row[11:17] for row in rows])
+            target_aabb_ids = self._upsert_many(
+                'TargetAABB', TABLE_COLUMNS['TargetAABB'] + TARGET_AABB_EXTRA,
+                [
+                    row + [content_hash(row), signature, rotation]
+                    for row, signature, rotation in zip(
+                        rows, signatures.tolist(), rotations.tolist())
+                ], ('ContentHash',))
+        return target_aabb_ids
+
+    def _upsert_many(self, table, columns, rows, key_columns=None):
+        """
+        Inserts the rows that are not in the table yet, as _upsert does for
+        one row. The rows are put in a temporary table that is joined with
+        the table on the columns of its unique index, so only the rows of
+        the batch are looked up and new rows get their IDs from SQLite. NULL
+        values are equal here and the lowest ID of equal rows is used.
+
+        Args:
+            table(str): Name of the table.
+            columns(tuple): Names of the columns.
+            rows(list): A list of values of the columns. Equal rows are
+                inserted once.
+            key_columns(tuple): Optional. Columns of the unique index.
+                Default columns.
+
+        Returns:
+            A list of IDs of the new or the existing rows in the order of
+                rows.
+        """
+        if key_columns is None:
+            key_columns = columns
+        key_indices = [columns.index(column) for column in key_columns]
+        slots = []
+        distinct = {}
+        for row in rows:
+            row = tuple(row)
+            key = tuple(row[k] for k in key_indices)
+            if key not in distinct:
+                distinct[key] = (len(distinct),) + row
+            slots.append(distinct[key][0])
+
+        self.cursor.execute('CREATE TEMP TABLE SaveRows (Slot INTEGER ' +
+                            'PRIMARY KEY, ' + ', '.join(columns) + ')')
+        self.cursor.executemany(
+            'INSERT INTO temp.SaveRows VALUES(' +
+            ','.join('?' * (len(columns) + 1)) + ')', distinct.values())
+        match = ' AND '.join(table + '.' + column + ' IS SaveRows.' + column
+                             for column in key_columns)
+        self.cursor.execute('INSERT INTO ' + table + '(' +
+                            ', '.join(columns) + ') SELECT ' +
+                            ', '.join(columns) + ' FROM temp.SaveRows ' +
+                            'WHERE NOT EXISTS (SELECT 1 FROM ' + table +
+                            ' WHERE ' + match + ') ORDER BY Slot')
+        self.cursor.execute('SELECT Slot, MIN(' + table + '.ID) FROM ' +
+                            'temp.SaveRows JOIN ' + table + ' ON ' + match +
+                            ' GROUP BY Slot')
+        ids = dict(self.cursor.fetchall())
+        self.cursor.execute('DROP TABLE temp.SaveRows')
+        return [ids[slot] for slot in slots]
+
+    def _pickle_scene(self, scene, scene_name):
+        # saves the scene to the file and returns its path
         file_path = './scenes/pkl/' + scene_name + '.pkl'
         with open(file_path, 'wb') as f:
             pickle.dump(scene, f, pickle.HIGHEST_PROTOCOL)
-        # save additional data to database
-        # Save Position
-        aabb_pos_id = self._select_pos(target_object.aabb.pos)
-        if aabb_pos_id is None:
-            aabb_pos_id = self._insert_pos(target_object.aabb.pos)
-        else:
-            aabb_pos_id = aabb_pos_id[0]
-
-        # Save PushPoint
-        push_pos_id = self._select_pos(
-            target_object.aabb.manipulation_points['push'])
-        if push_pos_id is None:
-            push_pos_id = self._insert_pos(
-                target_object.aabb.manipulation_points['push'])
-        else:
-            push_pos_id = push_pos_id[0]
+        return file_path
 
-        self.cursor.execute('''SELECT ID FROM PushPoint WHERE PositionID=?''',
-                            (push_pos_id,))
-        push_point_id = self.cursor.fetchone()
-        if push_point_id is None:
-            self.cursor.execute(
-                '''INSERT INTO PushPoint(PositionID) VALUES(?)''',
-                (push_pos_id,))
-            push_point_id = self.cursor.lastrowid
-        else:
-            push_point_id = push_point_id[0]
+    def select_all_aabbs(self):
+        self.cursor.execute('''SELECT * FROM TargetAABB''')
+        results = self.cursor.fetchall()
+        return results
 
-        # Save PushVector
-        self.cursor.execute(
-            '''SELECT ID FROM PushVector WHERE VectorX=? AND VectorY=? AND VectorZ=?''',
-            target_object.aabb.manipulation_vectors['push'])
-        push_vec_id = self.cursor.fetchone()
-        if push_vec_id is None:
-            self.cursor.execute(
-                '''INSERT INTO PushVector(VectorX, VectorY, VectorZ) VALUES(?,?,?)''',
-                target_object.aabb.manipulation_vectors['push'])
-            push_vec_id = self.cursor.lastrowid
-        else:
-            push_vec_id = push_vec_id[0]
-
-        # Save PullPoint
-        pull_pos_id = self._select_pos(
-            target_object.aabb.manipulation_points['pull'])
-        if pull_pos_id is None:
-            pull_pos_id = self._insert_pos(
-                target_object.aabb.manipulation_points['pull'])
-        else:
-            pull_pos_id = pull_pos_id[0]
+    def select_aabb_columns(self, ids=None):
+        """
+        Loads AABBs of the KB with their positions, manipulation points and
+        vectors with one query of TargetAABBView (one for each chunk of
+        ids).
 
-        self.cursor.execute('''SELECT ID FROM PullPoint WHERE PositionID=?''',
-                            (pull_pos_id,))
-        pull_point_id = self.cursor.fetchone()
-        if pull_point_id is None:
-            self.cursor.execute(
-                '''INSERT INTO PullPoint(PositionID) VALUES(?)''',
-                (pull_pos_id,))
-            pull_point_id = self.cursor.lastrowid
-        else:
-            pull_point_id = pull_point_id[0]
+        Args:
+            ids(list): Optional. IDs of the AABBs. All AABBs by default.
 
-        # Save PullVector
-        self.cursor.execute(
-            '''SELECT ID FROM PullVector WHERE VectorX=? AND VectorY=? AND VectorZ=?''',
-            target_object.aabb.manipulation_vectors['pull'])
-        pull_vec_id = self.cursor.fetchone()
-        if pull_vec_id is None:
+        Returns:
+            Dict of column arrays sorted by ID: 'id' (N,), 'file_name' (N,),
+                'pos' (N, 3), 'half_size' (N, 3), 'collided_sides' (N, 6)
+                in the order of SIDES and '<operation>_point' and
+                '<operation>_vector' (N, 3) for each of OPERATIONS. Missing
+                values are NaN.
+        """
+        if ids is None:
             self.cursor.execute(
-                '''INSERT INTO PullVector(VectorX, VectorY, VectorZ) VALUES(?,?,?)''',
-                target_object.aabb.manipulation_vectors['pull'])
-            pull_vec_id = self.cursor.lastrowid
+                '''SELECT * FROM TargetAABBView ORDER BY ID''')
+            rows = self.cursor.fetchall()
         else:
-            pull_vec_id = pull_vec_id[0]
-
-        # Save SpatulaPoint
-        spatula_pos_id = self._select_pos(
-            target_object.aabb.manipulation_points['spatula'])
-        if spatula_pos_id is None:
-            spatula_pos_id = self._insert_pos(
-                target_object.aabb.manipulation_points['spatula'])
-        else:
-            spatula_pos_id = spatula_pos_id[0]
+            ids = [int(aabb_id) for aabb_id in ids]
+            rows = []
+            for start in range(0, len(ids), SELECT_IDS_CHUNK_SIZE):
+                chunk = ids[start:start + SELECT_IDS_CHUNK_SIZE]
+                self.cursor.execute(
+                    'SELECT * FROM TargetAABBView WHERE ID IN (' +
+                    ','.join('?' * len(chunk)) + ')', chunk)
+                rows.extend(self.cursor.fetchall())
+            rows.sort(key=lambda row: row[0])
+        # None becomes NaN in a float array
+        values = np.array([row[2:32] for row in rows],
+                          dtype=np.float64).reshape(-1, 30)
+        columns = {
+            'id': np.array([row[0] for row in rows], dtype=np.int64),
+            'file_name': np.array([row[1] for row in rows], dtype=object),
+            'pos': values[:, 0:3],
+            'half_size': values[:, 3:6],
+            'collided_sides': values[:, 6:12].astype(np.int64),
+        }
+        for i, operation in enumerate(OPERATIONS):
+            columns[operation + '_point'] = values[:, 12 + 6 * i:15 + 6 * i]
+            columns[operation + '_vector'] = values[:, 15 + 6 * i:18 + 6 * i]
+        return columns
+
+    def select_aabb_shapes(self):
+        """
+        Returns half sizes and collided sides of all rows of TargetAABB.
 
-        self.cursor.execute(
-            '''SELECT ID FROM SpatulaPoint WHERE PositionID=?''',
-            (spatula_pos_id,))
-        spatula_point_id = self.cursor.fetchone()
-        if spatula_point_id is None:
-            self.cursor.execute(
-                '''INSERT INTO SpatulaPoint(PositionID) VALUES(?)''',
-                (spatula_pos_id,))
-            spatula_point_id = self.cursor.lastrowid
-        else:
-            spatula_point_id = spatula_point_id[0]
+        Returns:
+            A list of (ID, HalfSizeX, HalfSizeY, HalfSizeZ, CollidedTop,
+                CollidedBottom, CollidedFront, CollidedBack, CollidedRight,
+                CollidedLeft) tuples sorted by ID.
+        """
+        self.cursor.execute('''SELECT ID, HalfSizeX, HalfSizeY, HalfSizeZ,
+            CollidedTop, CollidedBottom, CollidedFront, CollidedBack,
+            CollidedRight, CollidedLeft FROM TargetAABB ORDER BY ID''')
+        return self.cursor.fetchall()
 
-        # Save SpatulaVector
-        self.cursor.execute(
-            '''SELECT ID FROM SpatulaVector WHERE VectorX=? AND VectorY=? AND VectorZ=?''',
-            target_object.aabb.manipulation_vectors['spatula'])
-        spatula_vec_id = self.cursor.fetchone()
-        if spatula_vec_id is None:
-            self.cursor.execute(
-                '''INSERT INTO SpatulaVector(VectorX, VectorY, VectorZ) VALUES(?,?,?)''',
-                target_object.aabb.manipulation_vectors['spatula'])
-            spatula_vec_id = self.cursor.lastrowid
-        else:
-            spatula_vec_id = spatula_vec_id[0]
+    def select_aabbs_version(self):
+        """
+        Returns the version of TargetAABB. It is a counter that increases
+        when AABBs are added, changed or removed.
 
-        # Save TargetAABB
+        Returns:
+            The version as int or None if the tables were not migrated yet.
+        """
+        if self.select_schema_version() < 3:
+            return None
         self.cursor.execute(
-            '''SELECT ID FROM TargetAABB WHERE FileName=? AND PositionID=? AND
-            PushPointID=? AND PushVectorID=? AND PullPointID=? AND PullVectorID=? AND
-            SpatulaPointID=? AND SpatulaVectorID=? AND HalfSizeX=? AND HalfSizeY=? AND
-            HalfSizeZ=? AND CollidedTop=? AND CollidedBottom=? AND CollidedFront=? AND
-            CollidedBack=? AND CollidedRight=? AND CollidedLeft=?''',
-            (file_path, aabb_pos_id, push_point_id, push_vec_id, pull_point_id,
-             pull_vec_id, spatula_point_id, spatula_vec_id,
-             target_object.aabb.half_size[0], target_object.aabb.half_size[1],
-             target_object.aabb.half_size[2],
-             target_object.aabb.collided_sides['top'],
-             target_object.aabb.collided_sides['bottom'],
-             target_object.aabb.collided_sides['front'],
-             target_object.aabb.collided_sides['back'],
-             target_object.aabb.collided_sides['right'],
-             target_object.aabb.collided_sides['left']))
-        target_aabb_id = self.cursor.fetchone()
-        if target_aabb_id is None:
-            self.cursor.execute(
-                '''INSERT INTO TargetAABB(
-            FileName, PositionID, PushPointID, PushVectorID, PullPointID,
-            PullVectorID, SpatulaPointID, SpatulaVectorID, HalfSizeX, HalfSizeY,
-            HalfSizeZ, CollidedTop, CollidedBottom, CollidedFront, CollidedBack,
-            CollidedRight, CollidedLeft
-            )
-                VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
-                (file_path, aabb_pos_id, push_point_id, push_vec_id,
-                 pull_point_id, pull_vec_id, spatula_point_id, spatula_vec_id,
-                 target_object.aabb.half_size[0],
-                 target_object.aabb.half_size[1],
-                 target_object.aabb.half_size[2],
-                 target_object.aabb.collided_sides['top'],
-                 target_object.aabb.collided_sides['bottom'],
-                 target_object.aabb.collided_sides['front'],
-                 target_object.aabb.collided_sides['back'],
-                 target_object.aabb.collided_sides['right'],
-                 target_object.aabb.collided_sides['left']))
+            '''SELECT Version FROM AABBsVersion WHERE ID = 0''')
+        return self.cursor.fetchone()[0]
 
-        self.conn.commit()
-        return target_aabb_id
+    def select_schema_version(self):
+        """
+        Returns the version of the tables. Tables of an older version than
+        SCHEMA_VERSION have to be migrated by a writer, see migrate.
+        """
+        self.cursor.execute('PRAGMA user_version')
+        return self.cursor.fetchone()[0]
 
-    def select_all_aabbs(self):
-        self.cursor.execute('''SELECT * FROM TargetAABB''')
-        results = self.cursor.fetchall()
-        return results
+    def select_signature_counts(self):
+        """
+        Returns canonical signatures in TargetAABB and number of rows with
+        each of them.
+
+        Returns:
+            A list of (signature, count) tuples.
+        """
+        self.cursor.execute('''SELECT Signature, COUNT(*) FROM TargetAABB
+            GROUP BY Signature''')
+        return self.cursor.fetchall()
+
+    def select_aabbs_signature(self, signature):
+        """
+        Returns all rows of TargetAABB with the canonical signature.
+
+        Args:
+            signature(int): Canonical signature of collided sides.
+
+        Returns:
+            A list of rows of TargetAABB.
+        """
+        self.cursor.execute('''SELECT * FROM TargetAABB WHERE Signature=?''',
+                            (signature,))
+        return self.cursor.fetchall()
 
     def select_aabb_id(self, id):
         self.cursor.execute('''SELECT * FROM TargetAABB WHERE ID=?''', (id,))
@@ -373,6 +735,94 @@ class sqlitedb:
         return result
 
 
+def reader_pool(name, size=connection.READ_POOL_SIZE):
+    """
+    Returns a pool of read-only sqlitedb handles of the database file for
+    solvers running in parallel. The tables have to be created and migrated
+    by a writer first.
+
+    Args:
+        name(str): The database file name.
+        size(int): Optional. Maximum number of open handles. Default 4.
+
+    Returns:
+        connection.ReaderPool of sqlitedb objects.
+    """
+    return connection.ReaderPool(lambda: sqlitedb(name, read_only=True),
+                                 size)
+
+
+def writer(name):
+    """
+    Returns the writer of the database file. All writes submitted to it are
+    done one after another by one sqlitedb handle, which creates and
+    migrates the tables before the first write.
+
+    Args:
+        name(str): The database file name.
+
+    Returns:
+        connection.Writer of a sqlitedb object, for example
+            writer(name).submit(sqlitedb.save_scenes, scenes).
+    """
+
+    def open_db():
+        db = sqlitedb(name)
+        db.create_db()
+        return db
+
+    return connection.Writer(open_db)
+
+
+def content_hash(values):
+    """
+    Returns the hash of the content of a TargetAABB row. Values are
+    normalised, so the same AABB has the same hash whether the values come
+    from the database or from the scene.
+
+    Args:
+        values(list): Values of the columns of TargetAABB from FileName to
+            CollidedLeft.
+
+    Returns:
+        Hex digest of SHA-256.
+    """
+    normalised = ([str(values[0])] + [int(value) for value in values[1:8]] +
+                  [float(value) for value in values[8:11]] +
+                  [int(value) for value in values[11:17]])
+    return hashlib.sha256(repr(normalised).encode()).hexdigest()
+
+
+def aabbs_from_columns(columns):
+    """
+    Rebuilds AABB objects with collided sides, manipulation points and
+    vectors from the columns of sqlitedb.select_aabb_columns.
+
+    Args:
+        columns(dict): Dict of column arrays.
+
+    Returns:
+        A dict of AABB objects where the key is the ID.
+    """
+    aabbs = {}
+    for i, aabb_id in enumerate(columns['id'].tolist()):
+        aabb = AABB(columns['pos'][i].tolist(),
+                    columns['half_size'][i].tolist())
+        aabb.collided_sides.update(
+            zip(SIDES, columns['collided_sides'][i].tolist()))
+        for operation in OPERATIONS:
+            point = columns[operation + '_point'][i]
+            if np.isnan(point[0]):
+                aabb.manipulation_points[operation] = None
+                aabb.manipulation_vectors[operation] = None
+            else:
+                aabb.manipulation_points[operation] = point.tolist()
+                aabb.manipulation_vectors[operation] = columns[
+                    operation + '_vector'][i].astype(int).tolist()
+        aabbs[aabb_id] = aabb
+    return aabbs
+
+
 if __name__ == '__main__':
     # For testing purposes
     db = sqlitedb('kb.db')
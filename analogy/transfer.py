@@ -0,0 +1,129 @@
+import numpy as np
+
+# Manipulation operations of an AABB.
+OPERATIONS = ('push', 'pull', 'spatula')
+
+
+def rotation_matrices(axis_permutations, axis_signs):
+    """
+    Returns integer rotation matrices that rotate a source AABB to the
+    target for all sequences. A sequence is applied to the manipulation
+    vectors as rotations by 90 degrees in its own order, that is backwards
+    to the mapping from target to source, so the matrix is the transpose of
+    the mapping.
+
+    Args:
+        axis_permutations(numpy.ndarray): (24, 3) axis_permutations of
+            Mapping.
+        axis_signs(numpy.ndarray): (24, 3) axis_signs of Mapping.
+
+    Returns:
+        (24, 3, 3) int array. Source axis i becomes target axis
+            axis_permutations[k, i] with sign axis_signs[k, i].
+    """
+    axis_permutations = np.asarray(axis_permutations).reshape(-1, 3)
+    matrices = np.zeros((len(axis_permutations), 3, 3), dtype=int)
+    sequences = np.arange(len(axis_permutations))[:, np.newaxis]
+    matrices[sequences, axis_permutations,
+             np.arange(3)] = np.asarray(axis_signs).reshape(-1, 3)
+    return matrices
+
+
+def transfer(target_pos, target_half_size, source_pos, source_half_sizes,
+             points, vectors, axis_permutations, axis_signs):
+    """
+    Transfers manipulation points and vectors of many source AABBs to the
+    target AABB in one operation. Points are moved relative to the source
+    centre, scaled to the size of the target along the axes they map to,
+    rotated and moved to the target centre. Vectors are only rotated.
+
+    Args:
+        target_pos(list): [x,y,z] position of the target AABB.
+        target_half_size(list): [x,y,z] half size of the target AABB.
+        source_pos(numpy.ndarray): (K, 3) positions of the source AABBs.
+        source_half_sizes(numpy.ndarray): (K, 3) half sizes of the source
+            AABBs.
+        points(numpy.ndarray): (K, P, 3) manipulation points of the source
+            AABBs. Missing points are NaN.
+        vectors(numpy.ndarray): (K, P, 3) manipulation vectors of the source
+            AABBs. Missing vectors are NaN.
+        axis_permutations(numpy.ndarray): (K, 3) axis_permutations of the
+            sequence of each source AABB.
+        axis_signs(numpy.ndarray): (K, 3) axis_signs of the sequence of each
+            source AABB.
+
+    Returns:
+        Tuple of (K, P, 3) points and (K, P, 3) vectors in the target scene.
+    """
+    axis_permutations = np.asarray(axis_permutations).reshape(-1, 3)
+    matrices = rotation_matrices(axis_permutations, axis_signs)
+    source_pos = np.asarray(source_pos, dtype=np.float64).reshape(-1, 1, 3)
+    source_half_sizes = np.asarray(source_half_sizes,
+                                   dtype=np.float64).reshape(-1, 3)
+    # source axis i is scaled by the target axis it is rotated to
+    ratios = np.asarray(target_half_size, dtype=np.float64)[
+        axis_permutations] / source_half_sizes
+    relative_pos = (np.asarray(points, dtype=np.float64) - source_pos) * (
+        ratios[:, np.newaxis, :])
+    target_points = np.einsum('kij,kpj->kpi', matrices, relative_pos)
+    target_points += np.asarray(target_pos, dtype=np.float64)
+    target_vectors = np.einsum('kij,kpj->kpi', matrices,
+                               np.asarray(vectors, dtype=np.float64))
+    return target_points, target_vectors
+
+
+def transfer_aabbs(mapping, target_aabb, source_aabbs, sequences):
+    """
+    Transfers manipulation points and vectors of the source AABBs to the
+    target AABB, see transfer.
+
+    Args:
+        mapping(Mapping): Mapping object with the permutation tables.
+        target_aabb(AABB): The target AABB.
+        source_aabbs(list): Source AABB objects with manipulation points and
+            vectors.
+        sequences(list): The best sequence of each source AABB.
+
+    Returns:
+        A list of (manipulation points, manipulation vectors) dicts for each
+            source AABB. Missing points and vectors are [None, None, None].
+    """
+    if not source_aabbs:
+        return []
+    rows = [
+        mapping.permutations_tuple.index(sequence) for sequence in sequences
+    ]
+    points = np.array([[_vector(aabb.manipulation_points.get(operation))
+                        for operation in OPERATIONS]
+                       for aabb in source_aabbs])
+    vectors = np.array([[_vector(aabb.manipulation_vectors.get(operation))
+                         for operation in OPERATIONS]
+                        for aabb in source_aabbs])
+    target_points, target_vectors = transfer(
+        target_aabb.pos, target_aabb.half_size,
+        [aabb.pos for aabb in source_aabbs],
+        [aabb.half_size for aabb in source_aabbs], points, vectors,
+        mapping.axis_permutations[rows], mapping.axis_signs[rows])
+    results = []
+    for aabb_points, aabb_vectors in zip(target_points.tolist(),
+                                         target_vectors.tolist()):
+        results.append(({
+            operation: _missing(point)
+            for operation, point in zip(OPERATIONS, aabb_points)
+        }, {
+            operation: _missing(vector)
+            for operation, vector in zip(OPERATIONS, aabb_vectors)
+        }))
+    return results
+
+
+def _vector(value):
+    if value is None or value[0] is None:
+        return [np.nan, np.nan, np.nan]
+    return [float(v) for v in value]
+
+
+def _missing(value):
+    if np.isnan(value[0]):
+        return [None, None, None]
+    return value
@@ -0,0 +1,203 @@
+import itertools
+
+import numpy as np
+
+from analogy.mapping import COLLISION_WEIGHTS
+from analogy.mapping import DEFAULT_WEIGHTS
+from analogy.mapping import Mapping
+from analogy.mapping import NO_SURFACE_WEIGHT
+from analogy.mapping import RATIO_WEIGHTS
+from analogy.mapping import SIDES
+from analogy.mapping import SURFACE_WEIGHTS
+from analogy.mapping import WEIGHT_NAMES
+from analogy.mapping import half_size_ratios
+
+# Number of scores (entries x configurations) or features (entries x
+# mappings x weights) computed at once by sweep.
+SWEEP_BLOCK_SIZE = 1 << 22
+
+
+def weight_grid(values, base=DEFAULT_WEIGHTS):
+    """
+    Returns weight configurations of all combinations of the values.
+
+    Args:
+        values(dict): Dict where the key is a name from WEIGHT_NAMES and
+            value is a list of values of the weight.
+        base(list): Optional. Weights that are not in values.
+            Default DEFAULT_WEIGHTS.
+
+    Returns:
+        (C, 13) array of weights vectors in the order of WEIGHT_NAMES.
+    """
+    names = list(values.keys())
+    for name in names:
+        if name not in WEIGHT_NAMES:
+            raise ValueError('Unknown weight ' + name + '.')
+    combinations = list(itertools.product(*[values[name] for name in names]))
+    weights = np.tile(np.array(base, dtype=np.float64),
+                      (len(combinations), 1))
+    for i, name in enumerate(names):
+        weights[:, WEIGHT_NAMES.index(name)] = [
+            combination[i] for combination in combinations
+        ]
+    return weights
+
+
+def score_features(mapping, target_sides, target_half_size, source_sides,
+                   source_half_sizes):
+    """
+    Returns features of the scores of the target against the source AABBs
+    for all mappings. The score is linear in the weights, so the score for
+    any weights vector is 1 + features @ weights. It is the same score as
+    from Mapping.get_scores_matrix, only added in a different order.
+
+    Args:
+        mapping(Mapping): Mapping object with the permutation tables.
+        target_sides(list): Collided sides of the target in the order of
+            SIDES.
+        target_half_size(list): [x,y,z] half size of the target.
+        source_sides(numpy.ndarray): (N, 6) collided sides of the sources.
+        source_half_sizes(numpy.ndarray): (N, 3) half sizes of the sources.
+
+    Returns:
+        (N, 24, 13) array. The last axis is in the order of WEIGHT_NAMES.
+    """
+    target_sides = np.asarray(target_sides).reshape(len(SIDES))
+    source_sides = np.asarray(source_sides).reshape(-1, len(SIDES))
+    mapped_sides = source_sides[:, mapping.side_permutations]
+    exact = mapped_sides == target_sides
+    partial = ~exact & (target_sides != 0) & (mapped_sides != 0)
+    n_perms = len(mapping.permutations_tuple)
+    features = np.empty((len(source_sides), n_perms, len(WEIGHT_NAMES)))
+    features[:, :, COLLISION_WEIGHTS] = np.stack(
+        [exact.sum(axis=2),
+         partial.sum(axis=2), (~exact & ~partial).sum(axis=2)],
+        axis=2)
+    surface_match = mapping.side_permutations == np.arange(len(SIDES))
+    features[:, :, SURFACE_WEIGHTS] = surface_match
+    features[:, :, NO_SURFACE_WEIGHT] = (~surface_match).sum(axis=1)
+    target_ratios = half_size_ratios(
+        np.abs(np.asarray(target_half_size,
+                          dtype=np.float64))[mapping.axis_permutations])
+    source_ratios = half_size_ratios(source_half_sizes)
+    features[:, :, RATIO_WEIGHTS] = -np.abs(target_ratios -
+                                            source_ratios[:, np.newaxis])
+    return features
+
+
+def sweep(query_sides,
+          query_half_sizes,
+          kb_sides,
+          kb_half_sizes,
+          relevant,
+          weights,
+          exclude=None,
+          mapping=None):
+    """
+    Scores every query against every knowledge base entry for all weight
+    configurations and returns how often the best entry is a relevant one.
+    The features of a query are computed for a block of entries at a time
+    and all configurations are scored with one matrix product for each
+    mapping, instead of running the retrieval once per configuration.
+
+    Args:
+        query_sides(numpy.ndarray): (Q, 6) collided sides of the queries.
+        query_half_sizes(numpy.ndarray): (Q, 3) half sizes of the queries.
+        kb_sides(numpy.ndarray): (N, 6) collided sides of the entries.
+        kb_half_sizes(numpy.ndarray): (N, 3) half sizes of the entries.
+        relevant(numpy.ndarray): (Q, N) bool array. True if the entry is a
+            correct answer for the query, see relevant_labels.
+        weights(numpy.ndarray): (C, 13) weights vectors, see weight_grid.
+        exclude(numpy.ndarray): Optional. (Q, N) bool array of entries that
+            can not be retrieved for the query. For example np.eye(N) when
+            the queries are the entries themselves.
+        mapping(Mapping): Optional. Mapping object with the permutation
+            tables.
+
+    Returns:
+        Tuple of (C,) accuracy of each configuration and (C, Q) index of the
+            best entry for each configuration and query (-1 if all entries
+            are excluded). Equal scores are won by the lower index.
+    """
+    if mapping is None:
+        mapping = Mapping()
+    query_sides = np.asarray(query_sides).reshape(-1, len(SIDES))
+    query_half_sizes = np.asarray(query_half_sizes,
+                                  dtype=np.float64).reshape(-1, 3)
+    kb_sides = np.asarray(kb_sides).reshape(-1, len(SIDES))
+    kb_half_sizes = np.asarray(kb_half_sizes, dtype=np.float64).reshape(-1, 3)
+    relevant = np.asarray(relevant, dtype=bool).reshape(len(query_sides),
+                                                        len(kb_sides))
+    weights = np.asarray(weights, dtype=np.float64).reshape(
+        -1, len(WEIGHT_NAMES))
+    n_configs = len(weights)
+    n_perms = len(mapping.permutations_tuple)
+    weights_t = np.ascontiguousarray(weights.T)
+    block = max(
+        1, SWEEP_BLOCK_SIZE // max(n_configs, n_perms * len(WEIGHT_NAMES)))
+
+    best_entries = np.full((n_configs, len(query_sides)), -1, dtype=np.int64)
+    for q in range(len(query_sides)):
+        best_scores = np.full(n_configs, -np.inf)
+        for start in range(0, len(kb_sides), block):
+            stop = min(start + block, len(kb_sides))
+            features = score_features(mapping, query_sides[q],
+                                      query_half_sizes[q],
+                                      kb_sides[start:stop],
+                                      kb_half_sizes[start:stop])
+            # (entries, configurations) scores of the best mapping. One
+            # mapping at a time keeps the scores in cache.
+            scores = features[:, 0] @ weights_t
+            perm_scores = np.empty_like(scores)
+            for k in range(1, n_perms):
+                np.matmul(features[:, k], weights_t, out=perm_scores)
+                np.maximum(scores, perm_scores, out=scores)
+            if exclude is not None:
+                excluded = np.asarray(exclude[q][start:stop], dtype=bool)
+                scores[excluded] = -np.inf
+            entries = scores.argmax(axis=0)
+            entry_scores = scores[entries, np.arange(n_configs)]
+            better = entry_scores > best_scores
+            best_scores[better] = entry_scores[better]
+            best_entries[better, q] = entries[better] + start
+
+    found = best_entries >= 0
+    hits = found & relevant[np.arange(len(query_sides)),
+                            np.maximum(best_entries, 0)]
+    accuracy = hits.mean(axis=1) if len(query_sides) else np.zeros(n_configs)
+    return accuracy, best_entries
+
+
+def relevant_labels(query_labels, kb_labels):
+    """
+    Returns which entries are correct answers for the queries when an entry
+    is correct if it has the same label as the query.
+
+    Args:
+        query_labels(list): Label of each query.
+        kb_labels(list): Label of each knowledge base entry.
+
+    Returns:
+        (Q, N) bool array.
+    """
+    return (np.asarray(query_labels)[:, np.newaxis] ==
+            np.asarray(kb_labels)[np.newaxis, :])
+
+
+def best_configurations(weights, accuracy, n=10):
+    """
+    Returns the weight configurations with the highest accuracy.
+
+    Args:
+        weights(numpy.ndarray): (C, 13) weights vectors.
+        accuracy(numpy.ndarray): (C,) accuracy from sweep.
+        n(int): Optional. Number of configurations to return. Default 10.
+
+    Returns:
+        A list of (accuracy, dict of weights) tuples sorted by the highest
+            accuracy.
+    """
+    order = np.argsort(-np.asarray(accuracy), kind='stable')[:n]
+    return [(float(accuracy[i]), dict(zip(WEIGHT_NAMES, weights[i].tolist())))
+            for i in order.tolist()]
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+from tests.test_broad_phase import MIN_DISTANCE
+from tests.test_broad_phase import box_meshes
+from tests.test_broad_phase import random_boxes
+
+
+class TestBatchedAABBTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        self.pos, self.half_size = random_boxes(rng, 40)
+        self.meshes = box_meshes(self.pos, self.half_size)
+        # integer vertices, so many of them are exactly min_distance away
+        # from a side of an AABB
+        self.vertices = rng.integers(-5, 65, (500, 3)).astype(np.float64)
+
+    def test_vertices_match_scalar(self):
+        for min_distance in (0, MIN_DISTANCE):
+            with self.subTest(min_distance=min_distance):
+                expected = np.array(
+                    [[
+                        aabb_col.aabb_intersect_vertex(mesh, vertex,
+                                                       min_distance)
+                        for mesh in self.meshes
+                    ]
+                     for vertex in self.vertices.tolist()])
+                self.assertTrue(0 < expected.sum() < expected.size)
+                np.testing.assert_array_equal(
+                    aabb_col.aabb_intersect_vertices(self.pos,
+                                                     self.half_size,
+                                                     self.vertices,
+                                                     min_distance), expected)
+                np.testing.assert_array_equal(
+                    aabb_col.aabb_intersect_vertices(self.pos[0],
+                                                     self.half_size[0],
+                                                     self.vertices,
+                                                     min_distance),
+                    expected[:, 0])
+
+    def test_matrix_matches_scalar(self):
+        for min_distance in (0, MIN_DISTANCE):
+            with self.subTest(min_distance=min_distance):
+                expected = np.array([[
+                    aabb_col.aabb_intersect(mesh_1, mesh_2, min_distance)
+                    for mesh_2 in self.meshes
+                ]
+                                     for mesh_1 in self.meshes])
+                np.testing.assert_array_equal(
+                    aabb_col.aabb_intersect_matrix(self.pos, self.half_size,
+                                                   min_distance), expected)
+
+    def test_min_distance_boundary(self):
+        # a vertex and an AABB exactly min_distance apart do not intersect
+        pos = np.array([[0., 0., 0.], [2 + 1 + MIN_DISTANCE, 0., 0.]])
+        half_size = np.array([[2., 1., 1.], [1., 1., 1.]])
+        vertices = np.array([[2 + MIN_DISTANCE, 0, 0],
+                             [2 + MIN_DISTANCE - 1e-9, 0, 0]])
+        np.testing.assert_array_equal(
+            aabb_col.aabb_intersect_vertices(pos[0], half_size[0], vertices,
+                                             MIN_DISTANCE), [False, True])
+        self.assertFalse(
+            aabb_col.aabb_intersect_matrix(pos, half_size,
+                                           MIN_DISTANCE)[0, 1])
+        self.assertTrue(
+            aabb_col.aabb_intersect_matrix(pos, half_size,
+                                           MIN_DISTANCE + 1e-9)[0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import types
+import unittest
+
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+from analogy.collision_detection import broad_phase
+
+MIN_DISTANCE = 3
+
+
+def random_boxes(rng, n):
+    # integer positions and sizes, so many pairs are exactly min_distance
+    # apart
+    pos = rng.integers(0, 60, (n, 3)).astype(np.float64)
+    half_size = rng.integers(0, 4, (n, 3)).astype(np.float64)
+    return pos, half_size
+
+
+def box_meshes(pos, half_size):
+    return [
+        types.SimpleNamespace(
+            aabb=types.SimpleNamespace(pos=p.tolist(), half_size=h.tolist()))
+        for p, h in zip(pos, half_size)
+    ]
+
+
+def brute_force_pairs(pos, half_size, min_distance):
+    meshes = box_meshes(pos, half_size)
+    return [[i, j] for i in range(len(meshes))
+            for j in range(i + 1, len(meshes))
+            if aabb_col.aabb_intersect(meshes[i], meshes[j], min_distance)]
+
+
+class TestSweepAndPrune(unittest.TestCase):
+
+    def test_pairs_match_brute_force(self):
+        rng = np.random.default_rng(6)
+        for n in (0, 1, 2, 300):
+            pos, half_size = random_boxes(rng, n)
+            for min_distance in (0, MIN_DISTANCE):
+                with self.subTest(n=n, min_distance=min_distance):
+                    pairs = broad_phase.sweep_and_prune(pos, half_size,
+                                                        min_distance)
+                    expected = brute_force_pairs(pos, half_size, min_distance)
+                    self.assertEqual(pairs.tolist(), expected)
+
+    def test_find_pairs_matches_matrix(self):
+        rng = np.random.default_rng(8)
+        # below and above the limit where the sweep replaces the matrix
+        for n in (10, broad_phase.MATRIX_LIMIT, 300):
+            pos, half_size = random_boxes(rng, n)
+            for min_distance in (0, MIN_DISTANCE):
+                with self.subTest(n=n, min_distance=min_distance):
+                    matrix = aabb_col.aabb_intersect_matrix(
+                        pos, half_size, min_distance)
+                    expected = np.argwhere(np.triu(matrix, k=1))
+                    np.testing.assert_array_equal(
+                        broad_phase.find_pairs(pos, half_size, min_distance),
+                        expected)
+                    np.testing.assert_array_equal(
+                        broad_phase.sweep_and_prune(pos, half_size,
+                                                    min_distance), expected)
+
+    def test_find_neighbours(self):
+        pos, half_size = random_boxes(np.random.default_rng(7), 300)
+        meshes = box_meshes(pos, half_size)
+        neighbours = broad_phase.find_neighbours(meshes, MIN_DISTANCE)
+        for i, mesh_1 in enumerate(meshes):
+            self.assertEqual(neighbours[i], [
+                j for j, mesh_2 in enumerate(meshes) if i != j and
+                aabb_col.aabb_intersect(mesh_1, mesh_2, MIN_DISTANCE)
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
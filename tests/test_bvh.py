@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from analogy.collision_detection import bvh
+
+
+def random_triangles(rng, n, offset):
+    corners = rng.uniform(0, 10, (n, 1, 3)) + offset
+    return corners + rng.uniform(-1, 1, (n, 3, 3))
+
+
+class TestBVH(unittest.TestCase):
+
+    def test_candidate_pairs_match_brute_force(self):
+        rng = np.random.default_rng(10)
+        for n_a, n_b, leaf_size in ((200, 150, 8), (37, 5, 4), (1, 90, 8)):
+            with self.subTest(n_a=n_a, n_b=n_b, leaf_size=leaf_size):
+                tris_a = random_triangles(rng, n_a, 0)
+                tris_b = random_triangles(rng, n_b, 5)
+                bvh_a = bvh.BVH(tris_a, leaf_size)
+                bvh_b = bvh.BVH(tris_b, leaf_size)
+                lower_a, upper_a = tris_a.min(axis=1), tris_a.max(axis=1)
+                lower_b, upper_b = tris_b.min(axis=1), tris_b.max(axis=1)
+                overlap = np.all(
+                    (lower_a[:, np.newaxis] <= upper_b[np.newaxis]) &
+                    (lower_b[np.newaxis] <= upper_a[:, np.newaxis]),
+                    axis=2)
+                pairs = bvh.candidate_pairs(bvh_a, bvh_b)
+                found = np.stack(
+                    [bvh_a.order[pairs[:, 0]], bvh_b.order[pairs[:, 1]]],
+                    axis=1)
+                self.assertEqual(sorted(map(tuple, found.tolist())),
+                                 sorted(map(tuple,
+                                            np.argwhere(overlap).tolist())))
+
+    def test_empty_mesh(self):
+        tris = random_triangles(np.random.default_rng(1), 10, 0)
+        empty = bvh.BVH(np.zeros((0, 3, 3)))
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(len(bvh.candidate_pairs(bvh.BVH(tris), empty)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from analogy.storage import connection
+from analogy.storage import sqlitedb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Handle:
+    """Handle of the pool and writer tests that remembers its thread."""
+
+    def __init__(self, opened):
+        self.closed = False
+        self.thread = threading.get_ident()
+        opened.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+class TestReaderPool(unittest.TestCase):
+
+    def test_handles_are_reused_and_limited(self):
+        opened = []
+        pool = connection.ReaderPool(lambda: Handle(opened), size=2)
+        with pool.acquire() as handle_1:
+            with pool.acquire() as handle_2:
+                self.assertIsNot(handle_1, handle_2)
+                with self.assertRaises(queue.Empty):
+                    with pool.acquire(timeout=0.01):
+                        pass
+        with pool.acquire() as handle:
+            self.assertIn(handle, (handle_1, handle_2))
+        self.assertEqual(len(opened), 2)
+        pool.close()
+        self.assertTrue(all(handle.closed for handle in opened))
+        with self.assertRaises(RuntimeError):
+            with pool.acquire():
+                pass
+
+    def test_handle_in_use_is_closed_when_returned(self):
+        opened = []
+        pool = connection.ReaderPool(lambda: Handle(opened))
+        with pool.acquire() as handle:
+            pool.close()
+            self.assertFalse(handle.closed)
+        self.assertTrue(handle.closed)
+
+
+class TestWriter(unittest.TestCase):
+
+    def test_writes_run_in_order_on_one_thread(self):
+        opened = []
+        writer = connection.Writer(lambda: Handle(opened))
+        calls = []
+        futures = [
+            writer.submit(lambda handle, i: calls.append((handle, i)) or i, i)
+            for i in range(20)
+        ]
+        writer.close()
+        self.assertEqual([future.result() for future in futures],
+                         list(range(20)))
+        self.assertEqual([i for _, i in calls], list(range(20)))
+        self.assertEqual(len(opened), 1)
+        self.assertTrue(opened[0].closed)
+        self.assertNotEqual(opened[0].thread, threading.get_ident())
+        self.assertTrue(all(handle is opened[0] for handle, _ in calls))
+
+
+class TestKBConnections(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kb_db_name = os.path.join(self.tmp_dir.name, 'kb.db')
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), self.kb_db_name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_file(self):
+        with open(self.kb_db_name, 'rb') as f:
+            return f.read()
+
+    def test_readers_do_not_change_the_file(self):
+        content = self.read_file()
+        pool = sqlitedb.reader_pool(self.kb_db_name)
+        with pool.acquire() as db:
+            self.assertEqual(db.select_schema_version(), 0)
+            self.assertEqual(len(db.select_all_aabbs()), 18)
+            with self.assertRaises(sqlite3.OperationalError):
+                db.create_db()
+        pool.close()
+        self.assertEqual(self.read_file(), content)
+
+    def test_writer_migrates_and_readers_see_writes(self):
+        writer = sqlitedb.writer(self.kb_db_name)
+        version = writer.submit(sqlitedb.sqlitedb.select_schema_version)
+        writer.close()
+        self.assertEqual(version.result(), sqlitedb.SCHEMA_VERSION)
+        pool = sqlitedb.reader_pool(self.kb_db_name)
+        with pool.acquire() as db:
+            self.assertEqual(db.select_schema_version(),
+                             sqlitedb.SCHEMA_VERSION)
+            self.assertEqual(len(db.select_all_aabbs()), 18)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
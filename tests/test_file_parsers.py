@@ -0,0 +1,139 @@
+import json
+import os
+import types
+import unittest
+
+import numpy as np
+
+import analogy.file_parsers as file_parsers
+from analogy.mesh import SceneArrays
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# AABBs, collided sides and closest surfaces of the bundled scenes computed
+# by the original implementation (the baseline commit) with min_distance 3.
+# Closest surfaces are indices into mesh.surfaces.
+GOLDEN_SCENES = os.path.join(REPO_DIR, 'tests', 'data', 'scenes.json')
+
+
+def load_golden_scenes():
+    with open(GOLDEN_SCENES) as f:
+        return json.load(f)
+
+
+def closest_surface_indices(mesh):
+    # surfaces are views, so they are compared by their face index
+    start = mesh.scene_arrays.face_range(mesh.index).start
+    return {
+        side: sorted(surface.index - start for surface in surfaces)
+        for side, surfaces in mesh.aabb.closest_surfaces.items()
+    }
+
+
+class TestReadObjFile(unittest.TestCase):
+
+    def test_aabbs_match_baseline(self):
+        for path, meshes in load_golden_scenes().items():
+            with self.subTest(scene=path):
+                scene = file_parsers.read_obj_file(
+                    os.path.join(REPO_DIR, path))
+                self.assertEqual(sorted(scene), sorted(meshes))
+                for name, golden in meshes.items():
+                    aabb = scene[name].aabb
+                    np.testing.assert_allclose(aabb.pos,
+                                               golden['pos'],
+                                               rtol=0,
+                                               atol=1e-9)
+                    np.testing.assert_allclose(aabb.half_size,
+                                               golden['half_size'],
+                                               rtol=0,
+                                               atol=1e-9)
+
+    def test_closest_surfaces_match_baseline(self):
+        for path, meshes in load_golden_scenes().items():
+            with self.subTest(scene=path):
+                scene = file_parsers.read_obj_file(
+                    os.path.join(REPO_DIR, path))
+                for name, golden in meshes.items():
+                    self.assertEqual(closest_surface_indices(scene[name]),
+                                     golden['closest_surfaces'], name)
+
+    def test_default_side_tolerance_keeps_kb_valid(self):
+        # a positive tolerance changes collided sides of the stored KBs
+        self.assertEqual(file_parsers.SIDE_TOLERANCE, 0)
+
+    def test_meshes_are_views_of_scene_arrays(self):
+        scene = file_parsers.read_obj_file(
+            os.path.join(REPO_DIR, 'scenes', 'books-shelf.obj'))
+        scene_arrays = next(iter(scene.values())).scene_arrays
+        self.assertIsInstance(scene_arrays, SceneArrays)
+        self.assertEqual(scene_arrays.mesh_names, list(scene))
+        self.assertEqual(int(scene_arrays.face_offsets[-1]),
+                         len(scene_arrays.faces))
+        for index, mesh in enumerate(scene.values()):
+            self.assertIs(mesh.scene_arrays, scene_arrays)
+            self.assertEqual(mesh.index, index)
+            face_range = scene_arrays.face_range(index)
+            self.assertEqual(len(mesh.surfaces),
+                             face_range.stop - face_range.start)
+            # colliders are centroids of the triangles
+            triangles = scene_arrays.vertices[scene_arrays.faces[face_range]]
+            np.testing.assert_allclose(scene_arrays.colliders[face_range],
+                                       triangles.mean(axis=1))
+            surface = mesh.surfaces[-1]
+            np.testing.assert_allclose(surface.collider,
+                                       triangles[-1].mean(axis=0))
+            np.testing.assert_allclose(
+                [vertex.pos for vertex in surface.vertices], triangles[-1])
+
+    def test_float32_vertices(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'books-shelf.obj')
+        scene = file_parsers.read_obj_file(obj_file_path)
+        scene_32 = file_parsers.read_obj_file(obj_file_path, dtype=np.float32)
+        for name, mesh in scene.items():
+            self.assertEqual(mesh.scene_arrays.vertices.dtype, np.float64)
+            self.assertEqual(scene_32[name].scene_arrays.vertices.dtype,
+                             np.float32)
+            np.testing.assert_allclose(scene_32[name].vertices,
+                                       mesh.vertices,
+                                       rtol=1e-6)
+
+    def test_find_closest_surfaces(self):
+        colliders = np.array([[0, 0, 0], [1, 2, 3], [1, 2 - 1e-5, -3],
+                              [-1, 1, 0]])
+        expected = {
+            'top': [1],
+            'bottom': [0],
+            'front': [1],
+            'back': [2],
+            'right': [1, 2],
+            'left': [3],
+        }
+        closest = file_parsers.find_closest_surfaces(colliders, tolerance=0)
+        self.assertEqual(
+            {side: indices.tolist() for side, indices in closest.items()},
+            expected)
+        closest = file_parsers.find_closest_surfaces(colliders,
+                                                     tolerance=1e-4)
+        self.assertEqual(closest['top'].tolist(), [1, 2])
+        closest = file_parsers.find_closest_surfaces(np.zeros((0, 3)))
+        self.assertTrue(all(len(indices) == 0 for indices in closest.values()))
+
+    def test_iter_obj_meshes_streams_the_meshes(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'books-shelf.obj')
+        meshes = file_parsers.iter_obj_meshes(obj_file_path)
+        self.assertIsInstance(meshes, types.GeneratorType)
+        self.assertEqual([mesh.name for mesh in meshes],
+                         list(file_parsers.read_obj_file(obj_file_path)))
+
+    def test_mesh_colors_from_mtl_file(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'basic-cube.obj')
+        colors = file_parsers.read_mtl_file(
+            obj_file_path.replace('.obj', '.mtl'))
+        self.assertEqual(colors['Green_0'], (0.129412, 0.733333, 0.298039))
+        for mesh in file_parsers.iter_obj_meshes(obj_file_path):
+            self.assertIn(tuple(mesh.color), colors.values())
+        self.assertEqual(file_parsers.read_mtl_file('missing.mtl'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import unittest
+
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import scene_collision
+from analogy.collision_detection.incremental_scene import IncrementalScene
+from analogy.collision_detection.incremental_scene import translate_mesh
+from analogy.scene_analysis import ScenePipeline
+from tests.test_file_parsers import REPO_DIR
+from tests.test_scene_collision import MIN_DISTANCE
+from tests.test_triangle_col_detect import triangle_col_detect
+
+OBJ_FILE_PATH = os.path.join(REPO_DIR, 'scenes', 'cans-shelf-2.obj')
+
+
+def analysis(scene):
+    """Results of the analysis of each mesh that the tests compare."""
+    return {
+        name: {
+            'collided_sides': dict(mesh.aabb.collided_sides),
+            'collision': bool(mesh.collision),
+            'collided_objects': sorted(mesh.collided_objects),
+            'surfaces': [(k, sorted(surface.collided_objects))
+                         for k, surface in enumerate(mesh.surfaces)
+                         if surface.collision],
+        } for name, mesh in scene.items()
+    }
+
+
+class TestIncrementalScene(unittest.TestCase):
+
+    contact_mode = 'centroid'
+
+    def setUp(self):
+        self.rng = np.random.default_rng(12)
+        self.offsets = []
+        self.removed = []
+
+    def rebuild(self):
+        # full analysis of the scene after the same changes
+        scene = file_parsers.read_obj_file(OBJ_FILE_PATH)
+        for name, offset in self.offsets:
+            translate_mesh(scene[name], offset)
+        for name in self.removed:
+            del scene[name]
+        scene_collision.analyse_scene(scene, MIN_DISTANCE, self.contact_mode)
+        return analysis(scene)
+
+    def assert_matches_rebuild(self, incremental):
+        self.assertEqual(analysis(incremental.scene), self.rebuild())
+        for name, mesh in incremental.scene.items():
+            self.assertEqual(
+                incremental.neighbours(name),
+                sorted(other.name
+                       for other in incremental.scene.values()
+                       if other is not mesh and
+                       aabb_col.aabb_intersect(mesh, other, MIN_DISTANCE)))
+
+    def test_updates_match_rebuild(self):
+        incremental = IncrementalScene(
+            file_parsers.read_obj_file(OBJ_FILE_PATH), MIN_DISTANCE,
+            self.contact_mode)
+        self.assert_matches_rebuild(incremental)
+        names = list(incremental.scene)
+        for step in range(16):
+            name = names[self.rng.integers(len(names))]
+            # small moves change contacts, large ones leave the grid cells
+            # of the mesh
+            offset = self.rng.uniform(-15, 15, 3) * (1 if step % 4 else 20)
+            with self.subTest(step=step, name=name):
+                incremental.move_mesh(name, offset)
+                self.offsets.append((name, offset))
+                self.assert_matches_rebuild(incremental)
+
+        removed = []
+        for name in names[3:6]:
+            with self.subTest(remove=name):
+                mesh, _ = incremental.remove_mesh(name)
+                removed.append(mesh)
+                self.removed.append(name)
+                self.assert_matches_rebuild(incremental)
+        for mesh in removed:
+            with self.subTest(add=mesh.name):
+                incremental.add_mesh(mesh)
+                self.removed.remove(mesh.name)
+                self.assert_matches_rebuild(incremental)
+        with self.assertRaises(ValueError):
+            incremental.add_mesh(removed[0])
+
+    def test_given_scene_is_not_changed(self):
+        pipeline = ScenePipeline(min_distance=MIN_DISTANCE,
+                                 contact_mode=self.contact_mode)
+        scene = pipeline.analyse(OBJ_FILE_PATH)
+        expected = self.rebuild()
+        incremental = IncrementalScene(scene, MIN_DISTANCE, self.contact_mode)
+        name = list(scene)[2]
+        incremental.move_mesh(name, [40, 0, 0])
+        incremental.remove_mesh(list(scene)[3])
+        self.assertNotEqual(analysis(incremental.scene), expected)
+        self.assertIs(pipeline.analyse(OBJ_FILE_PATH), scene)
+        self.assertEqual(analysis(scene), expected)
+
+
+@unittest.skipIf(triangle_col_detect is None,
+                 'the C libraries are not built, run make')
+class TestIncrementalSceneExact(TestIncrementalScene):
+
+    contact_mode = 'exact'
+
+
+if __name__ == '__main__':
+    unittest.main()
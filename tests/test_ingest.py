@@ -0,0 +1,95 @@
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import analogy.file_parsers as file_parsers
+from analogy import ingest
+from analogy.collision_detection import scene_collision
+from tests.test_file_parsers import REPO_DIR
+from tests.test_scene_collision import MIN_DISTANCE
+from tests.test_scene_collision import collided_sides
+
+SCENES = ('box-corner', 'cans-shelf-2')
+
+
+class TestIngestScenes(unittest.TestCase):
+
+    def setUp(self):
+        self.obj_file_paths = [
+            os.path.join(REPO_DIR, 'scenes', name + '.obj') for name in SCENES
+        ]
+        self.expected = []
+        for obj_file_path in self.obj_file_paths:
+            scene = file_parsers.read_obj_file(obj_file_path)
+            scene_collision.analyse_scene(scene, MIN_DISTANCE)
+            self.expected.append(collided_sides(scene))
+
+    def assert_results(self, results, cached):
+        self.assertEqual([result.obj_file_path for result in results],
+                         self.obj_file_paths)
+        for result, expected in zip(results, self.expected):
+            self.assertIsNone(result.error)
+            self.assertEqual(result.cached, cached)
+            self.assertEqual(result.n_meshes, len(expected))
+            self.assertEqual(collided_sides(result.scene), expected)
+
+    def test_process_pool_matches_serial_analysis(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            results = ingest.ingest_scenes(self.obj_file_paths,
+                                           MIN_DISTANCE,
+                                           workers=2,
+                                           cache_dir=cache_dir)
+            self.assert_results(results, cached=False)
+            # the second ingestion loads the scenes from the cache
+            results = ingest.ingest_scenes(self.obj_file_paths,
+                                           MIN_DISTANCE,
+                                           workers=2,
+                                           cache_dir=cache_dir)
+            self.assert_results(results, cached=True)
+            self.assertTrue(
+                all(result.parse_time == 0 for result in results))
+
+    def test_process_pool_with_default_min_distance(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            scenes_dir = os.path.join(tmp_dir, 'scenes')
+            os.mkdir(scenes_dir)
+            for name in SCENES:
+                for extension in ('.obj', '.mtl'):
+                    shutil.copy(
+                        os.path.join(REPO_DIR, 'scenes', name + extension),
+                        scenes_dir)
+            with open(os.path.join(scenes_dir, 'broken.obj'), 'w') as f:
+                f.write('o broken\nf 1 2 3\n')
+            pool = mock.Mock(wraps=concurrent.futures.ProcessPoolExecutor)
+            with mock.patch.object(concurrent.futures, 'ProcessPoolExecutor',
+                                   pool):
+                results = ingest.ingest_scenes([scenes_dir],
+                                               workers=3,
+                                               cache_dir=os.path.join(
+                                                   tmp_dir, 'cache'))
+            pool.assert_called_once_with(3)
+            # the directory is expanded to its sorted .obj files
+            self.assertEqual(
+                [os.path.basename(result.obj_file_path) for result in results],
+                ['box-corner.obj', 'broken.obj', 'cans-shelf-2.obj'])
+            # an error of one file is reported and the others are ingested
+            self.assertTrue(results[1].error.startswith('ValueError'))
+            self.assertIsNone(results[1].scene)
+            for result, expected in zip(results[::2], self.expected):
+                self.assertIsNone(result.error)
+                self.assertEqual(collided_sides(result.scene), expected)
+
+    def test_without_cache(self):
+        results = ingest.ingest_scenes(self.obj_file_paths,
+                                       MIN_DISTANCE,
+                                       workers=2,
+                                       cache_dir=None)
+        self.assert_results(results, cached=False)
+        self.assertTrue(all(result.entry_path is None for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from analogy import retrieval
+from analogy.retrieval import TOP_SEQUENCES
+from analogy.retrieval import TopKSearch
+from analogy.mapping import SCORE_CHUNK_SIZE
+from analogy.mapping import SIDES
+from analogy.mapping import Mapping
+from analogy.mapping import sides_codes
+from analogy.mesh import AABB
+from analogy.scene_analysis import ScenePipeline
+from analogy.storage import ratio_index
+from analogy.storage import sqlitedb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Scores of all 24 mappings of each mesh of a few bundled scenes against
+# each AABB of all_scenes.db computed by the original implementation (the
+# baseline commit), and the manipulation points and vectors it transferred
+# from the best AABB. Scores are in the order of Mapping.permutations_tuple.
+GOLDEN_MAPPINGS = os.path.join(REPO_DIR, 'tests', 'data', 'mappings.json')
+# Scores of the golden data are rounded to 9 decimal places.
+SCORE_TOLERANCE = 1e-8
+OPERATIONS = ('push', 'pull', 'spatula')
+
+
+def load_golden_mappings():
+    with open(GOLDEN_MAPPINGS) as f:
+        return json.load(f)
+
+
+def golden_targets():
+    """
+    Yields (scene path, mesh name, target AABB, golden data) of the golden
+    data. The scenes are analysed by the same pipeline as solve uses.
+    """
+    pipeline = ScenePipeline()
+    for path, meshes in sorted(load_golden_mappings().items()):
+        scene = pipeline.analyse(os.path.join(REPO_DIR, path))
+        for name, golden in sorted(meshes.items()):
+            yield path, name, scene[name].aabb, golden
+
+
+def load_aabbs(db):
+    """Rebuilds AABBs of the KB the same way as solve does."""
+    aabbs = {}
+    for db_aabb in db.select_all_aabbs():
+        pos = db.select_position_id(db_aabb[2])
+        aabb = AABB([pos[1], pos[2], pos[3]],
+                    [db_aabb[9], db_aabb[10], db_aabb[11]])
+        for i, side in enumerate(SIDES):
+            aabb.collided_sides[side] = db_aabb[12 + i]
+        for i, (select_point, select_vec) in enumerate(
+            ((db.select_push_point_id, db.select_push_vec_id),
+             (db.select_pull_point_id, db.select_pull_vec_id),
+             (db.select_spatula_point_id, db.select_spatula_vec_id))):
+            point = db.select_position_id(
+                int(select_point(int(db_aabb[3 + 2 * i]))[1]))
+            vec = select_vec(int(db_aabb[4 + 2 * i]))
+            if point[1] is not None:
+                aabb.manipulation_points[OPERATIONS[i]] = [
+                    float(p) for p in point[1:4]
+                ]
+                aabb.manipulation_vectors[OPERATIONS[i]] = [
+                    int(v) for v in vec[1:4]
+                ]
+            else:
+                aabb.manipulation_points[OPERATIONS[i]] = None
+                aabb.manipulation_vectors[OPERATIONS[i]] = None
+        aabbs[db_aabb[0]] = aabb
+    return aabbs
+
+
+class KBTestCase(unittest.TestCase):
+    """Copy of all_scenes.db updated to the current tables."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.kb_db_name = os.path.join(cls.tmp_dir.name, 'kb.db')
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), cls.kb_db_name)
+        cls.db = sqlitedb.sqlitedb(cls.kb_db_name)
+        cls.db.create_db()
+        cls.columns = cls.db.select_aabb_columns()
+        cls.aabbs = sqlitedb.aabbs_from_columns(cls.columns)
+        cls.mapping = Mapping()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.conn.close()
+        cls.tmp_dir.cleanup()
+
+    def golden_scores(self, golden):
+        return {
+            int(aabb_id): np.array(scores)
+            for aabb_id, scores in golden['scores'].items()
+        }
+
+
+class TestScores(KBTestCase):
+
+    def test_scores_matrix_matches_baseline(self):
+        ids = self.columns['id'].tolist()
+        for path, name, target_aabb, golden in golden_targets():
+            scores = self.golden_scores(golden)
+            for chunk_size in (1, 5, SCORE_CHUNK_SIZE):
+                with self.subTest(scene=path, mesh=name,
+                                  chunk_size=chunk_size):
+                    matrix = self.mapping.get_scores_matrix(
+                        target_aabb, self.columns['collided_sides'],
+                        self.columns['half_size'], chunk_size)
+                    np.testing.assert_allclose(
+                        matrix, [scores[aabb_id] for aabb_id in ids],
+                        rtol=0,
+                        atol=SCORE_TOLERANCE)
+
+    def test_mappings_score_matches_baseline(self):
+        for path, name, target_aabb, golden in golden_targets():
+            with self.subTest(scene=path, mesh=name):
+                scores = self.golden_scores(golden)
+                self.assertEqual(sorted(scores), sorted(self.aabbs))
+                for aabb_id, aabb_scores in scores.items():
+                    result = self.mapping.get_mappings_score(
+                        target_aabb, self.aabbs[aabb_id])
+                    self.assertEqual([sequence for _, sequence in result],
+                                     list(self.mapping.permutations_tuple))
+                    np.testing.assert_allclose([score for score, _ in result],
+                                               aabb_scores,
+                                               rtol=0,
+                                               atol=SCORE_TOLERANCE)
+
+
+class TestFindBestAABBs(KBTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = ratio_index.update_index(cls.db)
+
+    def assert_top_k_matches_baseline(self, result, golden, n_aabbs,
+                                      n_sequences):
+        # equal scores may be ordered differently than by the baseline, so
+        # each returned score is checked against the scores of its AABB
+        # and sequence
+        scores = self.golden_scores(golden)
+        best = sorted((score.max() for score in scores.values()),
+                      reverse=True)[:n_aabbs]
+        self.assertEqual(len(result), len(best))
+        self.assertEqual(len({aabb_id for aabb_id, _, _ in result}),
+                         len(result))
+        np.testing.assert_allclose([top for _, top, _ in result],
+                                   best,
+                                   rtol=0,
+                                   atol=SCORE_TOLERANCE)
+        for aabb_id, top, sequences in result:
+            aabb_scores = scores[aabb_id]
+            self.assertAlmostEqual(top,
+                                   aabb_scores.max(),
+                                   delta=SCORE_TOLERANCE)
+            np.testing.assert_allclose(
+                [score for score, _ in sequences],
+                np.sort(aabb_scores)[::-1][:n_sequences],
+                rtol=0,
+                atol=SCORE_TOLERANCE)
+            for score, sequence in sequences:
+                j = self.mapping.permutations_tuple.index(sequence)
+                self.assertAlmostEqual(score,
+                                       aabb_scores[j],
+                                       delta=SCORE_TOLERANCE)
+
+    def test_search_matches_baseline(self):
+        for path, name, target_aabb, golden in golden_targets():
+            for n_aabbs in (1, retrieval.TOP_AABBS):
+                with self.subTest(scene=path, mesh=name, n_aabbs=n_aabbs):
+                    result, stats = retrieval.find_best_aabbs(
+                        self.db, target_aabb, n_aabbs, mapping=self.mapping)
+                    self.assertEqual(stats['rows'], len(self.columns['id']))
+                    self.assert_top_k_matches_baseline(
+                        result, golden, n_aabbs, retrieval.TOP_SEQUENCES)
+
+    def test_indexed_search_matches_baseline(self):
+        for path, name, target_aabb, golden in golden_targets():
+            for n_aabbs in (1, retrieval.TOP_AABBS):
+                with self.subTest(scene=path, mesh=name, n_aabbs=n_aabbs):
+                    result, _ = retrieval.find_best_aabbs(
+                        self.db,
+                        target_aabb,
+                        n_aabbs,
+                        mapping=self.mapping,
+                        index=self.index)
+                    self.assert_top_k_matches_baseline(
+                        result, golden, n_aabbs, retrieval.TOP_SEQUENCES)
+
+
+class TestTopKSearch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(19)
+        self.mapping = Mapping()
+        n = 600
+        self.ids = rng.permutation(np.arange(1, n + 1)).tolist()
+        self.sides = rng.integers(0, 3, (n, 6))
+        self.half_sizes = rng.uniform(1, 50, (n, 3))
+        # copies of AABBs with other ids score exactly the same
+        self.sides[n // 2:] = self.sides[:n // 2]
+        self.half_sizes[n // 2:] = self.half_sizes[:n // 2]
+        self.target_aabb = AABB([0, 0, 0], [10, 20, 5])
+        self.target_aabb.collided_sides.update(
+            dict(zip(SIDES, [2, 0, 1, 0, 0, 2])))
+
+    def buckets(self, n_buckets):
+        # buckets with bounds of their best AABB
+        scores = self.mapping.get_scores_matrix(self.target_aabb, self.sides,
+                                                self.half_sizes)
+        buckets = []
+        for rows in np.array_split(np.arange(len(self.ids)), n_buckets):
+            bound = scores[rows].max() if len(rows) else -np.inf
+
+            def load(rows=rows):
+                return ([self.ids[i] for i in rows.tolist()],
+                        self.sides[rows], self.half_sizes[rows])
+
+            buckets.append((bound, len(rows), load))
+        return buckets
+
+    def brute_force(self, k, n_sequences):
+        scores = self.mapping.get_scores_matrix(self.target_aabb, self.sides,
+                                                self.half_sizes)
+        top = scores.max(axis=1)
+        order = sorted(range(len(self.ids)),
+                       key=lambda i: (-top[i], self.ids[i]))[:k]
+        return [(self.ids[i], top[i],
+                 np.sort(scores[i])[::-1][:n_sequences].tolist())
+                for i in order]
+
+    def test_search_matches_brute_force(self):
+        for k in (0, 1, 10, 700):
+            for n_buckets in (1, 7):
+                with self.subTest(k=k, n_buckets=n_buckets):
+                    search = TopKSearch(self.mapping, self.target_aabb, k)
+                    result = search.search(self.buckets(n_buckets))
+                    expected = self.brute_force(k, TOP_SEQUENCES)
+                    self.assertEqual([item[0] for item in result],
+                                     [item[0] for item in expected])
+                    for (_, top, sequences), (_, expected_top,
+                                              expected_scores) in zip(
+                                                  result, expected):
+                        self.assertEqual(top, expected_top)
+                        self.assertEqual([score for score, _ in sequences],
+                                         expected_scores)
+                    self.assertEqual(search.stats['rows'],
+                                     len(self.ids) if k else 0)
+                    self.assertEqual(
+                        search.stats['scored_rows'] +
+                        search.stats['pruned_rows'], search.stats['rows'])
+
+    def test_small_k_prunes_rows(self):
+        search = TopKSearch(self.mapping, self.target_aabb, 1)
+        search.search(self.buckets(7))
+        self.assertGreater(search.stats['prune_rate'], 0)
+
+
+class TestSignatures(unittest.TestCase):
+
+    def test_rotations_have_the_same_signature(self):
+        mapping = Mapping()
+        sides = np.array(list(itertools.product(range(3), repeat=6)))
+        signatures, rotations = mapping.get_canonical_signatures(sides)
+        for permutation in mapping.side_permutations:
+            np.testing.assert_array_equal(
+                mapping.get_canonical_signatures(sides[:, permutation])[0],
+                signatures)
+        # the rotation maps the collided sides to the signature
+        rotated = sides[np.arange(len(sides))[:, np.newaxis],
+                        mapping.side_permutations[rotations]]
+        np.testing.assert_array_equal(sides_codes(rotated), signatures)
+        self.assertLess(len(set(signatures.tolist())), 100)
+
+
+class TestRatioIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kb_db_name = os.path.join(self.tmp_dir.name, 'kb.db')
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), self.kb_db_name)
+        self.db = sqlitedb.sqlitedb(self.kb_db_name)
+        self.db.create_db()
+
+    def tearDown(self):
+        self.db.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_index_is_rebuilt_when_aabbs_change(self):
+        self.assertIsNone(ratio_index.load_index(self.db))
+        index = ratio_index.update_index(self.db)
+        self.assertEqual(index.ids.tolist(), sorted(load_aabbs(self.db)))
+        loaded = ratio_index.load_index(self.db)
+        np.testing.assert_array_equal(loaded.ids, index.ids)
+        np.testing.assert_array_equal(loaded.half_sizes, index.half_sizes)
+        self.db.cursor.execute('DELETE FROM TargetAABB WHERE ID = 18')
+        self.db.conn.commit()
+        # a stale index is not used
+        self.assertIsNone(ratio_index.load_index(self.db))
+        self.assertEqual(
+            ratio_index.update_index(self.db).ids.tolist(),
+            list(range(1, 18)))
+
+    def test_index_is_rebuilt_when_aabbs_are_replaced(self):
+        ratio_index.update_index(self.db)
+        # a changed AABB keeps the number of rows and the highest ID
+        self.db.cursor.execute('''UPDATE TargetAABB SET HalfSizeX = 100
+            WHERE ID = 5''')
+        self.db.conn.commit()
+        self.assertIsNone(ratio_index.load_index(self.db))
+        index = ratio_index.update_index(self.db)
+        self.assertEqual(index.half_sizes[index.ids.tolist().index(5)][0],
+                         100)
+        # so does a new AABB that gets the ID of the deleted one
+        row = self.db.select_aabb_id(18)
+        self.db.cursor.execute('DELETE FROM TargetAABB WHERE ID = 18')
+        self.db.cursor.execute(
+            'INSERT INTO TargetAABB VALUES (' + ','.join('?' * len(row)) +
+            ')', row[:9] + (1,) + row[10:])
+        self.db.conn.commit()
+        self.assertEqual(self.db.select_aabb_id(18)[9], 1)
+        self.assertIsNone(ratio_index.load_index(self.db))
+        ratio_index.update_index(self.db)
+        self.assertIsNotNone(ratio_index.load_index(self.db))
+
+    def test_index_is_only_loaded_at_solve(self):
+        db = sqlitedb.sqlitedb(self.kb_db_name, read_only=True)
+        self.assertIsNone(ratio_index.load_index(db))
+        self.assertFalse(
+            os.path.isfile(ratio_index.index_path(self.kb_db_name)))
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import scene_collision
+from analogy.scene_analysis import MIN_DISTANCE
+from analogy.scene_analysis import ScenePipeline
+from tests.test_file_parsers import REPO_DIR
+from tests.test_file_parsers import closest_surface_indices
+from tests.test_file_parsers import load_golden_scenes
+from tests.test_incremental_scene import analysis
+from tests.test_scene_collision import contact_lists
+from tests.test_triangle_col_detect import triangle_col_detect
+
+
+class TestScenePipeline(unittest.TestCase):
+
+    def contact_modes(self):
+        if triangle_col_detect is None:
+            return scene_collision.CONTACT_MODES[:1]
+        return scene_collision.CONTACT_MODES
+
+    def test_analyse_matches_analyse_scene(self):
+        for contact_mode in self.contact_modes():
+            pipeline = ScenePipeline(contact_mode=contact_mode)
+            for path in load_golden_scenes():
+                with self.subTest(scene=path, contact_mode=contact_mode):
+                    obj_file_path = os.path.join(REPO_DIR, path)
+                    scene = file_parsers.read_obj_file(obj_file_path)
+                    scene_collision.analyse_scene(scene, MIN_DISTANCE,
+                                                  contact_mode)
+                    expected = analysis(scene)
+                    self.assertEqual(analysis(pipeline.analyse(obj_file_path)),
+                                     expected)
+                    self.assertEqual(
+                        pipeline.classify(obj_file_path), {
+                            name: sides['collided_sides']
+                            for name, sides in expected.items()
+                        })
+
+    def test_narrow_phase_matches_detection(self):
+        detections = {
+            'centroid': scene_collision.detect_collisions,
+            'exact': scene_collision.detect_contacts,
+        }
+        for contact_mode in self.contact_modes():
+            pipeline = ScenePipeline(contact_mode=contact_mode)
+            for path in ('scenes/cans-shelf-4.obj', 'scenes/box-corner.obj'):
+                with self.subTest(scene=path, contact_mode=contact_mode):
+                    obj_file_path = os.path.join(REPO_DIR, path)
+                    scene = file_parsers.read_obj_file(obj_file_path)
+                    expected = detections[contact_mode](scene, MIN_DISTANCE)
+                    self.assertTrue(expected)
+                    self.assertEqual(
+                        contact_lists(pipeline.narrow_phase(obj_file_path)),
+                        contact_lists(expected))
+
+    def test_sweep_matches_analyse_scene(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'cans-shelf-2.obj')
+        min_distances = [0, 1, MIN_DISTANCE, 10]
+        for contact_mode in self.contact_modes():
+            sweep = ScenePipeline(contact_mode=contact_mode).sweep(
+                obj_file_path, min_distances)
+            self.assertEqual(sorted(sweep), min_distances)
+            for min_distance in min_distances:
+                with self.subTest(contact_mode=contact_mode,
+                                  min_distance=min_distance):
+                    scene = file_parsers.read_obj_file(obj_file_path)
+                    scene_collision.analyse_scene(scene, min_distance,
+                                                  contact_mode)
+                    self.assertEqual(
+                        sweep[min_distance], {
+                            name: dict(mesh.aabb.collided_sides)
+                            for name, mesh in scene.items()
+                        })
+
+    def test_stages_are_reused(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'books-shelf.obj')
+        pipeline = ScenePipeline()
+        scene = pipeline.analyse(obj_file_path)
+        self.assertIs(pipeline.analyse(obj_file_path), scene)
+        self.assertIs(pipeline.parse(obj_file_path), scene)
+        pipeline.clear()
+        self.assertIsNot(pipeline.analyse(obj_file_path), scene)
+        with self.assertRaises(ValueError):
+            ScenePipeline(contact_mode='vertex')
+
+    def test_pipeline_and_cache_match_baseline(self):
+        golden = load_golden_scenes()
+        paths = ['scenes/books-shelf.obj', 'scenes/cans-shelf-4.obj',
+                 'scenes/pizza-boxes-freezer.obj']
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for path in paths:
+                with self.subTest(scene=path):
+                    obj_file_path = os.path.join(REPO_DIR, path)
+                    # the first pipeline stores the scene, the second one
+                    # loads it from the cache
+                    for _ in range(2):
+                        pipeline = ScenePipeline(cache_dir=cache_dir)
+                        scene = pipeline.analyse(obj_file_path)
+                        for name, mesh in golden[path].items():
+                            self.assertEqual(
+                                dict(scene[name].aabb.collided_sides),
+                                mesh['collided_sides'], name)
+                            self.assertEqual(
+                                closest_surface_indices(scene[name]),
+                                mesh['closest_surfaces'], name)
+
+    def test_cached_scene_matches_analysed_scene(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'cans-shelf-4.obj')
+        expected = analysis(ScenePipeline().analyse(obj_file_path))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # the first pipeline stores the scene, the second one loads it
+            for _ in range(2):
+                pipeline = ScenePipeline(cache_dir=cache_dir)
+                self.assertEqual(analysis(pipeline.analyse(obj_file_path)),
+                                 expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
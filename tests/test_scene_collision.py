@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import analogy.collision_detection.aabb_collision as aabb_col
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import scene_collision
+from analogy.storage.scene_cache import SceneCache
+from tests.test_file_parsers import REPO_DIR
+from tests.test_file_parsers import closest_surface_indices
+from tests.test_file_parsers import load_golden_scenes
+
+MIN_DISTANCE = 3
+
+
+def collided_sides(scene):
+    return {name: dict(mesh.aabb.collided_sides)
+            for name, mesh in scene.items()}
+
+
+def contact_lists(contacts):
+    return {pair: np.asarray(hits).tolist() for pair, hits in contacts.items()}
+
+
+class TestAnalyseScene(unittest.TestCase):
+
+    def test_analyse_scene_matches_baseline(self):
+        for path, meshes in load_golden_scenes().items():
+            with self.subTest(scene=path):
+                scene = file_parsers.read_obj_file(
+                    os.path.join(REPO_DIR, path))
+                scene_collision.analyse_scene(scene, MIN_DISTANCE)
+                for name, golden in meshes.items():
+                    self.assertEqual(dict(scene[name].aabb.collided_sides),
+                                     golden['collided_sides'], name)
+                    self.assertEqual(closest_surface_indices(scene[name]),
+                                     golden['closest_surfaces'], name)
+
+    def brute_force_contacts(self, scene, pairs):
+        # colliders of each mesh of each pair against AABB of the other one
+        contacts = {}
+        meshes = list(scene.values())
+        for i, j in pairs:
+            for mesh, other in ((meshes[i], meshes[j]),
+                                (meshes[j], meshes[i])):
+                hits = np.flatnonzero(
+                    aabb_col.aabb_intersect_vertices(
+                        other.aabb.pos, other.aabb.half_size,
+                        scene_collision.mesh_colliders(mesh), MIN_DISTANCE))
+                if len(hits):
+                    contacts[(mesh.name, other.name)] = hits.tolist()
+        return contacts
+
+    def test_collision_contacts_match_brute_force(self):
+        for path in ('scenes/cans-shelf-4.obj', 'scenes/box-corner.obj',
+                     'scenes/pizza-boxes-freezer.obj'):
+            with self.subTest(scene=path):
+                scene = file_parsers.read_obj_file(
+                    os.path.join(REPO_DIR, path))
+                all_pairs = [(i, j) for i in range(len(scene))
+                             for j in range(i + 1, len(scene))]
+                expected = self.brute_force_contacts(scene, all_pairs)
+                self.assertTrue(expected)
+                self.assertEqual(
+                    contact_lists(
+                        scene_collision.collision_contacts(
+                            scene, MIN_DISTANCE)), expected)
+                # only the given pairs are checked
+                pairs = all_pairs[::3]
+                self.assertEqual(
+                    contact_lists(
+                        scene_collision.collision_contacts(
+                            scene, MIN_DISTANCE, pairs)),
+                    self.brute_force_contacts(scene, pairs))
+                # detect_collisions marks the contacts it returns
+                contacts = scene_collision.detect_collisions(
+                    scene, MIN_DISTANCE)
+                self.assertEqual(contact_lists(contacts), expected)
+                for (name, other), hits in expected.items():
+                    for k in hits:
+                        surface = scene[name].surfaces[k]
+                        self.assertTrue(surface.collision)
+                        self.assertIn(other, surface.collided_objects)
+                self.assertEqual(
+                    sum(surface.collision for mesh in scene.values()
+                        for surface in mesh.surfaces),
+                    len({(name, k) for (name, _), hits in expected.items()
+                         for k in hits}))
+
+
+class TestSceneCache(unittest.TestCase):
+
+    def test_cached_scene_matches_analysed_scene(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'cans-shelf-4.obj')
+        expected = file_parsers.read_obj_file(obj_file_path)
+        scene_collision.analyse_scene(expected, MIN_DISTANCE)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SceneCache(cache_dir)
+            self.assertIsNone(cache.load(obj_file_path, MIN_DISTANCE))
+            cache.get(obj_file_path, MIN_DISTANCE)
+            # a new cache instance loads the stored entry
+            scene = SceneCache(cache_dir).load(obj_file_path, MIN_DISTANCE)
+            self.assertIsNotNone(scene)
+            self.assertEqual(list(scene), list(expected))
+            self.assertEqual(collided_sides(scene), collided_sides(expected))
+            for name, mesh in expected.items():
+                cached = scene[name]
+                self.assertEqual(cached.aabb.pos, mesh.aabb.pos)
+                self.assertEqual(cached.aabb.half_size, mesh.aabb.half_size)
+                self.assertEqual(closest_surface_indices(cached),
+                                 closest_surface_indices(mesh))
+                self.assertEqual(cached.collided_objects,
+                                 mesh.collided_objects)
+            self.assertIsNone(cache.load(obj_file_path, MIN_DISTANCE + 1))
+
+    def test_changed_file_gets_new_entry(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            obj_file_path = os.path.join(tmp_dir, 'scene.obj')
+            for extension in ('.obj', '.mtl'):
+                shutil.copy(
+                    os.path.join(REPO_DIR, 'scenes', 'box-corner' + extension),
+                    os.path.join(tmp_dir, 'scene' + extension))
+            cache = SceneCache(os.path.join(tmp_dir, 'cache'))
+            entry_path = cache.store(
+                obj_file_path, MIN_DISTANCE,
+                cache.get(obj_file_path, MIN_DISTANCE))
+            with open(obj_file_path, 'a') as f:
+                f.write('\n')
+            self.assertIsNone(cache.load(obj_file_path, MIN_DISTANCE))
+            self.assertFalse(os.path.isdir(entry_path))
+
+    def test_entries_of_many_caches_are_kept_and_removed(self):
+        # each cache stands for a worker process sharing the directory
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            obj_file_path = os.path.join(tmp_dir, 'scene.obj')
+            for extension in ('.obj', '.mtl'):
+                shutil.copy(
+                    os.path.join(REPO_DIR, 'scenes', 'box-corner' + extension),
+                    os.path.join(tmp_dir, 'scene' + extension))
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            min_distances = [0, 1, MIN_DISTANCE]
+            entry_paths = []
+            for min_distance in min_distances:
+                cache = SceneCache(cache_dir)
+                entry_paths.append(
+                    cache.store(obj_file_path, min_distance,
+                                cache.get(obj_file_path, min_distance)))
+            cache = SceneCache(cache_dir)
+            for min_distance in min_distances:
+                self.assertIsNotNone(cache.load(obj_file_path, min_distance))
+            with open(obj_file_path, 'a') as f:
+                f.write('\n')
+            self.assertIsNone(cache.load(obj_file_path, MIN_DISTANCE))
+            self.assertFalse(any(os.path.isdir(entry_path)
+                                 for entry_path in entry_paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+import numpy as np
+
+from analogy.collision_detection.spatial_hash import AABBHash
+from analogy.collision_detection.spatial_hash import SpatialHash
+from analogy.collision_detection.spatial_hash import default_cell_size
+
+
+def inside(points, lower, upper):
+    return np.flatnonzero(
+        np.all((points >= lower) & (points <= upper), axis=1))
+
+
+class TestSpatialHash(unittest.TestCase):
+
+    def assert_query(self, grid, lower, upper):
+        result = grid.query(lower, upper)
+        self.assertEqual(result.tolist(), sorted(set(result.tolist())))
+        # every point in the box is found, and only points of the cells that
+        # overlap the box are returned
+        self.assertTrue(
+            set(inside(grid.points, lower, upper).tolist()) <= set(
+                result.tolist()))
+        margin = grid.cell_size
+        self.assertTrue(
+            set(result.tolist()) <= set(
+                inside(grid.points,
+                       np.asarray(lower) - margin,
+                       np.asarray(upper) + margin).tolist()))
+
+    def test_query_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        # integer points lie on the cell borders
+        points = np.concatenate([
+            rng.uniform(-20, 20, (500, 3)),
+            rng.integers(-20, 20, (500, 3)).astype(np.float64),
+        ])
+        for cell_size in (0.5, 1, 2, 3.7, 100):
+            grid = SpatialHash(points, cell_size)
+            for _ in range(50):
+                corner = rng.integers(-25, 25, 3).astype(np.float64)
+                size = rng.integers(0, 15, 3) * rng.choice([0.5, 1])
+                with self.subTest(cell_size=cell_size, corner=corner):
+                    self.assert_query(grid, corner, corner + size)
+            # boxes outside the grid and covering the whole grid
+            self.assertEqual(len(grid.query([200] * 3, [300] * 3)), 0)
+            self.assertEqual(len(grid.query([-300] * 3, [-200] * 3)), 0)
+            self.assertEqual(
+                grid.query([-100] * 3, [100] * 3).tolist(),
+                list(range(len(points))))
+
+    def test_flat_and_empty_points(self):
+        rng = np.random.default_rng(8)
+        points = rng.uniform(0, 10, (200, 3))
+        points[:, 2] = 4
+        grid = SpatialHash(points, 1)
+        self.assert_query(grid, [2, 2, 4], [6, 6, 4])
+        self.assertEqual(len(grid.query([0, 0, 5], [10, 10, 6])), 0)
+        self.assertEqual(len(SpatialHash(np.zeros((0, 3)), 1).query(
+            [0] * 3, [1] * 3)), 0)
+        with self.assertRaises(ValueError):
+            SpatialHash(points, 0)
+
+    def test_default_cell_size(self):
+        self.assertEqual(default_cell_size(np.zeros((0, 3)), 3), 1.0)
+        # degenerate AABBs without min_distance still give a usable cell
+        self.assertEqual(default_cell_size(np.zeros((5, 3)), 0), 1.0)
+        self.assertEqual(default_cell_size([[1, 2, 3]], 2), 2.0)
+        points = np.random.default_rng(9).uniform(0, 1, (100, 3))
+        grid = SpatialHash(points, default_cell_size(np.zeros((5, 3)), 0))
+        self.assert_query(grid, [0.2] * 3, [0.6] * 3)
+
+
+class TestAABBHash(unittest.TestCase):
+
+    def random_box(self, rng):
+        lower = rng.uniform(-30, 30, 3)
+        # a few large boxes that are kept out of the grid
+        size = rng.uniform(0, 60 if rng.random() < 0.1 else 6, 3)
+        return lower, lower + size
+
+    def assert_query(self, grid, boxes, lower, upper):
+        result = grid.query(lower, upper)
+        expected = {
+            key for key, (box_lower, box_upper) in boxes.items()
+            if np.all(box_lower <= upper) and np.all(box_upper >= lower)
+        }
+        self.assertTrue(expected <= result)
+        self.assertTrue(result <= set(boxes))
+
+    def test_query_matches_brute_force(self):
+        rng = np.random.default_rng(10)
+        for cell_size in (0.5, 2, 10):
+            grid = AABBHash(cell_size, max_cells=64)
+            boxes = {}
+            for key in range(200):
+                boxes[key] = self.random_box(rng)
+                grid.insert(key, *boxes[key])
+            self.assertTrue(grid.large)
+            for step in range(300):
+                key = int(rng.integers(250))
+                if key in boxes and rng.random() < 0.3:
+                    grid.remove(key)
+                    del boxes[key]
+                else:
+                    # inserts new boxes and moves existing ones
+                    boxes[key] = self.random_box(rng)
+                    grid.insert(key, *boxes[key])
+                lower, upper = self.random_box(rng)
+                with self.subTest(cell_size=cell_size, step=step):
+                    self.assertEqual(len(grid), len(boxes))
+                    self.assert_query(grid, boxes, lower, upper)
+            # a point on a cell border and a box that covers all cells
+            self.assert_query(grid, boxes, [-10] * 3, [-10] * 3)
+            self.assertLess(len(grid.query([0] * 3, [1] * 3)), len(boxes))
+            self.assert_query(grid, boxes, [-500] * 3, [500] * 3)
+            for key in list(boxes):
+                grid.remove(key)
+            self.assertEqual((grid.cells, grid.large, len(grid)),
+                             ({}, set(), 0))
+        with self.assertRaises(ValueError):
+            AABBHash(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
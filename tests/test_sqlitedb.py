@@ -0,0 +1,328 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from analogy.scene_analysis import ScenePipeline
+from analogy.storage import sqlitedb
+from tests.test_retrieval import load_aabbs
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# TargetAABB rows with the values of their positions, points and vectors.
+# It only uses the tables of the first version, so it works before and after
+# the migration.
+RESOLVED_ROWS = '''SELECT TargetAABB.ID, FileName,
+    Position.X, Position.Y, Position.Z, HalfSizeX, HalfSizeY, HalfSizeZ,
+    CollidedTop, CollidedBottom, CollidedFront, CollidedBack, CollidedRight,
+    CollidedLeft,
+    PushPosition.X, PushPosition.Y, PushPosition.Z,
+    PushVector.VectorX, PushVector.VectorY, PushVector.VectorZ,
+    PullPosition.X, PullPosition.Y, PullPosition.Z,
+    PullVector.VectorX, PullVector.VectorY, PullVector.VectorZ,
+    SpatulaPosition.X, SpatulaPosition.Y, SpatulaPosition.Z,
+    SpatulaVector.VectorX, SpatulaVector.VectorY, SpatulaVector.VectorZ
+    FROM TargetAABB
+    JOIN Position ON Position.ID = TargetAABB.PositionID
+    JOIN PushPoint ON PushPoint.ID = TargetAABB.PushPointID
+    JOIN Position AS PushPosition ON PushPosition.ID = PushPoint.PositionID
+    JOIN PushVector ON PushVector.ID = TargetAABB.PushVectorID
+    JOIN PullPoint ON PullPoint.ID = TargetAABB.PullPointID
+    JOIN Position AS PullPosition ON PullPosition.ID = PullPoint.PositionID
+    JOIN PullVector ON PullVector.ID = TargetAABB.PullVectorID
+    JOIN SpatulaPoint ON SpatulaPoint.ID = TargetAABB.SpatulaPointID
+    JOIN Position AS SpatulaPosition
+        ON SpatulaPosition.ID = SpatulaPoint.PositionID
+    JOIN SpatulaVector ON SpatulaVector.ID = TargetAABB.SpatulaVectorID
+    ORDER BY TargetAABB.ID'''
+VIEW_ROWS = '''SELECT ID, FileName, X, Y, Z, HalfSizeX, HalfSizeY, HalfSizeZ,
+    CollidedTop, CollidedBottom, CollidedFront, CollidedBack, CollidedRight,
+    CollidedLeft, PushX, PushY, PushZ, PushVectorX, PushVectorY, PushVectorZ,
+    PullX, PullY, PullZ, PullVectorX, PullVectorY, PullVectorZ,
+    SpatulaX, SpatulaY, SpatulaZ, SpatulaVectorX, SpatulaVectorY,
+    SpatulaVectorZ FROM TargetAABBView ORDER BY ID'''
+
+
+def resolved_rows(db_name, query=RESOLVED_ROWS):
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute(query).fetchall()
+    conn.close()
+    return rows
+
+
+def schema_version(db_name):
+    conn = sqlite3.connect(db_name)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.close()
+    return version
+
+
+def table_counts(db):
+    counts = {}
+    for table, _ in sqlitedb.SAVE_TABLES:
+        db.cursor.execute('SELECT COUNT(*) FROM ' + table)
+        counts[table] = db.cursor.fetchone()[0]
+    return counts
+
+
+def load_targets(missing_points):
+    """
+    Returns (scene, scene name, target object) tuples of all meshes of a few
+    bundled scenes with manipulation points and vectors. Some points are
+    missing if missing_points is True, as in some AABBs of the KB.
+    """
+    pipeline = ScenePipeline()
+    targets = []
+    for scene_name in ('books-shelf', 'cans-shelf-2', 'box-corner'):
+        scene = pipeline.analyse(
+            os.path.join(REPO_DIR, 'scenes', scene_name + '.obj'))
+        for k, target_object in enumerate(scene.values()):
+            aabb = target_object.aabb
+            aabb.manipulation_points = {}
+            aabb.manipulation_vectors = {}
+            for j, operation in enumerate(sqlitedb.OPERATIONS):
+                if missing_points and (k + j) % 3 == 2:
+                    aabb.manipulation_points[operation] = [None] * 3
+                    aabb.manipulation_vectors[operation] = [None] * 3
+                else:
+                    point = list(aabb.pos)
+                    point[j] += aabb.half_size[j]
+                    vector = [0, 0, 0]
+                    vector[j] = -1
+                    aabb.manipulation_points[operation] = point
+                    aabb.manipulation_vectors[operation] = vector
+            targets.append((scene, scene_name, target_object))
+    return targets
+
+
+class TestMigrate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kb_db_name = os.path.join(self.tmp_dir.name, 'kb.db')
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), self.kb_db_name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def migrate(self):
+        db = sqlitedb.sqlitedb(self.kb_db_name)
+        db.create_db()
+        return db
+
+    def test_old_schema_is_migrated(self):
+        before = resolved_rows(self.kb_db_name)
+        self.assertEqual(schema_version(self.kb_db_name), 0)
+
+        db = self.migrate()
+        self.assertEqual(schema_version(self.kb_db_name),
+                         sqlitedb.SCHEMA_VERSION)
+        counts = table_counts(db)
+        self.assertEqual(resolved_rows(self.kb_db_name), before)
+        self.assertEqual(resolved_rows(self.kb_db_name, VIEW_ROWS), before)
+        db.cursor.execute('''SELECT COUNT(*) FROM TargetAABB WHERE
+            Signature IS NULL OR SignatureRotation IS NULL
+            OR ContentHash IS NULL''')
+        self.assertEqual(db.cursor.fetchone()[0], 0)
+        for table, _ in sqlitedb.UNIQUE_INDEXES:
+            db.cursor.execute('PRAGMA index_list(' + table + ')')
+            self.assertIn(table + 'Unique',
+                          [row[1] for row in db.cursor.fetchall()])
+        db.conn.close()
+
+        # the second migration does nothing
+        db = self.migrate()
+        self.assertEqual(table_counts(db), counts)
+        self.assertEqual(resolved_rows(self.kb_db_name), before)
+        db.conn.close()
+
+    def test_duplicates_are_merged(self):
+        conn = sqlite3.connect(self.kb_db_name)
+        # a copy of the first AABB with its own position and push point
+        # rows, and a second row of a missing point
+        conn.execute('''INSERT INTO Position (X, Y, Z)
+            SELECT X, Y, Z FROM Position WHERE ID = (
+                SELECT PositionID FROM TargetAABB WHERE ID = 1)''')
+        position_id = conn.execute(
+            'SELECT MAX(ID) FROM Position').fetchone()[0]
+        conn.execute('''INSERT INTO Position (X, Y, Z)
+            SELECT X, Y, Z FROM Position WHERE ID = (
+                SELECT PositionID FROM PushPoint WHERE ID = (
+                    SELECT PushPointID FROM TargetAABB WHERE ID = 1))''')
+        conn.execute('''INSERT INTO PushPoint (PositionID)
+            SELECT MAX(ID) FROM Position''')
+        push_point_id = conn.execute(
+            'SELECT MAX(ID) FROM PushPoint').fetchone()[0]
+        conn.execute(
+            'INSERT INTO Position (X, Y, Z) VALUES (NULL, NULL, NULL)')
+        conn.execute(
+            '''INSERT INTO TargetAABB (FileName, PositionID, PushPointID,
+            PushVectorID, PullPointID, PullVectorID, SpatulaPointID,
+            SpatulaVectorID, HalfSizeX, HalfSizeY, HalfSizeZ, CollidedTop,
+            CollidedBottom, CollidedFront, CollidedBack, CollidedRight,
+            CollidedLeft)
+            SELECT FileName, ?, ?, PushVectorID, PullPointID, PullVectorID,
+            SpatulaPointID, SpatulaVectorID, HalfSizeX, HalfSizeY, HalfSizeZ,
+            CollidedTop, CollidedBottom, CollidedFront, CollidedBack,
+            CollidedRight, CollidedLeft FROM TargetAABB WHERE ID = 1''',
+            (position_id, push_point_id))
+        conn.commit()
+        conn.close()
+        before = resolved_rows(self.kb_db_name)
+        self.assertEqual(before[-1][1:], before[0][1:])
+
+        db = self.migrate()
+        self.assertEqual(resolved_rows(self.kb_db_name), before[:-1])
+        for table, columns in sqlitedb.UNIQUE_INDEXES:
+            db.cursor.execute('SELECT COUNT(*), COUNT(DISTINCT ' +
+                              ' || \',\' || '.join('IFNULL(' + column +
+                                                   ', \'-\')'
+                                                   for column in columns) +
+                              ') FROM ' + table)
+            count, distinct = db.cursor.fetchone()
+            self.assertEqual(count, distinct, table)
+        db.conn.close()
+
+
+class TestView(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kb_db_name = os.path.join(self.tmp_dir.name, 'kb.db')
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), self.kb_db_name)
+        self.db = sqlitedb.sqlitedb(self.kb_db_name)
+        self.db.create_db()
+
+    def tearDown(self):
+        self.db.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_view_matches_joined_tables(self):
+        rows = resolved_rows(self.kb_db_name)
+        self.assertEqual(len(rows), 18)
+        self.assertEqual(resolved_rows(self.kb_db_name, VIEW_ROWS), rows)
+
+    def test_aabbs_from_columns_match_row_lookups(self):
+        aabbs = sqlitedb.aabbs_from_columns(self.db.select_aabb_columns())
+        expected = load_aabbs(self.db)
+        self.assertEqual(list(aabbs), sorted(expected))
+        for aabb_id, aabb in aabbs.items():
+            self.assertEqual(vars(aabb), vars(expected[aabb_id]), aabb_id)
+
+    def test_select_ids(self):
+        columns = self.db.select_aabb_columns()
+        ids = [17, 3, 9, 1, 18, 4]
+        with mock.patch.object(sqlitedb, 'SELECT_IDS_CHUNK_SIZE', 4):
+            selected = self.db.select_aabb_columns(ids)
+        rows = np.searchsorted(columns['id'], sorted(ids))
+        self.assertEqual(selected.keys(), columns.keys())
+        for name, values in columns.items():
+            np.testing.assert_array_equal(selected[name], values[rows], name)
+        self.assertEqual(len(self.db.select_aabb_columns([])['id']), 0)
+
+
+class TestSave(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # some AABBs of the KB miss some manipulation points
+        cls.scenes = load_targets(missing_points=True)
+
+    def setUp(self):
+        # scenes are pickled to ./scenes/pkl/
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        os.makedirs(os.path.join('scenes', 'pkl'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def new_db(self, name):
+        db = sqlitedb.sqlitedb(name)
+        db.create_db()
+        return db
+
+    def test_save_scenes_is_idempotent(self):
+        db = self.new_db('kb.db')
+        ids = db.save_scenes(self.scenes)
+        self.assertEqual(len(set(ids)), len(self.scenes))
+        counts = table_counts(db)
+        rows = resolved_rows('kb.db')
+        self.assertEqual(db.save_scenes(self.scenes), ids)
+        self.assertEqual(db.save_scenes(self.scenes[::-1]), ids[::-1])
+        self.assertEqual(
+            [db.save_scene(*scene) for scene in self.scenes], ids)
+        self.assertEqual(table_counts(db), counts)
+        self.assertEqual(resolved_rows('kb.db'), rows)
+        db.conn.close()
+
+    def test_save_scene_is_idempotent(self):
+        db = self.new_db('kb.db')
+        ids = [db.save_scene(*scene) for scene in self.scenes]
+        counts = table_counts(db)
+        self.assertEqual([db.save_scene(*scene) for scene in self.scenes], ids)
+        self.assertEqual(db.save_scenes(self.scenes), ids)
+        self.assertEqual(table_counts(db), counts)
+        db.conn.close()
+
+    def test_save_scene_and_save_scenes_agree(self):
+        db = self.new_db('one.db')
+        for scene in self.scenes:
+            db.save_scene(*scene)
+        db.conn.close()
+        db = self.new_db('batch.db')
+        db.save_scenes(self.scenes)
+        db.conn.close()
+        self.assertEqual(resolved_rows('one.db'), resolved_rows('batch.db'))
+        self.assertEqual(len(resolved_rows('one.db')), len(self.scenes))
+
+    def test_save_scenes_looks_up_only_the_batch(self):
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), 'kb.db')
+        db = self.new_db('kb.db')
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        # equal scenes in one batch are saved once
+        ids = db.save_scenes(self.scenes + self.scenes[:2])
+        db.conn.set_trace_callback(None)
+        self.assertEqual(ids[-2:], ids[:2])
+        self.assertEqual(len(set(ids)), len(self.scenes))
+        selects = [
+            statement for statement in statements
+            if statement.lstrip().upper().startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        for statement in selects:
+            self.assertIn('SaveRows', statement)
+        self.assertFalse(
+            [statement for statement in statements if 'MAX(' in statement])
+        db.conn.close()
+
+    def test_save_to_migrated_kb(self):
+        shutil.copy(os.path.join(REPO_DIR, 'all_scenes.db'), 'kb.db')
+        db = self.new_db('kb.db')
+        old_rows = resolved_rows('kb.db')
+        ids = db.save_scenes(self.scenes)
+        self.assertEqual(min(ids), len(old_rows) + 1)
+        counts = table_counts(db)
+        self.assertEqual(db.save_scenes(self.scenes), ids)
+        self.assertEqual(table_counts(db), counts)
+        self.assertEqual(resolved_rows('kb.db')[:len(old_rows)], old_rows)
+        db.conn.close()
+
+    def test_unique_indexes(self):
+        db = self.new_db('kb.db')
+        db.save_scenes(self.scenes[:1])
+        db.cursor.execute('SELECT X, Y, Z FROM Position LIMIT 1')
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.cursor.execute('INSERT INTO Position (X, Y, Z) VALUES (?,?,?)',
+                              db.cursor.fetchone())
+        db.conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from analogy import transfer
+from tests.test_retrieval import KBTestCase
+from tests.test_retrieval import golden_targets
+
+# Transferred points are rotated by vpython in the golden data.
+POINT_TOLERANCE = 1e-6
+
+
+class TestTransfer(KBTestCase):
+
+    def sequence(self, name):
+        # sequences are stored as strings in the golden data
+        for sequence in self.mapping.permutations_tuple:
+            if ''.join(sequence) == name:
+                return sequence
+        raise KeyError(name)
+
+    def test_rotation_matrices(self):
+        matrices = transfer.rotation_matrices(self.mapping.axis_permutations,
+                                              self.mapping.axis_signs)
+        self.assertEqual(len({m.tobytes() for m in matrices}), 24)
+        for matrix in matrices:
+            np.testing.assert_array_equal(matrix @ matrix.T, np.eye(3))
+            self.assertEqual(round(np.linalg.det(matrix)), 1)
+
+    def test_transfer_matches_baseline(self):
+        for path, name, target_aabb, golden in golden_targets():
+            with self.subTest(scene=path, mesh=name):
+                (points, vectors), = transfer.transfer_aabbs(
+                    self.mapping, target_aabb, [self.aabbs[golden['aabb_id']]],
+                    [self.sequence(golden['sequence'])])
+                for operation in transfer.OPERATIONS:
+                    for result, expected in ((points, golden['points']),
+                                             (vectors, golden['vectors'])):
+                        if expected[operation][0] is None:
+                            self.assertEqual(result[operation], [None] * 3)
+                        else:
+                            np.testing.assert_allclose(result[operation],
+                                                       expected[operation],
+                                                       rtol=0,
+                                                       atol=POINT_TOLERANCE)
+
+    def test_transfer_of_many_aabbs(self):
+        source_aabbs = list(self.aabbs.values())
+        _, _, target_aabb, _ = next(golden_targets())
+        sequences = [
+            self.mapping.permutations_tuple[i % 24]
+            for i in range(len(source_aabbs))
+        ]
+        results = transfer.transfer_aabbs(self.mapping, target_aabb,
+                                          source_aabbs, sequences)
+        for source_aabb, sequence, result in zip(source_aabbs, sequences,
+                                                 results):
+            self.assertEqual(
+                result,
+                transfer.transfer_aabbs(self.mapping, target_aabb,
+                                        [source_aabb], [sequence])[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import unittest
+
+import numpy as np
+
+import analogy.file_parsers as file_parsers
+from analogy.collision_detection import scene_collision
+from tests.test_scene_collision import MIN_DISTANCE
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(REPO_DIR, 'analogy', 'collision_detection', 'build')
+LIBRARIES = ('mollers_tri_tri.so', 'devillers_tri_tri.so')
+
+if all(os.path.isfile(os.path.join(BUILD_DIR, name)) for name in LIBRARIES):
+    from analogy.collision_detection import triangle_col_detect
+else:
+    triangle_col_detect = None
+
+
+def random_triangles(rng, n):
+    # small triangles in a unit cube, so about half of the pairs intersect
+    corners = rng.uniform(0, 1, (n, 1, 3))
+    return corners + rng.uniform(-0.3, 0.3, (n, 3, 3))
+
+
+@unittest.skipIf(triangle_col_detect is None,
+                 'the C libraries are not built, run make')
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.tris_1 = random_triangles(rng, 300)
+        self.tris_2 = random_triangles(rng, 200)
+        self.pairs = np.stack([
+            rng.integers(0, len(self.tris_1), 2000),
+            rng.integers(0, len(self.tris_2), 2000)
+        ], axis=1)
+        self.algorithms = (
+            (triangle_col_detect.mollers_alg,
+             triangle_col_detect.mollers_alg_batch, np.float32),
+            (triangle_col_detect.devillers_alg,
+             triangle_col_detect.devillers_alg_batch, np.float64),
+        )
+
+    def scalar(self, alg, dtype, pairs):
+        tris_1 = self.tris_1.astype(dtype).tolist()
+        tris_2 = self.tris_2.astype(dtype).tolist()
+        return np.array([bool(alg(tris_1[i], tris_2[j])) for i, j in pairs])
+
+    def test_batch_matches_scalar(self):
+        for alg, batch, dtype in self.algorithms:
+            with self.subTest(alg=alg.__name__):
+                expected = self.scalar(alg, dtype, self.pairs)
+                self.assertTrue(0 < expected.sum() < len(expected))
+                for threads in (1, 2, 4):
+                    np.testing.assert_array_equal(
+                        batch(self.tris_1, self.tris_2, self.pairs, threads),
+                        expected)
+
+    def test_batch_without_pairs(self):
+        for alg, batch, dtype in self.algorithms:
+            with self.subTest(alg=alg.__name__):
+                n = len(self.tris_2)
+                expected = self.scalar(alg, dtype,
+                                       [(i, i) for i in range(n)])
+                np.testing.assert_array_equal(
+                    batch(self.tris_1[:n], self.tris_2, threads=3), expected)
+
+    def test_early_exit_keeps_group_results(self):
+        groups = np.sort(np.random.default_rng(5).integers(0, 40, 2000))
+        for alg, batch, dtype in self.algorithms:
+            with self.subTest(alg=alg.__name__):
+                expected = batch(self.tris_1, self.tris_2, self.pairs)
+                for threads in (1, 4):
+                    result = batch(self.tris_1,
+                                   self.tris_2,
+                                   self.pairs,
+                                   threads,
+                                   groups=groups,
+                                   early_exit=True)
+                    # skipped pairs are False, so only hits are reported
+                    self.assertFalse((result & ~expected).any())
+                    for g in range(40):
+                        self.assertEqual(result[groups == g].any(),
+                                         expected[groups == g].any(), g)
+
+    def test_invalid_pairs(self):
+        with self.assertRaises(IndexError):
+            triangle_col_detect.devillers_alg_batch(self.tris_1, self.tris_2,
+                                                    [[0, len(self.tris_2)]])
+        with self.assertRaises(ValueError):
+            triangle_col_detect.devillers_alg_batch(self.tris_1, self.tris_2)
+
+
+@unittest.skipIf(triangle_col_detect is None,
+                 'the C libraries are not built, run make')
+class TestExactContacts(unittest.TestCase):
+
+    def brute_force(self, scene):
+        # every triangle of every mesh is tested with the scalar wrapper
+        collided = {name: set() for name in scene}
+        meshes = list(scene.items())
+        for k, (name_1, mesh_1) in enumerate(meshes):
+            triangles_1 = scene_collision.mesh_triangles(mesh_1).tolist()
+            for name_2, mesh_2 in meshes[k + 1:]:
+                triangles_2 = scene_collision.mesh_triangles(mesh_2).tolist()
+                for i, tri_1 in enumerate(triangles_1):
+                    for j, tri_2 in enumerate(triangles_2):
+                        if triangle_col_detect.devillers_alg(tri_1, tri_2):
+                            collided[name_1].add(i)
+                            collided[name_2].add(j)
+        return collided
+
+    def test_detect_contacts_matches_brute_force(self):
+        obj_file_path = os.path.join(REPO_DIR, 'scenes', 'box-corner.obj')
+        expected = self.brute_force(file_parsers.read_obj_file(obj_file_path))
+        self.assertTrue(any(expected.values()))
+        for threads in (1, 4):
+            scene = file_parsers.read_obj_file(obj_file_path)
+            scene_collision.detect_contacts(scene, MIN_DISTANCE, threads)
+            self.assertEqual(
+                {
+                    name: {
+                        i for i, surface in enumerate(mesh.surfaces)
+                        if surface.collision
+                    } for name, mesh in scene.items()
+                }, expected, threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from analogy import tuning
+from analogy.mapping import DEFAULT_WEIGHTS
+from analogy.mapping import SIDES
+from analogy.mapping import WEIGHT_NAMES
+from analogy.mapping import Mapping
+from analogy.mesh import AABB
+
+# Number of features of one entry.
+BLOCK_FEATURES = 24 * len(WEIGHT_NAMES)
+
+
+def random_aabbs(rng, n):
+    return rng.integers(0, 3, (n, 6)), rng.uniform(1, 50, (n, 3))
+
+
+def target_aabb(sides, half_size):
+    aabb = AABB([0, 0, 0], half_size.tolist())
+    aabb.collided_sides.update(dict(zip(SIDES, sides.tolist())))
+    return aabb
+
+
+class TestScoreFeatures(unittest.TestCase):
+
+    def test_features_give_the_scores(self):
+        rng = np.random.default_rng(21)
+        mapping = Mapping()
+        kb_sides, kb_half_sizes = random_aabbs(rng, 50)
+        query_sides, query_half_sizes = random_aabbs(rng, 5)
+        weights = np.concatenate([[DEFAULT_WEIGHTS],
+                                  rng.uniform(-2, 2, (5, len(WEIGHT_NAMES)))])
+        for q in range(len(query_sides)):
+            features = tuning.score_features(mapping, query_sides[q],
+                                             query_half_sizes[q], kb_sides,
+                                             kb_half_sizes)
+            self.assertEqual(features.shape,
+                             (len(kb_sides), 24, len(WEIGHT_NAMES)))
+            target = target_aabb(query_sides[q], query_half_sizes[q])
+            for weights_vector in weights:
+                with self.subTest(query=q, weights=weights_vector):
+                    np.testing.assert_allclose(
+                        1 + features @ weights_vector,
+                        Mapping(weights_vector).get_scores_matrix(
+                            target, kb_sides, kb_half_sizes),
+                        rtol=0,
+                        atol=1e-9)
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(22)
+        self.mapping = Mapping()
+        self.kb_sides, self.kb_half_sizes = random_aabbs(rng, 60)
+        # the second half are copies of the first half
+        self.kb_sides[30:] = self.kb_sides[:30]
+        self.kb_half_sizes[30:] = self.kb_half_sizes[:30]
+        self.query_sides = self.kb_sides[:20]
+        self.query_half_sizes = self.kb_half_sizes[:20] * rng.uniform(
+            0.8, 1.2, (20, 3))
+        self.weights = tuning.weight_grid({
+            'exact_collision': [0, 1, 3],
+            'xy_ratio': [0, 1],
+        })
+        self.labels = np.arange(60) % 30
+
+    def brute_force(self, exclude=None):
+        best = np.full((len(self.weights), len(self.query_sides)), -1)
+        for c, weights in enumerate(self.weights):
+            mapping = Mapping(weights)
+            for q in range(len(self.query_sides)):
+                scores = mapping.get_scores_matrix(
+                    target_aabb(self.query_sides[q], self.query_half_sizes[q]),
+                    self.kb_sides, self.kb_half_sizes).max(axis=1)
+                if exclude is not None:
+                    scores[exclude[q]] = -np.inf
+                if np.isfinite(scores).any():
+                    # equal scores are won by the lower index
+                    best[c, q] = np.flatnonzero(scores == scores.max())[0]
+        return best
+
+    def sweep(self, exclude=None):
+        relevant = tuning.relevant_labels(self.labels[:20], self.labels)
+        return tuning.sweep(self.query_sides, self.query_half_sizes,
+                            self.kb_sides, self.kb_half_sizes, relevant,
+                            self.weights, exclude, self.mapping)
+
+    def test_sweep_matches_brute_force(self):
+        # blocks of a few entries and blocks of all entries
+        for n_entries in (7, len(self.kb_sides)):
+            with self.subTest(n_entries=n_entries):
+                features = mock.Mock(wraps=tuning.score_features)
+                with mock.patch.object(tuning, 'score_features', features):
+                    with mock.patch.object(tuning, 'SWEEP_BLOCK_SIZE',
+                                           BLOCK_FEATURES * n_entries):
+                        accuracy, best = self.sweep()
+                # features of one block of entries at a time
+                self.assertEqual(
+                    max(len(call.args[3]) for call in features.call_args_list),
+                    n_entries)
+                np.testing.assert_array_equal(best, self.brute_force())
+                # copies tie with their originals, the original wins
+                self.assertTrue((best < 30).all())
+                np.testing.assert_array_equal(
+                    accuracy,
+                    (self.labels[best] == self.labels[:20]).mean(axis=1))
+
+    def test_exclude(self):
+        exclude = np.zeros((20, 60), dtype=bool)
+        exclude[:, :30] = True
+        exclude[5] = True
+        with mock.patch.object(tuning, 'SWEEP_BLOCK_SIZE',
+                               BLOCK_FEATURES * 7):
+            accuracy, best = self.sweep(exclude)
+        np.testing.assert_array_equal(best, self.brute_force(exclude))
+        self.assertTrue((best[:, 5] == -1).all())
+        self.assertTrue((np.delete(best, 5, axis=1) >= 30).all())
+        # an excluded query is a miss
+        self.assertTrue((accuracy <= 19 / 20).all())
+
+    def test_best_configurations(self):
+        accuracy = np.array([0.5, 0.9, 0.9, 0.1])
+        weights = np.tile(DEFAULT_WEIGHTS, (4, 1))
+        weights[:, 0] = [1, 2, 3, 4]
+        best = tuning.best_configurations(weights, accuracy, n=2)
+        self.assertEqual([score for score, _ in best], [0.9, 0.9])
+        self.assertEqual([w['exact_collision'] for _, w in best], [2, 3])
+        with self.assertRaises(ValueError):
+            tuning.weight_grid({'unknown': [1]})
+
+
+if __name__ == '__main__':
+    unittest.main()